@@ -0,0 +1,333 @@
+import json
+import os
+import time
+import zlib
+from contextlib import contextmanager
+from urllib.parse import parse_qsl
+from collection import Listing
+from compression import MIN_COMPRESS_SIZE, CompressedBodyCache, compress, negotiate_encoding
+from metrics import CONTENT_TYPE, METRICS_PATH, Metrics, RequestTimer
+import streaming
+from client_service import ClientService
+from tpp_service import TppService
+from services import CacheStorage
+from router import Router
+from search import SEARCH_FIELDS, SearchIndex
+from wal import WriteAheadLog
+
+WRITE_METHODS = ('POST', 'PATCH', 'DELETE')
+
+JSON_HEADERS = [("Content-Type", "application/json")]
+
+CORS_HEADERS = [
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Methods", "GET, POST, DELETE, PATCH, OPTIONS"),
+    ("Access-Control-Allow-Headers", "Content-Type, Authorization"),
+    ("Access-Control-Max-Age", "3600"),
+]
+
+
+class Response:
+    """HTTP response produced by the application, independent of the server engine."""
+
+    __slots__ = ('status', 'headers', 'body', 'error', 'chunks', 'route')
+
+    def __init__(self, status: int, body: bytes = b'', headers: list = None, error: str = None,
+                 chunks=None):
+        """
+        Initialize a response.
+
+        Args:
+            status: The HTTP status code
+            body: The encoded response body
+            headers: List of (name, value) header pairs, without Content-Length
+            error: The error message when the request failed
+            chunks: Iterator of body chunks for streamed responses, used instead of body
+        """
+        self.status = status
+        self.body = body
+        self.headers = headers if headers is not None else []
+        self.error = error
+        self.chunks = chunks
+        # Matched (route path, method) key, set when metrics are recorded
+        self.route = None
+
+
+class Application:
+    """Application state built once at startup and shared by every request handler."""
+
+    def __init__(self, cache_storage=CacheStorage, data_dir: str = None, database: str = None,
+                 columnar: bool = False, fragment_budget: int = None, metrics: bool = True):
+        """
+        Initialize an application that has not been started yet.
+
+        Args:
+            cache_storage: The cache storage backing all services
+            data_dir: Directory of the write-ahead log and snapshots; None keeps
+                all data in memory only
+            database: SQLite database file holding clients and TPPs instead of
+                the cache
+            columnar: Filter clients and TPPs in NumPy columns mirrored from
+                the cache (requires NumPy)
+            fragment_budget: Bytes of encoded records cached for list
+                responses; None keeps the cache storage's budget, 0 disables it
+            metrics: Record request metrics and serve them at METRICS_PATH
+        """
+        self.cache_storage = cache_storage
+        self.data_dir = data_dir
+        self.database = database
+        self.columnar = columnar
+        self.fragment_budget = fragment_budget
+        # Resources not stored in the cache, whose versions are unknown
+        self.unversioned_resources = set()
+        # Set by start() when writes are made durable
+        self.wal = None
+        self.search_index = None
+        self.router = None
+        self.startup_timings = {}
+        # Distinguishes ETags of this run from those of earlier runs with reset versions
+        self.instance_tag = os.urandom(4).hex()
+        self.compressed_bodies = CompressedBodyCache()
+        self.metrics = Metrics(cache_storage) if metrics else None
+        # Set in pre-fork workers to send writes to the owning process
+        self.write_forwarder = None
+
+    @contextmanager
+    def _timed(self, phase: str):
+        """Record the wall time of a startup phase in milliseconds."""
+        start = time.perf_counter()
+        yield
+        self.startup_timings[phase] = (time.perf_counter() - start) * 1000
+
+    def start(self) -> 'Application':
+        """Warm the cache, wire the DAOs, build the search index and compile the routes."""
+        if self.data_dir is not None:
+            with self._timed('recovery'):
+                self.wal = WriteAheadLog(self.data_dir, self.cache_storage)
+                self.wal.recover()
+        else:
+            with self._timed('cache_initialization'):
+                self.cache_storage.initialize_cache()
+        with self._timed('dao_wiring'):
+            if self.fragment_budget is not None:
+                self.cache_storage.set_fragment_budget(self.fragment_budget)
+            # A new database is seeded from the warmed cache
+            ClientService.initialize_dao(self.cache_storage, self.database, self.columnar)
+            TppService.initialize_dao(self.cache_storage, self.database, self.columnar)
+            if self.database is not None:
+                self.unversioned_resources.update(('client', 'tpp'))
+            # Links embed the TPPs wherever they are stored
+            self.cache_storage.tpp_org_join().set_lookup(
+                'tpp', TppService.get_by_id if self.database is not None else None)
+            # Records stored outside the cache are not searchable
+            self.search_index = SearchIndex(self.cache_storage, {
+                cache_type: fields for cache_type, fields in SEARCH_FIELDS.items()
+                if cache_type not in self.unversioned_resources
+            })
+        with self._timed('route_compilation'):
+            self.router = Router(wire_services=False)
+            search = self.search_index.search
+            self.router.add_route(search._route_path, search._route_method, search, [],
+                                  resource=self.search_index.cache_types)
+        return self
+
+    def startup_report(self) -> str:
+        """Return a one-line summary of the startup phase timings."""
+        phases = ', '.join(f'{phase} {ms:.2f} ms' for phase, ms in self.startup_timings.items())
+        total = sum(self.startup_timings.values())
+        return f'Startup in {total:.2f} ms ({phases})'
+
+    def handle(self, method: str, path: str, headers: dict, body: bytes = None) -> Response:
+        """
+        Handle a single HTTP request.
+
+        Args:
+            method: The HTTP method
+            path: The request target
+            headers: Request headers keyed by lower-case name
+            body: The raw request body, if any
+
+        Returns:
+            Response: The response to send back
+        """
+        if method == 'OPTIONS':
+            return Response(200, headers=JSON_HEADERS + CORS_HEADERS)
+        if self.metrics is not None and method == 'GET' and path.partition('?')[0] == METRICS_PATH:
+            return Response(200, self.metrics.render().encode(),
+                            [('Content-Type', CONTENT_TYPE)] + CORS_HEADERS)
+        if self.forwards(method):
+            return self.write_forwarder(method, path, headers, body)
+
+        timer = self.metrics.start() if self.metrics is not None else None
+        status = 500
+        try:
+            response = self.dispatch(method, path, headers, body, timer)
+            if timer is not None:
+                timer.done = time.perf_counter()
+            if self.wal is not None and method in WRITE_METHODS:
+                # Acknowledge writes only once they are on disk
+                try:
+                    self.wal.commit()
+                except OSError as e:
+                    response = self.render_error(500, f"Write not durable: {str(e)}")
+            status = response.status
+            if timer is not None:
+                response.route = timer.route
+            return response
+        finally:
+            if timer is not None:
+                self.metrics.finish(timer, method, status)
+
+    def dispatch(self, method: str, path: str, headers: dict, body: bytes = None,
+                 timer: RequestTimer = None) -> Response:
+        """Route a request to its handler and render the result, marking its phases on timer."""
+        route_key = None
+        try:
+            data = None
+            if method in WRITE_METHODS and body:
+                data = json.loads(body.decode('utf-8'))
+
+            route_path, _, query_string = path.partition('?')
+            query = dict(parse_qsl(query_string))
+            route_key, route_params = self.router.match(route_path, method)
+            if timer is not None:
+                timer.route = route_key
+
+            encoding = negotiate_encoding(headers.get('accept-encoding'))
+            etag = self.etag(route_key, route_params, query_string) if method == 'GET' else None
+            route = (route_key, tuple(route_params.items()))
+            if etag is not None:
+                validators = [('ETag', etag), ('Cache-Control', 'no-cache')]
+                if self.etag_matches(headers.get('if-none-match'), etag):
+                    return Response(304, headers=validators + CORS_HEADERS)
+                cached_body = encoding and self.compressed_bodies.get(route, etag, encoding)
+                if cached_body:
+                    return Response(200, cached_body, JSON_HEADERS + [
+                        ('Content-Encoding', encoding), ('Vary', 'Accept-Encoding')
+                    ] + validators + CORS_HEADERS)
+            # Conditional hits above are answered within the parse phase
+            if timer is not None:
+                timer.parsed = time.perf_counter()
+
+            listed = self.router.listing_of(route_key) if not query else None
+            if listed is not None and listed not in self.unversioned_resources:
+                # Full listings are serialized from the stored records, without materializing dicts
+                response_data = self.cache_storage.get_listing(listed)
+            else:
+                response_data = self.router.invoke(route_key, route_params, data=data, query=query)
+            if timer is not None:
+                timer.dispatched = time.perf_counter()
+            if (encoding is None and isinstance(response_data, (list, Listing))
+                    and len(response_data) >= streaming.STREAM_MIN_ITEMS):
+                response = self.render_stream(response_data)
+            else:
+                response = self.render(response_data)
+                self.compress_response(response, encoding, route, etag)
+            if etag is not None:
+                response.headers.extend(validators)
+            return response
+        except json.JSONDecodeError:
+            return self.render_error(400, "Invalid JSON format")
+        except ValueError as e:
+            # Only an unknown GET route is not found; a matched route rejected its parameters
+            return self.render_error(404 if method == 'GET' and route_key is None else 400, str(e))
+        except Exception as e:
+            return self.render_error(500, f"Internal server error: {str(e)}")
+
+    def etag(self, route_key: tuple, route_params: dict, query_string: str):
+        """
+        Compute the ETag of a GET route from cache versions, without reading the data.
+
+        Collection routes use the collection version (and the query string,
+        which selects a page); '/{id}' routes use the version of that record
+        and a checksum of its ID, marked so they never equal a collection tag.
+        Routes joining several collections use the version of each, and
+        their path parameters like a query string.
+
+        Returns:
+            The weak ETag, or None if the route or record is not versioned
+        """
+        resource = self.router.resource_of(route_key)
+        cache_types = (resource,) if isinstance(resource, str) else resource or ()
+        if not cache_types or any(cache_type in self.unversioned_resources
+                                  for cache_type in cache_types):
+            return None
+
+        if isinstance(resource, str) and 'id' in route_params:
+            version = self.cache_storage.get_item_version(route_params['id'], resource)
+            if version is None:
+                return None
+            item_tag = zlib.crc32(route_params['id'].encode())
+            return f'W/"{self.instance_tag}-{resource}-id-{item_tag:08x}-{version}"'
+
+        tag = self.instance_tag + ''.join(f'-{cache_type}-{self.cache_storage.get_version(cache_type)}'
+                                          for cache_type in cache_types)
+        # The path parameters and the query string select what the route returns
+        selector = query_string
+        if route_params:
+            selector = f"{route_key[0]}:{'/'.join(route_params.values())}?{query_string}"
+        if selector:
+            tag += f'-{zlib.crc32(selector.encode()):08x}'
+        return f'W/"{tag}"'
+
+    @staticmethod
+    def etag_matches(if_none_match: str, etag: str) -> bool:
+        """Weakly compare an If-None-Match header against an ETag."""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        opaque_tag = etag.removeprefix('W/')
+        return any(tag.strip().removeprefix('W/') == opaque_tag
+                   for tag in if_none_match.split(','))
+
+    def forwards(self, method: str) -> bool:
+        """Return True if requests with this method are handled by another process."""
+        return self.write_forwarder is not None and method in WRITE_METHODS
+
+    def blocks(self, method: str) -> bool:
+        """
+        Return True if requests with this method wait on another process or the disk.
+
+        With a SQLite database every request may run queries, reads included.
+        """
+        if self.database is not None:
+            return True
+        return method in WRITE_METHODS and (self.write_forwarder is not None or self.wal is not None)
+
+    def render(self, data) -> Response:
+        """Serialize handler output into a JSON response."""
+        if hasattr(data, 'json_fragments'):
+            # Collection listings join the cached encoding of each record
+            body = b'[' + b', '.join(data.json_fragments()) + b']'
+        else:
+            if hasattr(data, 'to_dict'):
+                data = data.to_dict()
+            body = json.dumps(data).encode()
+        return Response(200, body, JSON_HEADERS + [('Vary', 'Accept-Encoding')] + CORS_HEADERS)
+
+    def render_stream(self, items: list) -> Response:
+        """Serialize a large list lazily, element by element, in bounded chunks."""
+        return Response(200, headers=JSON_HEADERS + [('Vary', 'Accept-Encoding')] + CORS_HEADERS,
+                        chunks=streaming.iter_json_array(items, streaming.CHUNK_SIZE))
+
+    def compress_response(self, response: Response, encoding: str, route: tuple = None,
+                          etag: str = None) -> None:
+        """
+        Compress a rendered response body in place when it is large enough.
+
+        Bodies of versioned routes are cached under their route, path
+        parameters and ETag, so polling an unchanged collection does not
+        compress it again.
+        """
+        if encoding is None or len(response.body) < MIN_COMPRESS_SIZE:
+            return
+        response.body = compress(response.body, encoding)
+        response.headers.append(('Content-Encoding', encoding))
+        if etag is not None:
+            self.compressed_bodies.put(route, etag, encoding, response.body)
+
+    def render_error(self, status: int, message: str) -> Response:
+        """Build a JSON error response."""
+        body = json.dumps({"error": message}).encode()
+        return Response(status, body, JSON_HEADERS + CORS_HEADERS, error=message)
@@ -0,0 +1,345 @@
+import contextlib
+import gzip
+import json
+import os
+import tempfile
+import unittest
+import zlib
+from unittest.mock import patch
+from app import Application
+from client import Client
+from client_service import ClientService
+from compression import CompressedBodyCache
+from tpp import Tpp
+from tpp_service import TppService
+from services import CacheStorage
+import streaming
+
+class TestApplication(unittest.TestCase):
+    """Test cases for request handling in Application."""
+
+    def setUp(self):
+        """Start an application over a freshly loaded cache."""
+        CacheStorage.reset_cache()
+        self.app = Application().start()
+
+    def tearDown(self):
+        """Leave a clean cache for other test modules."""
+        CacheStorage.reset_cache()
+
+    def get(self, path, **headers):
+        """Issue a GET request with lower-case header names."""
+        return self.app.handle('GET', path, {name.replace('_', '-'): value
+                                             for name, value in headers.items()})
+
+    def header(self, response, name):
+        """Return the value of a response header, or None."""
+        return next((value for key, value in response.headers if key == name), None)
+
+    def test_conditional_collection_get(self):
+        """Test that unchanged collections answer If-None-Match with 304."""
+        for path in ['/api/clients', '/api/tpps', '/api/scopes', '/api/orgs',
+                     '/api/environment', '/api/clients?limit=2']:
+            with self.subTest(path=path):
+                first = self.get(path)
+                etag = self.header(first, 'ETag')
+                self.assertEqual(first.status, 200)
+                self.assertTrue(etag.startswith('W/"'))
+
+                with patch.object(Application, 'render') as render:
+                    second = self.get(path, if_none_match=etag)
+                    render.assert_not_called()
+                self.assertEqual(second.status, 304)
+                self.assertEqual(second.body, b'')
+                self.assertEqual(self.header(second, 'ETag'), etag)
+
+        self.assertNotEqual(self.header(self.get('/api/clients?limit=2'), 'ETag'),
+                            self.header(self.get('/api/clients?limit=3'), 'ETag'))
+
+    def test_mutations_change_etags(self):
+        """Test that collection ETags change on writes and entity ETags only on their own."""
+        collection_etag = self.header(self.get('/api/clients'), 'ETag')
+        entity_etag = self.header(self.get('/api/clients/2'), 'ETag')
+        other_etag = self.header(self.get('/api/clients/3'), 'ETag')
+
+        client = dict(CacheStorage.get_from_cache('2', 'client'), clientName='Renamed')
+        self.app.handle('PATCH', '/api/clients/2', {}, json.dumps(client).encode())
+
+        self.assertEqual(self.get('/api/clients', if_none_match=collection_etag).status, 200)
+        response = self.get('/api/clients/2', if_none_match=entity_etag)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(response.body)['clientName'], 'Renamed')
+        self.assertEqual(self.get('/api/clients/3', if_none_match=other_etag).status, 304)
+
+        # The last written record and its collection share a version, never an ETag
+        collection_etag = self.header(self.get('/api/clients'), 'ETag')
+        self.assertNotEqual(self.header(response, 'ETag'), collection_etag)
+        self.assertEqual(self.get('/api/clients/2', if_none_match=collection_etag).status, 200)
+
+    def test_tpp_orgs_join_current_records(self):
+        """Test that TPP-Org links store IDs and the joined view follows TPP and org updates."""
+        self.assertEqual(CacheStorage.get_from_cache('TPP_ORG_1', 'tppOrg'),
+                         {'tppOrgId': 'TPP_ORG_1', 'tppId': 'TPP1', 'orgId': 'ORG1'})
+        first = self.get('/api/tpp_orgs')
+        etag = self.header(first, 'ETag')
+        self.assertEqual(json.loads(first.body)[0], {
+            'org': CacheStorage.get_from_cache('ORG1', 'org'),
+            'tpp': CacheStorage.get_from_cache('TPP1', 'tpp'),
+            'tppOrgId': 'TPP_ORG_1'
+        })
+        self.assertEqual(self.get('/api/tpp_orgs', if_none_match=etag).status, 304)
+
+        tpp = dict(CacheStorage.get_from_cache('TPP1', 'tpp'), tppName='Renamed')
+        self.app.handle('PATCH', '/api/tpps/TPP1', {}, json.dumps(tpp).encode())
+        response = self.get('/api/tpp_orgs', if_none_match=etag)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(response.body)[0]['tpp']['tppName'], 'Renamed')
+        links = CacheStorage.tpp_org_join().find('orgId', 'ORG2')
+        self.assertEqual([link['tppOrgId'] for link in links], ['TPP_ORG_2'])
+
+        # Links restored from snapshots with embedded records are normalized
+        embedded = dict(json.loads(first.body)[0], tppOrgId='OLD')
+        CacheStorage.restore({'tppOrg': [embedded]})
+        self.assertEqual(CacheStorage.get_items('tppOrg'),
+                         [{'tppOrgId': 'OLD', 'tppId': 'TPP1', 'orgId': 'ORG1'}])
+
+    def test_relationship_routes(self):
+        """Test the clients of a TPP and the TPPs of an org, and their ETags."""
+        client = dict(CacheStorage.get_from_cache('2', 'client'), clientId='n1', tppId='TPP1')
+        self.app.handle('POST', '/api/clients', {}, json.dumps(client).encode())
+        test_cases = [
+            ('/api/tpps/TPP1/clients', ['n1']),
+            ('/api/tpps/TestAggregator/clients', [str(i) for i in range(1, 16)]),
+            ('/api/tpps/unknown/clients', []),
+            ('/api/orgs/ORG2/tpps', ['TPP2']),
+            ('/api/orgs/ORG5/tpps', []),
+        ]
+        for path, expected_ids in test_cases:
+            with self.subTest(path=path):
+                response = self.get(path)
+                self.assertEqual(response.status, 200)
+                ids = [item.get('clientId', item.get('tppId')) for item in json.loads(response.body)]
+                self.assertEqual(ids, expected_ids)
+
+        etag = self.header(self.get('/api/tpps/TPP1/clients'), 'ETag')
+        self.assertNotEqual(self.header(self.get('/api/tpps/TPP2/clients'), 'ETag'), etag)
+        self.assertEqual(self.get('/api/tpps/TPP1/clients', if_none_match=etag).status, 304)
+        self.app.handle('DELETE', '/api/clients/n1', {})
+        response = self.get('/api/tpps/TPP1/clients', if_none_match=etag)
+        self.assertEqual((response.status, json.loads(response.body)), (200, []))
+
+        etag = self.header(self.get('/api/orgs/ORG2/tpps'), 'ETag')
+        tpp = dict(CacheStorage.get_from_cache('TPP2', 'tpp'), tppName='Renamed')
+        self.app.handle('PATCH', '/api/tpps/TPP2', {}, json.dumps(tpp).encode())
+        response = self.get('/api/orgs/ORG2/tpps', if_none_match=etag)
+        self.assertEqual(json.loads(response.body)[0]['tppName'], 'Renamed')
+
+    def test_tpps_of_scopes(self):
+        """Test scope lookups with AND and OR queries over the inverted scope index."""
+        tpp = dict(CacheStorage.get_from_cache('TPP1', 'tpp'), scopeNameList='fdx:read fdx:admin')
+        self.app.handle('PATCH', '/api/tpps/TPP1', {}, json.dumps(tpp).encode())
+        test_cases = [
+            ('/api/scopes/fdx:admin/tpps', ['TPP1']),
+            ('/api/scopes/fdx:write/tpps', ['TPP2', 'TPP3', 'TPP4', 'TPP5']),
+            ('/api/scopes/fdx:read,fdx:write/tpps', ['TPP2', 'TPP3', 'TPP4', 'TPP5']),
+            ('/api/scopes/fdx:admin,fdx:write/tpps', []),
+            ('/api/scopes/fdx:admin,fdx:write/tpps?match=any',
+             ['TPP1', 'TPP2', 'TPP3', 'TPP4', 'TPP5']),
+            ('/api/scopes/unknown/tpps', []),
+        ]
+        for path, expected_ids in test_cases:
+            with self.subTest(path=path):
+                response = self.get(path)
+                self.assertEqual([tpp['tppId'] for tpp in json.loads(response.body)], expected_ids)
+        self.assertEqual(self.get('/api/scopes/fdx:read/tpps?match=some').status, 400)
+        self.assertNotEqual(self.header(self.get('/api/scopes/fdx:read/tpps'), 'ETag'),
+                            self.header(self.get('/api/scopes/fdx:admin/tpps'), 'ETag'))
+
+    def test_if_none_match_lists_and_wildcards(self):
+        """Test If-None-Match with several tags, strong tags and '*'."""
+        etag = self.header(self.get('/api/scopes'), 'ETag')
+        test_cases = [
+            (f'W/"other", {etag}', 304),
+            (etag.removeprefix('W/'), 304),
+            ('*', 304),
+            ('W/"other"', 200),
+        ]
+        for if_none_match, expected_status in test_cases:
+            with self.subTest(if_none_match=if_none_match):
+                self.assertEqual(self.get('/api/scopes', if_none_match=if_none_match).status,
+                                 expected_status)
+
+    def test_compression_negotiation(self):
+        """Test gzip and deflate negotiation and the minimum size threshold."""
+        identity = self.get('/api/clients').body
+        test_cases = [
+            # (accept_encoding, path, expected_encoding)
+            ('gzip, deflate', '/api/clients', 'gzip'),
+            ('deflate', '/api/clients', 'deflate'),
+            ('gzip;q=0, deflate;q=0.5', '/api/clients', 'deflate'),
+            ('*', '/api/clients', 'gzip'),
+            ('br', '/api/clients', None),
+            ('gzip;q=0', '/api/clients', None),
+            ('gzip', '/api/clients/1', None),
+        ]
+        for accept_encoding, path, expected_encoding in test_cases:
+            with self.subTest(accept_encoding=accept_encoding, path=path):
+                response = self.get(path, accept_encoding=accept_encoding)
+                self.assertEqual(self.header(response, 'Content-Encoding'), expected_encoding)
+                self.assertEqual(self.header(response, 'Vary'), 'Accept-Encoding')
+                if expected_encoding == 'gzip':
+                    self.assertEqual(gzip.decompress(response.body), identity)
+                elif expected_encoding == 'deflate':
+                    self.assertEqual(zlib.decompress(response.body), identity)
+
+    def test_compressed_bodies_are_cached_per_version(self):
+        """Test that unchanged collections reuse their compressed body until written."""
+        first = self.get('/api/clients', accept_encoding='gzip')
+        with patch.object(Application, 'render') as render:
+            second = self.get('/api/clients', accept_encoding='gzip')
+            render.assert_not_called()
+        self.assertEqual(second.body, first.body)
+        self.assertEqual(self.header(second, 'ETag'), self.header(first, 'ETag'))
+
+        self.app.handle('DELETE', '/api/clients/1', {})
+        third = self.get('/api/clients', accept_encoding='gzip')
+        self.assertNotIn(b'"clientId": "1"', gzip.decompress(third.body))
+
+    def test_compressed_bodies_are_cached_per_route(self):
+        """Test that a cached listing body is never served for a record, even under one ETag."""
+        client = dict(CacheStorage.get_from_cache('3', 'client'), clientDesc='x' * 2000)
+        self.app.handle('PATCH', '/api/clients/3', {}, json.dumps(client).encode())
+        shared_etag = patch.object(Application, 'etag', return_value='W/"shared"')
+        for name, etags in [('versioned', contextlib.nullcontext()), ('shared', shared_etag)]:
+            with self.subTest(etags=name), etags:
+                self.app.compressed_bodies = CompressedBodyCache()
+                self.get('/api/clients', accept_encoding='gzip')
+                self.get('/api/clients', accept_encoding='gzip')
+                response = self.get('/api/clients/3', accept_encoding='gzip')
+                self.assertEqual(self.header(response, 'Content-Encoding'), 'gzip')
+                self.assertEqual(json.loads(gzip.decompress(response.body))['clientId'], '3')
+
+    def test_large_lists_are_streamed(self):
+        """Test that large list responses are serialized lazily in bounded chunks."""
+        expected = json.dumps(CacheStorage.get_items('client')).encode()
+        with patch.object(streaming, 'STREAM_MIN_ITEMS', 10):
+            response = self.get('/api/clients')
+            small = self.get('/api/scopes')
+            compressed = self.get('/api/clients', accept_encoding='gzip')
+
+        self.assertEqual(response.body, b'')
+        self.assertIsNotNone(self.header(response, 'ETag'))
+        self.assertEqual(b''.join(response.chunks), expected)
+        self.assertIsNone(small.chunks)
+        self.assertIsNone(compressed.chunks)
+
+    def test_listings_are_served_from_stored_records(self):
+        """Test that full listings join cached encodings without materializing dicts."""
+        for path, cache_type in [('/api/clients', 'client'), ('/api/scopes', 'scope')]:
+            with self.subTest(path=path):
+                self.get(path)
+                with patch('collection.materialize') as collection_materialize, \
+                        patch('fragments.materialize') as fragments_materialize:
+                    response = self.get(path)
+                    collection_materialize.assert_not_called()
+                    fragments_materialize.assert_not_called()
+                self.assertEqual(json.loads(response.body), CacheStorage.get_items(cache_type))
+        page = json.loads(self.get('/api/clients?limit=2').body)
+        self.assertEqual([item['clientId'] for item in page['items']], ['1', '2'])
+
+    def test_batch_create_and_upsert(self):
+        """Test the bulk routes report invalid and duplicate items per item, by index when unidentified."""
+        client = CacheStorage.get_from_cache('2', 'client')
+        clients = [dict(client, clientId='n1'), dict(client, clientId='1'),
+                   dict(client, clientId='n2', contacts='not-a-list'), 'not-an-object',
+                   dict(client, clientId=None, contacts='not-a-list')]
+        response = self.app.handle('POST', '/api/clientsBatch', {},
+                                   json.dumps({'clients': clients}).encode())
+        result = json.loads(response.body)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(result['created'], ['n1'])
+        self.assertEqual(result['failed'], ['n2', 3, 4, '1'])
+        self.assertEqual(result['message'], 'Successfully created 1 items, failed to create 4 items')
+
+        tpp = CacheStorage.get_from_cache('TPP1', 'tpp')
+        tpps = [dict(tpp, tppName='Renamed'), dict(tpp, tppId='TPP9'), dict(tpp, status='bogus')]
+        response = self.app.handle('PATCH', '/api/tppsBatch', {},
+                                   json.dumps({'tpps': tpps}).encode())
+        result = json.loads(response.body)
+        self.assertEqual(result['upserted'], ['TPP1', 'TPP9'])
+        self.assertEqual(result['failed'], ['TPP1'])
+        self.assertEqual(CacheStorage.get_from_cache('TPP1', 'tpp')['tppName'], 'Renamed')
+        self.assertIsNotNone(CacheStorage.get_from_cache('TPP9', 'tpp'))
+
+    def test_writes_store_normalized_records(self):
+        """Test that writes store what from_dict().to_dict() would and PATCH applies a delta."""
+        tpp = {'tppId': 'TPP9', 'tppName': 'New', 'unknown': 'dropped'}
+        response = self.app.handle('POST', '/api/tpps', {}, json.dumps(tpp).encode())
+        expected = Tpp.from_dict(tpp).to_dict()
+        self.assertEqual(json.loads(response.body), expected)
+        self.assertEqual(CacheStorage.get_from_cache('TPP9', 'tpp'), expected)
+
+        response = self.app.handle('PATCH', '/api/tpps/TPP9', {},
+                                   json.dumps({'tppDesc': 'Patched', 'unknown': 1}).encode())
+        self.assertEqual(json.loads(response.body), dict(expected, tppDesc='Patched'))
+        self.assertEqual(CacheStorage.get_from_cache('TPP9', 'tpp'), dict(expected, tppDesc='Patched'))
+        client = CacheStorage.get_from_cache('2', 'client')
+        self.app.handle('PATCH', '/api/clients/2', {}, json.dumps({'clientName': 'Renamed'}).encode())
+        self.assertEqual(CacheStorage.get_from_cache('2', 'client'), dict(client, clientName='Renamed'))
+
+        for path, body in [('/api/tpps/TPP9', {'status': 'bogus'}),
+                           ('/api/tpps/missing', {'tppName': 'New'})]:
+            with self.subTest(path=path, body=body):
+                response = self.app.handle('PATCH', path, {}, json.dumps(body).encode())
+                self.assertEqual(response.status, 400)
+        self.assertEqual(Client.to_record({}), Client.from_dict({}).to_dict())
+        self.assertIsNot(Client.to_record({})['contacts'], Client.to_record({})['contacts'])
+
+    def test_database_backed_resources(self):
+        """Test that clients served from SQLite are written there and sent without ETags."""
+        with tempfile.TemporaryDirectory() as directory:
+            app = Application(database=os.path.join(directory, 'metadata.db')).start()
+            client = dict(CacheStorage.get_from_cache('2', 'client'), clientId='stored')
+            app.handle('POST', '/api/clients', {}, json.dumps(client).encode())
+            try:
+                response = app.handle('GET', '/api/clients/stored', {})
+                self.assertEqual(json.loads(response.body)['clientId'], 'stored')
+                self.assertIsNone(self.header(response, 'ETag'))
+                self.assertIsNone(CacheStorage.get_from_cache('stored', 'client'))
+                self.assertIsNotNone(self.header(app.handle('GET', '/api/scopes', {}), 'ETag'))
+            finally:
+                ClientService._dao.close()
+                TppService._dao.close()
+                CacheStorage.tpp_org_join().set_lookup('tpp', None)
+
+    def test_database_backed_tpps_in_links(self):
+        """Test that the TPP-Org views embed TPPs as written to SQLite."""
+        with tempfile.TemporaryDirectory() as directory:
+            app = Application(database=os.path.join(directory, 'metadata.db')).start()
+            try:
+                app.handle('PATCH', '/api/tpps/TPP2', {}, b'{"tppName": "RenamedInDB"}')
+                self.assertEqual(CacheStorage.get_from_cache('TPP2', 'tpp')['tppName'], 'Test TPP 2')
+                tpps = json.loads(app.handle('GET', '/api/orgs/ORG2/tpps', {}).body)
+                self.assertIn('RenamedInDB', [tpp['tppName'] for tpp in tpps])
+                response = app.handle('GET', '/api/tpp_orgs', {})
+                self.assertIsNone(self.header(response, 'ETag'))
+                names = {link['tpp']['tppName'] for link in json.loads(response.body)
+                         if link['tpp']['tppId'] == 'TPP2'}
+                self.assertEqual(names, {'RenamedInDB'})
+            finally:
+                ClientService._dao.close()
+                TppService._dao.close()
+                CacheStorage.tpp_org_join().set_lookup('tpp', None)
+
+    def test_iter_json_array_matches_json_dumps(self):
+        """Test that chunked serialization is byte-identical to json.dumps."""
+        items = CacheStorage.get_items('client')
+        for chunk_size in [1, 100, 1000, 10 ** 6]:
+            with self.subTest(chunk_size=chunk_size):
+                chunks = list(streaming.iter_json_array(items, chunk_size))
+                self.assertEqual(b''.join(chunks), json.dumps(items).encode())
+                self.assertTrue(all(len(chunk) < chunk_size + 400 for chunk in chunks))
+        self.assertEqual(b''.join(streaming.iter_json_array([])), b'[]')
+
+if __name__ == '__main__':
+    unittest.main()
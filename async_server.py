@@ -0,0 +1,201 @@
+import asyncio
+import time
+from http import HTTPStatus
+from streaming import LAST_CHUNK, frame_chunk
+
+# Limits that keep a single connection from exhausting the server
+MAX_HEADERS = 100
+MAX_BODY_SIZE = 16 * 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 75
+
+
+class BadRequest(Exception):
+    """Raised when a request cannot be framed; the connection is closed."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncHTTPServer:
+    """HTTP/1.1 server on asyncio with persistent connections and pipelining."""
+
+    def __init__(self, app, host: str = '', port: int = 8000, reuse_port: bool = False):
+        """
+        Initialize the server.
+
+        Args:
+            app: The started Application that handles requests
+            host: Interface to bind to
+            port: Port to listen on
+            reuse_port: Bind with SO_REUSEPORT so several processes can share the port
+        """
+        self.app = app
+        self.host = host or None
+        self.port = port
+        self.reuse_port = reuse_port
+
+    async def serve_forever(self):
+        """Accept connections until cancelled."""
+        server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port,
+            reuse_port=self.reuse_port or None
+        )
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve requests on one connection until it is closed.
+
+        Requests are read and answered strictly in order, so pipelined
+        requests already buffered in the reader get their responses in the
+        order they were sent.
+        """
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except BadRequest as e:
+                    writer.write(self.encode_error(e.status, str(e)))
+                    break
+                if request is None:
+                    break
+
+                method, target, version, headers, body, keep_alive = request
+                if self.app.blocks(method):
+                    # Forwarded and durable writes, and SQLite queries, block; keep the loop free
+                    response = await asyncio.get_running_loop().run_in_executor(
+                        None, self.app.handle, method, target, headers, body
+                    )
+                else:
+                    response = self.app.handle(method, target, headers, body)
+                start = time.perf_counter()
+                if response.chunks is not None:
+                    keep_alive = await self.write_stream(writer, response, version, keep_alive)
+                else:
+                    writer.write(self.encode_response(response, keep_alive))
+                    await writer.drain()
+                if self.app.metrics is not None:
+                    self.app.metrics.observe_write(response.route, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader):
+        """
+        Read one request from the connection.
+
+        Returns:
+            (method, target, version, headers, body, keep_alive), or None at end of stream
+
+        Raises:
+            BadRequest: If the request line, headers or framing are invalid
+        """
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return None
+            if request_line in (b'\r\n', b'\n'):
+                # Tolerate a stray CRLF between pipelined requests
+                request_line = await reader.readline()
+                if not request_line:
+                    return None
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+                raise BadRequest(400, "Malformed request line")
+            method, target, version = parts
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                if len(headers) >= MAX_HEADERS:
+                    raise BadRequest(431, "Too many headers")
+                name, sep, value = line.decode('latin-1').partition(':')
+                if not sep:
+                    raise BadRequest(400, "Malformed header line")
+                headers[name.strip().lower()] = value.strip()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise BadRequest(431, "Request line or header too long")
+
+        if 'transfer-encoding' in headers:
+            raise BadRequest(501, "Chunked request bodies are not supported")
+
+        body = None
+        content_length = headers.get('content-length')
+        if content_length:
+            if not content_length.isdigit():
+                raise BadRequest(400, "Invalid Content-Length")
+            length = int(content_length)
+            if length > MAX_BODY_SIZE:
+                raise BadRequest(413, "Request body too large")
+            body = await reader.readexactly(length)
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = connection != 'close'
+        else:
+            keep_alive = connection == 'keep-alive'
+
+        return method, target, version, headers, body, keep_alive
+
+    def encode_head(self, response, framing: str, keep_alive: bool) -> bytes:
+        """Encode the status line and headers with the given framing header line."""
+        lines = [f'HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}']
+        lines.extend(f'{name}: {value}' for name, value in response.headers)
+        if framing:
+            lines.append(framing)
+        lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    def encode_response(self, response, keep_alive: bool) -> bytes:
+        """Encode a response with Content-Length framing."""
+        framing = f'Content-Length: {len(response.body)}' if response.status != 304 else None
+        return self.encode_head(response, framing, keep_alive) + response.body
+
+    async def write_stream(self, writer: asyncio.StreamWriter, response, version: str,
+                           keep_alive: bool) -> bool:
+        """
+        Write a streamed response chunk by chunk, waiting for the socket to drain.
+
+        HTTP/1.1 clients get Transfer-Encoding: chunked and keep the
+        connection; HTTP/1.0 clients get a close-delimited body.
+
+        Returns:
+            Whether the connection can be kept alive afterwards
+        """
+        chunked = version == 'HTTP/1.1'
+        keep_alive = keep_alive and chunked
+        framing = 'Transfer-Encoding: chunked' if chunked else None
+        writer.write(self.encode_head(response, framing, keep_alive))
+        for chunk in response.chunks:
+            writer.write(frame_chunk(chunk) if chunked else chunk)
+            await writer.drain()
+        if chunked:
+            writer.write(LAST_CHUNK)
+        await writer.drain()
+        return keep_alive
+
+    def encode_error(self, status: int, message: str) -> bytes:
+        """Encode a framing error response that closes the connection."""
+        body = message.encode()
+        head = (f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n'
+                f'Content-Type: text/plain\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n')
+        return head.encode('latin-1') + body
+
+
+def run_async_server(app, host: str = '', port: int = 8000, reuse_port: bool = False):
+    """Run the asyncio server until interrupted."""
+    server = AsyncHTTPServer(app, host, port, reuse_port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from app import Application
+from async_server import AsyncHTTPServer
+from client_service import ClientService
+from services import CacheStorage
+from tpp_service import TppService
+import streaming
+
+class TestAsyncHTTPServer(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the asyncio server engine."""
+
+    async def asyncSetUp(self):
+        """Start a server on an ephemeral port."""
+        CacheStorage.reset_cache()
+        self.server = AsyncHTTPServer(Application().start())
+        self.listener = await asyncio.start_server(self.server.handle_connection, '127.0.0.1', 0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        """Stop the server and leave a clean cache."""
+        self.listener.close()
+        await self.listener.wait_closed()
+        CacheStorage.reset_cache()
+
+    async def read_response(self, reader):
+        """Read one Content-Length framed response."""
+        status_line = await reader.readline()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode().partition(':')
+            headers[name.lower()] = value.strip()
+        body = await reader.readexactly(int(headers['content-length']))
+        return int(status_line.split()[1]), headers, body
+
+    async def test_pipelined_requests_on_one_connection(self):
+        """Test that pipelined requests are answered in order on a kept-alive connection."""
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(
+            b'GET /api/clients/3 HTTP/1.1\r\nHost: test\r\n\r\n'
+            b'POST /api/clients HTTP/1.1\r\nContent-Length: 5\r\n\r\n{bad}'
+            b'GET /api/scopes HTTP/1.1\r\nHost: test\r\n\r\n'
+        )
+        await writer.drain()
+
+        expected = [(200, b'"clientId": "3"'), (400, b'Invalid JSON format'), (200, b'fdx:read')]
+        for expected_status, expected_body in expected:
+            status, headers, body = await self.read_response(reader)
+            self.assertEqual(status, expected_status)
+            self.assertEqual(headers['connection'], 'keep-alive')
+            self.assertIn(expected_body, body)
+
+        writer.close()
+
+    async def test_chunked_streaming_keeps_connection(self):
+        """Test that streamed lists are chunk-framed and the connection stays usable."""
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        with patch.object(streaming, 'STREAM_MIN_ITEMS', 10), \
+                patch.object(streaming, 'CHUNK_SIZE', 512):
+            writer.write(b'GET /api/clients HTTP/1.1\r\n\r\nGET /api/clients/2 HTTP/1.1\r\n\r\n')
+            status_line = await reader.readline()
+            headers = {}
+            while (line := await reader.readline()) != b'\r\n':
+                name, _, value = line.decode().partition(':')
+                headers[name.lower()] = value.strip()
+
+            body, chunk_count = b'', 0
+            while True:
+                size = int(await reader.readline(), 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                body += chunk[:-2]
+                chunk_count += 1
+
+            status, _, second = await self.read_response(reader)
+
+        self.assertIn(b'200', status_line)
+        self.assertEqual(headers['transfer-encoding'], 'chunked')
+        self.assertNotIn('content-length', headers)
+        self.assertGreater(chunk_count, 1)
+        self.assertEqual(json.loads(body), CacheStorage.get_items('client'))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(second)['clientId'], '2')
+        writer.close()
+
+    async def test_connection_close(self):
+        """Test that Connection: close ends the connection after the response."""
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(b'GET /api/environment HTTP/1.1\r\nConnection: close\r\n\r\n')
+        status, headers, _ = await self.read_response(reader)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['connection'], 'close')
+        self.assertEqual(await reader.read(), b'')
+
+    async def test_malformed_requests(self):
+        """Test that requests that cannot be framed are rejected and closed."""
+        error_cases = [
+            (b'GARBAGE\r\n\r\n', 400),
+            (b'POST /api/clients HTTP/1.1\r\nContent-Length: x\r\n\r\n', 400),
+            (b'POST /api/clients HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n', 501),
+        ]
+        for request, expected_status in error_cases:
+            with self.subTest(request=request):
+                reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+                writer.write(request)
+                status, headers, _ = await self.read_response(reader)
+                self.assertEqual(status, expected_status)
+                self.assertEqual(headers['connection'], 'close')
+                writer.close()
+
+    async def test_database_requests_run_off_the_loop(self):
+        """Test that with SQLite storage reads and writes are handled in the executor."""
+        with tempfile.TemporaryDirectory() as directory:
+            app = Application(database=os.path.join(directory, 'metadata.db')).start()
+            try:
+                self.assertTrue(app.blocks('GET'))
+                self.assertFalse(Application().blocks('GET'))
+                threads = []
+                handle = app.handle
+
+                def recording_handle(*args):
+                    threads.append(threading.current_thread())
+                    return handle(*args)
+
+                self.server.app = app
+                reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+                with patch.object(app, 'handle', side_effect=recording_handle):
+                    writer.write(b'GET /api/clients/3 HTTP/1.1\r\nHost: test\r\n\r\n'
+                                 b'PATCH /api/clients/3 HTTP/1.1\r\nContent-Length: 20\r\n\r\n'
+                                 b'{"clientName": "db"}')
+                    for _ in range(2):
+                        status, _, _ = await self.read_response(reader)
+                        self.assertEqual(status, 200)
+                writer.close()
+                self.assertEqual(len(threads), 2)
+                self.assertNotIn(threading.main_thread(), threads)
+            finally:
+                ClientService._dao.close()
+                TppService._dao.close()
+                CacheStorage.tpp_org_join().set_lookup('tpp', None)
+
+if __name__ == '__main__':
+    unittest.main()
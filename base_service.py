@@ -1,28 +1,57 @@
-from data_access import DaoImplementation
+from columnar import ColumnarDao
+from data_access import DaoImplementation, SqliteDao, batch_result
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
 class BaseService:
     """Base service class for handling common operations."""
 
     @classmethod
-    def initialize_dao(cls, cache_storage, cache_type, id_field):
-        """Initialize the DAO."""
-        cls._dao = DaoImplementation(cache_storage, cache_type, id_field)
+    def initialize_dao(cls, cache_storage, cache_type, id_field, indexed_fields=(), database=None,
+                       columnar=False, token_fields=()):
+        """
+        Initialize the DAO: in the cache, or in a SQLite database file if one is given.
+
+        With columnar set, filters are answered from NumPy columns mirrored
+        from the cache, storing the indexed fields as categories. The cache
+        keeps inverted indexes on the token fields; SQLite scans them.
+        """
+        if database is not None:
+            cls._dao = SqliteDao(cache_storage, cache_type, id_field, indexed_fields, database)
+        elif columnar:
+            cls._dao = ColumnarDao(cache_storage, cache_type, id_field, indexed_fields, token_fields)
+        else:
+            cls._dao = DaoImplementation(cache_storage, cache_type, id_field, indexed_fields,
+                                         token_fields)
 
     @classmethod
-    def create(cls, data: dict, entity_class) -> object:
-        """Create a new entity instance."""
-        entity = entity_class.from_dict(data)
-        cls._dao.create(entity.to_dict())
-        return entity
+    def create(cls, data: dict, entity_class) -> dict:
+        """
+        Create a new entity and return its stored record.
+
+        The normalized record is stored as is: no entity instance is built
+        on the write path, call entity_class.from_dict() on the result for one.
+        """
+        record = entity_class.to_record(data)
+        cls._dao.create(record)
+        return record
 
     @classmethod
-    def update(cls, entity_id: str, data: dict, entity_class) -> object:
-        """Update an existing entity instance."""
-        existing_entity = cls.get_by_id(entity_id)
-        updated_data = {**existing_entity, **data}
-        updated_entity = entity_class.from_dict(updated_data)
-        cls._dao.update(entity_id, updated_entity.to_dict())
-        return updated_entity
+    def update(cls, entity_id: str, data: dict, entity_class) -> dict:
+        """
+        Apply the known fields of data to an existing entity and return its record.
+
+        Raises:
+            ValueError: If no entity has the ID
+        """
+        record = cls.get_by_id(entity_id)
+        if record is None:
+            raise ValueError(f"Not found: {entity_id}")
+        # get_by_id returns a fresh copy, so the changes are applied to it in place
+        record.update(entity_class.to_record(data, partial=True))
+        cls._dao.update(entity_id, record)
+        return record
 
     @classmethod
     def delete(cls, id: str) -> None:
@@ -40,9 +69,65 @@ class BaseService:
         return cls._dao.delete_batch(ids)
 
     @classmethod
-    def get_all(cls) -> list:
-        """Return all entities."""
-        return cls._dao.get_batch()
+    def create_batch(cls, items: list, entity_class, validate=None) -> dict:
+        """Create multiple entities; items that fail validation are reported as failed."""
+        records, invalid_ids = cls._prepare_batch(items, entity_class, validate)
+        result = cls._dao.create_batch(records)
+        return batch_result('created', 'create', result['created'], invalid_ids + result['failed'])
+
+    @classmethod
+    def upsert_batch(cls, items: list, entity_class, validate=None) -> dict:
+        """Create or replace multiple entities; items that fail validation are reported as failed."""
+        records, invalid_ids = cls._prepare_batch(items, entity_class, validate)
+        result = cls._dao.upsert_batch(records)
+        return batch_result('upserted', 'upsert', result['upserted'], invalid_ids + result['failed'])
+
+    @classmethod
+    def _prepare_batch(cls, items: list, entity_class, validate=None) -> tuple:
+        """
+        Validate and normalize a batch in one pass.
+
+        Returns:
+            (records of the valid items, IDs of the invalid items)
+
+        An invalid item without an ID, such as one that is not an object,
+        is reported by its index in the batch instead.
+        """
+        if not isinstance(items, list):
+            raise ValueError("items must be a list")
+
+        records = []
+        invalid_ids = []
+        for index, data in enumerate(items):
+            try:
+                if not isinstance(data, dict):
+                    raise TypeError("Each item must be an object")
+                if validate is not None:
+                    validate(data)
+                records.append(entity_class.to_record(data))
+            except (ValueError, TypeError):
+                id = data.get(cls._dao.id_field) if isinstance(data, dict) else None
+                invalid_ids.append(index if id is None else id)
+        return records, invalid_ids
+
+    @classmethod
+    def get_all(cls, limit: str = None, cursor: str = None):
+        """
+        Return all entities, or one page of them when limit or cursor is given.
+
+        A page is returned as {'items': [...], 'nextCursor': ...}; pass
+        nextCursor back as cursor to continue, until it is None.
+        """
+        if limit is None and cursor is None:
+            return cls._dao.get_batch()
+
+        try:
+            page_size = int(limit) if limit is not None else DEFAULT_PAGE_SIZE
+        except ValueError:
+            raise ValueError(f"Invalid limit: {limit}")
+        if page_size < 1:
+            raise ValueError(f"Invalid limit: {limit}")
+        return cls._dao.get_page(min(page_size, MAX_PAGE_SIZE), cursor)
 
     @classmethod
     def get_by_id(cls, id: str) -> dict:
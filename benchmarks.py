@@ -0,0 +1,351 @@
+"""Micro-benchmarks for the metadata backend.
+
+Run all benchmarks with ``python benchmarks.py`` or pick some by name,
+e.g. ``python benchmarks.py router_dispatch``.
+"""
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from app import Application
+from client import Client
+from client_service import ClientService
+from collection import Collection
+from columnar import ColumnarDao
+from data_access import DaoImplementation
+from router import Router
+from search import SEARCH_FIELDS, SearchIndex
+from services import CacheStorage
+
+
+def _per_call_us(func, iterations: int) -> float:
+    """Return the mean wall time of func() in microseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_router_dispatch(route_counts=(10, 100, 1000, 10000), iterations: int = 20000):
+    """Compare trie dispatch against a linear route scan as routes are added."""
+    print('router_dispatch: cost of matching the last registered route')
+    print(f'{"routes":>8} {"trie us":>10} {"linear us":>10}')
+    for count in route_counts:
+        router = Router()
+        for i in range(count):
+            router.add_route(f'/api/bench{i}/{{id}}', 'GET', lambda id: id, ['id'])
+        path = f'/api/bench{count - 1}/42'
+
+        def linear_match():
+            for (route_path, route_method) in router._routes:
+                if route_method == 'GET':
+                    matches, _ = router.extract_path_params(route_path, path)
+                    if matches:
+                        return
+
+        trie_us = _per_call_us(lambda: router.dispatch(path, 'GET'), iterations)
+        linear_us = _per_call_us(linear_match, max(iterations // count, 10))
+        print(f'{len(router._routes):>8} {trie_us:>10.2f} {linear_us:>10.2f}')
+
+
+def bench_app_startup(iterations: int = 200):
+    """Measure cold start and the per-request setup it replaces."""
+    print('app_startup: cold start and per-request setup')
+    CacheStorage.reset_cache()
+    app = Application().start()
+    print(f'  cold start: {app.startup_report()}')
+
+    per_request_router_us = _per_call_us(Router, iterations)
+    shared_app_us = _per_call_us(lambda: app.router, iterations)
+    print(f'  per-request Router(): {per_request_router_us:.2f} us')
+    print(f'  shared application:   {shared_app_us:.2f} us')
+
+
+def bench_delete_batch(sizes=(10000, 100000, 1000000)):
+    """Delete half of a collection in one batch, then write while it compacts."""
+    print('delete_batch: deleting half of n records, and writer stalls during compaction')
+    print(f'{"records":>8} {"batch ms":>10} {"us/delete":>10} {"rebuild ms":>11} {"max stall ms":>13}')
+    for size in sizes:
+        collection = Collection('id', [{'id': str(i), 'value': i} for i in range(size)])
+        ids = [str(i) for i in range(0, size, 2)]
+
+        start = time.perf_counter()
+        with collection.lock:
+            for item_id in ids:
+                collection.delete(item_id)
+        batch_ms = (time.perf_counter() - start) * 1000
+
+        # Time the writes that run while the compactor rebuilds the storage
+        stalls = []
+        compactor = threading.Thread(target=collection.compact)
+        compactor.start()
+        i = size
+        while compactor.is_alive():
+            start = time.perf_counter()
+            collection.add({'id': str(i), 'value': i})
+            stalls.append(time.perf_counter() - start)
+            i += 1
+        compactor.join()
+
+        # What a rebuild would cost if it ran inline, holding the write lock
+        for item_id in ids[:len(ids) // 2]:
+            collection.add({'id': item_id, 'value': 0})
+            collection.delete(item_id)
+        start = time.perf_counter()
+        with collection.lock:
+            collection.compact()
+        rebuild_ms = (time.perf_counter() - start) * 1000
+
+        print(f'{size:>8} {batch_ms:>10.2f} {batch_ms * 1000 / len(ids):>10.3f} '
+              f'{rebuild_ms:>11.2f} {max(stalls, default=0) * 1000:>13.3f}')
+
+
+def bench_record_memory(count: int = 1000000):
+    """Compare the memory per stored client as plain dicts and as compact records."""
+    print(f'record_memory: bytes per client at {count} clients')
+
+    def decoded_clients():
+        # Like request bodies decoded from JSON, every string is a separate object
+        domains = [f'tpp{i}.example.com' for i in range(50)]
+        for i in range(count):
+            domain = domains[i % 50]
+            yield {
+                'clientId': f'client-{i}',
+                'clientName': f'Client {i}',
+                'clientDesc': f'this is client {i}',
+                'tppId': f'TPP{i % 50}',
+                'clientSecret': f'{i:08x}secret',
+                'logoUri': f'http://{domain}/logo.png',
+                'uri': f'http://{domain}',
+                'contacts': [f'ops@{domain}', f'support@{domain}'],
+                'status': f'{"in" if i % 10 == 0 else ""}active'
+            }
+
+    for label, compact in [('dicts', False), ('records', True)]:
+        collection = Collection('clientId')
+        if not compact:
+            collection._encoder.encode = lambda item: item
+        tracemalloc.start()
+        for client in decoded_clients():
+            collection.add(client)
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'  {label:>8}: {used / count:8.1f} bytes per client')
+        del collection
+
+
+def bench_columnar_filter(sizes=(10000, 100000, 1000000), iterations: int = 5):
+    """Compare filters and counts over the cache against NumPy columns."""
+    print('columnar_filter: filtering n clients (ms per query, cache / columns)')
+    queries = {
+        'indexed': {'tppId': 'TPP7', 'status': 'inactive'},
+        'unindexed': {'clientDesc': 'this is client 42'},
+        'mixed': {'status': 'active', 'logoUri': 'http://tpp7.example.com/logo.png'},
+    }
+    print(f'{"records":>8} ' + ' '.join(f'{name:>21}' for name in queries) + f' {"count":>21}')
+    for size in sizes:
+        CacheStorage.reset_cache()
+        CacheStorage.initialize_cache()
+        CacheStorage.upsert_batch([
+            {'clientId': f'client-{i}', 'clientName': f'Client {i}', 'clientDesc': f'this is client {i}',
+             'tppId': f'TPP{i % 50}', 'logoUri': f'http://tpp{i % 50}.example.com/logo.png',
+             'contacts': [f'ops@tpp{i % 50}.example.com'], 'status': 'inactive' if i % 10 == 0 else 'active'}
+            for i in range(size)
+        ], 'client')
+        cache_dao = DaoImplementation(CacheStorage, 'client', 'clientId', ('tppId', 'status'))
+        columnar_dao = ColumnarDao(CacheStorage, 'client', 'clientId', ('tppId', 'status'))
+        columnar_dao.count()
+
+        timings = []
+        for filter_params in queries.values():
+            assert cache_dao.get_batch(filter_params) == columnar_dao.get_batch(filter_params)
+            timings.append((_per_call_us(lambda: cache_dao.get_batch(filter_params), iterations) / 1000,
+                            _per_call_us(lambda: columnar_dao.get_batch(filter_params), iterations) / 1000))
+        status = {'status': 'active'}
+        timings.append((_per_call_us(lambda: cache_dao.count(status), iterations) / 1000,
+                        _per_call_us(lambda: columnar_dao.count(status), iterations) / 1000))
+        print(f'{size:>8} ' + ' '.join(f'{cache:>10.2f} {columns:>10.2f}' for cache, columns in timings))
+        columnar_dao.close()
+    CacheStorage.reset_cache()
+
+
+def bench_search(sizes=(10000, 100000, 1000000), iterations: int = 200):
+    """Time search queries as the number of indexed clients grows."""
+    print('search: searching n clients (us per query, limit 20)')
+    queries = {'prefix': 'client 42', 'common': 'cli', 'substring': 'ient 4', 'none': 'zzz'}
+    print(f'{"records":>8} {"index ms":>10} ' + ' '.join(f'{name:>10}' for name in queries))
+    for size in sizes:
+        CacheStorage.reset_cache()
+        CacheStorage.initialize_cache()
+        CacheStorage.upsert_batch([
+            {'clientId': f'client-{i}', 'clientName': f'Client {i}', 'clientDesc': f'this is client {i}',
+             'tppId': f'TPP{i % 50}', 'status': 'active'}
+            for i in range(size)
+        ], 'client')
+        start = time.perf_counter()
+        index = SearchIndex(CacheStorage, {'client': SEARCH_FIELDS['client']})
+        build_ms = (time.perf_counter() - start) * 1000
+        timings = [_per_call_us(lambda: index.find(query), iterations) for query in queries.values()]
+        print(f'{size:>8} {build_ms:>10.0f} ' + ' '.join(f'{timing:>10.1f}' for timing in timings))
+        index.close()
+    CacheStorage.reset_cache()
+
+
+def bench_write_allocations(iterations: int = 2000):
+    """Compare allocations of client writes through entity round trips and stored records."""
+    print('write_allocations: peak bytes allocated per request (entity round trip / record)')
+
+    def legacy_create(data):
+        # The previous path: dict -> Client -> dict, copied by the DAO, converted again to render
+        Client.validate_fields(data)
+        entity = Client.from_dict(data)
+        ClientService._dao.create(dict(entity.to_dict()))
+        return json.dumps(entity.to_dict())
+
+    def legacy_update(client_id, data):
+        Client.validate_fields(data)
+        entity = Client.from_dict({**ClientService.get_by_id(client_id), **data})
+        ClientService._dao.update(client_id, dict(entity.to_dict()))
+        return json.dumps(entity.to_dict())
+
+    def allocated(func) -> float:
+        # Peak traced memory of each call above what it retains, i.e. its transient allocations
+        total = 0
+        tracemalloc.start()
+        for i in range(iterations):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            func(i)
+            total += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+        return total / iterations
+
+    template = dict(CacheStorage.get_from_cache('2', 'client'))
+    body = lambda i, prefix: dict(template, clientId=f'{prefix}-{i}', clientName=f'Client {i}')
+    cases = [
+        ('create', lambda i: legacy_create(body(i, 'old')),
+         lambda i: json.dumps(ClientService.create(body(i, 'new')))),
+        ('update (full)', lambda i: legacy_update(f'old-{i}', body(i, 'old')),
+         lambda i: json.dumps(ClientService.update(f'new-{i}', body(i, 'new')))),
+        # Previously a PATCH had to carry every field
+        ('update (1 field)', lambda i: legacy_update(f'old-{i}', dict(body(i, 'old'), status='inactive')),
+         lambda i: json.dumps(ClientService.update(f'new-{i}', {'status': 'inactive'}))),
+    ]
+    CacheStorage.reset_cache()
+    Application().start()
+    for label, legacy, current in cases:
+        print(f'  {label:>16}: {allocated(legacy):8.0f} / {allocated(current):8.0f}')
+    CacheStorage.reset_cache()
+
+
+def bench_validation(iterations: int = 200000):
+    """Compare client validation by the generic field loop and by the compiled schema."""
+    print('validation: client bodies validated per second (loop / compiled)')
+    # The loop stops at the first problem, the compiled validator reports them all
+
+    def loop_validate(data: dict) -> None:
+        # The previous Client.validate_fields
+        required_fields = {
+            'clientId': str, 'clientName': str, 'clientDesc': str, 'tppId': str,
+            'clientSecret': str, 'logoUri': str, 'uri': str, 'contacts': list
+        }
+        for field, field_type in required_fields.items():
+            if field not in data:
+                raise ValueError(f"Missing required field: {field}")
+            if not isinstance(data[field], field_type):
+                raise TypeError(f"Invalid type for {field}: expected {field_type.__name__}")
+            if field == 'contacts' and not all(isinstance(x, str) for x in data[field]):
+                raise TypeError("All contacts must be strings")
+
+    valid = CacheStorage.get_from_cache('2', 'client')
+    cases = [('valid', valid), ('invalid', dict(valid, uri=None, contacts=[1]))]
+    for label, data in cases:
+        rates = []
+        for validate in (loop_validate, Client.validate_fields):
+            def call():
+                try:
+                    validate(data)
+                except (ValueError, TypeError):
+                    pass
+            rates.append(1e6 / _per_call_us(call, iterations))
+        print(f'  {label:>8}: {rates[0]:>10.0f} / {rates[1]:>10.0f}')
+    CacheStorage.reset_cache()
+
+
+def bench_list_encoding(sizes=(1000, 10000, 100000), iterations: int = 10):
+    """Compare encoding a client listing record by record and by joining cached fragments."""
+    print('list_encoding: rendering GET /api/clients (ms, json.dumps / fragments), cache bytes per client')
+    app = Application()
+    for size in sizes:
+        CacheStorage.reset_cache()
+        CacheStorage.initialize_cache()
+        CacheStorage.upsert_batch([
+            {'clientId': f'client-{i}', 'clientName': f'Client {i}', 'clientDesc': f'this is client {i}',
+             'tppId': f'TPP{i % 50}', 'clientSecret': f'{i:08x}secret', 'logoUri': 'http://example.com/logo.png',
+             'uri': 'http://example.com', 'contacts': ['ops@example.com'], 'status': 'active'}
+            for i in range(size)
+        ], 'client')
+        assert app.render(CacheStorage.get_listing('client')).body == \
+            json.dumps(CacheStorage.get_items('client')).encode()
+        # Both include reading the collection: the weakly cached dicts are rebuilt per call
+        dumps_ms = _per_call_us(lambda: json.dumps(CacheStorage.get_items('client')).encode(),
+                                iterations) / 1000
+        fragments_ms = _per_call_us(lambda: app.render(CacheStorage.get_listing('client')),
+                                    iterations) / 1000
+        stats = CacheStorage.get_fragment_stats()
+        print(f'{size:>8} {dumps_ms:>10.2f} {fragments_ms:>10.2f} {stats["bytes"] / size:>10.0f}')
+    CacheStorage.reset_cache()
+
+
+def bench_metrics_overhead(iterations: int = 100000):
+    """Measure the time request metrics add to handling a request."""
+    print('metrics_overhead: us per request (without metrics / with metrics / added)')
+    CacheStorage.reset_cache()
+    plain = Application(metrics=False).start()
+    measured = Application().start()
+
+    def etag(app):
+        # ETags embed a per-application instance tag
+        return next(value for name, value in app.handle('GET', '/api/clients/2', {}).headers
+                    if name == 'ETag')
+
+    requests = [
+        ('304', '/api/clients/2', {plain: {'if-none-match': etag(plain)},
+                                   measured: {'if-none-match': etag(measured)}}),
+        ('200', '/api/clients/2', {plain: {}, measured: {}}),
+        ('404', '/api/nowhere', {plain: {}, measured: {}}),
+    ]
+    for label, path, headers in requests:
+        # Interleave rounds so drift affects both sides alike
+        without = with_metrics = 0.0
+        for _ in range(5):
+            without += _per_call_us(lambda: plain.handle('GET', path, headers[plain]),
+                                    iterations // 5)
+            with_metrics += _per_call_us(lambda: measured.handle('GET', path, headers[measured]),
+                                         iterations // 5)
+        without, with_metrics = without / 5, with_metrics / 5
+        print(f'  {label:>5}: {without:8.2f} / {with_metrics:8.2f} / {with_metrics - without:6.2f}')
+    write = _per_call_us(lambda: measured.metrics.observe_write(('/api/clients/{id}', 'GET'), 1e-4),
+                         iterations)
+    print(f'  write phase: {write:.2f} us per response')
+    CacheStorage.reset_cache()
+
+
+BENCHMARKS = {
+    'router_dispatch': bench_router_dispatch,
+    'app_startup': bench_app_startup,
+    'delete_batch': bench_delete_batch,
+    'record_memory': bench_record_memory,
+    'columnar_filter': bench_columnar_filter,
+    'search': bench_search,
+    'write_allocations': bench_write_allocations,
+    'validation': bench_validation,
+    'list_encoding': bench_list_encoding,
+    'metrics_overhead': bench_metrics_overhead,
+}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,6 +1,10 @@
+from schema import Field, compile_schema
+
 class BoaEnv:
     """Entity class representing an product and dev environment."""
 
+    __slots__ = ('id', 'name', 'site_id', 'is_still_using')
+
     def __init__(self, id: str, name: str, site_id: str, is_still_using: bool):
         """Initialize a new env instance."""
         self.id = id
@@ -26,3 +30,12 @@ class BoaEnv:
             site_id=data.get('site_id', ''),
             is_still_using=data.get('isStillUsing', '')
         )
+
+    # Schema of request bodies, compiled once into validate_fields
+    SCHEMA = {
+        'id': Field(str),
+        'name': Field(str),
+        'siteId': Field(str, required=False),
+        'stillUsing': Field(bool, required=False)
+    }
+    validate_fields = staticmethod(compile_schema('BoaEnv', SCHEMA))
@@ -1,7 +1,12 @@
+from schema import Field, compile_schema
+
 class Client:
     """Entity class representing a Client."""
     
     # Create a single DAO instance for all client operations
+
+    __slots__ = ('client_id', 'client_name', 'client_desc', 'tpp_id', 'client_secret',
+                 'logo_uri', 'uri', 'contacts', 'status')
     
     def __init__(self, client_id: str, client_name: str, client_desc: str,
                  tpp_id: str, client_secret: str, logo_uri: str, uri: str,
@@ -46,24 +51,45 @@ class Client:
             status=data.get('status', 'active')
         )
 
-    @staticmethod
-    def validate_fields(data: dict) -> None:
-        """Validate client data fields."""
-        required_fields = {
-            'clientId': str,
-            'clientName': str,
-            'clientDesc': str,
-            'tppId': str,
-            'clientSecret': str,
-            'logoUri': str,
-            'uri': str,
-            'contacts': list
-        }
+    # Stored fields and their defaults, in to_dict() order
+    _DEFAULTS = {
+        'clientId': '',
+        'clientName': '',
+        'clientDesc': '',
+        'tppId': '',
+        'clientSecret': '',
+        'logoUri': '',
+        'uri': '',
+        'contacts': [],
+        'status': 'active'
+    }
+
+    @classmethod
+    def to_record(cls, data: dict, partial: bool = False) -> dict:
+        """
+        Return the stored form of client data, as from_dict(data).to_dict() would.
+
+        With partial set, return only the known fields present in data, to
+        apply as changes to a stored record.
+        """
+        if partial:
+            return {field: data[field] for field in cls._DEFAULTS if field in data}
+        record = {field: data.get(field, default) for field, default in cls._DEFAULTS.items()}
+        if 'contacts' not in data:
+            # A list per record, not the shared default
+            record['contacts'] = []
+        return record
 
-        for field, field_type in required_fields.items():
-            if field not in data:
-                raise ValueError(f"Missing required field: {field}")
-            if not isinstance(data[field], field_type):
-                raise TypeError(f"Invalid type for {field}: expected {field_type.__name__}")
-            if field == 'contacts' and not all(isinstance(x, str) for x in data[field]):
-                raise TypeError("All contacts must be strings")
+    # Schema of request bodies, compiled once into validate_fields
+    SCHEMA = {
+        'clientId': Field(str),
+        'clientName': Field(str),
+        'clientDesc': Field(str),
+        'tppId': Field(str),
+        'clientSecret': Field(str),
+        'logoUri': Field(str),
+        'uri': Field(str),
+        'contacts': Field(list, items=str),
+        'status': Field(str, required=False)
+    }
+    validate_fields = staticmethod(compile_schema('Client', SCHEMA))
@@ -6,22 +6,24 @@ class ClientService(BaseService):
     """Service class for handling Client operations."""
 
     @classmethod
-    def initialize_dao(cls, cache_storage):
+    def initialize_dao(cls, cache_storage, database=None, columnar=False):
         """Initialize the Client DAO."""
-        super().initialize_dao(cache_storage, 'client', 'clientId')
+        super().initialize_dao(cache_storage, 'client', 'clientId',
+                                 indexed_fields=('tppId', 'status'), database=database,
+                                 columnar=columnar)
 
     @classmethod
     @routing('/api/clients', 'POST')
-    def create(cls, data: dict) -> Client:
+    def create(cls, data: dict) -> dict:
         """Create a new Client instance."""
         Client.validate_fields(data)
         return super().create(data, Client)
 
     @classmethod
     @routing('/api/clients/{id}', 'PATCH')
-    def update(cls, id: str, data: dict) -> Client:
-        """Update an existing Client instance."""
-        Client.validate_fields(data)
+    def update(cls, id: str, data: dict) -> dict:
+        """Update the fields of an existing Client given in data."""
+        Client.validate_fields(data, partial=True)
         return super().update(id, data, Client)
 
     @classmethod
@@ -38,10 +40,28 @@ class ClientService(BaseService):
         return super().delete_batch(client_ids)
 
     @classmethod
-    @routing('/api/clients', 'GET')
-    def get_all(cls) -> list:
-        """Return all clients."""
-        return super().get_all()
+    @routing('/api/clientsBatch', 'POST')
+    def create_batch(cls, data: dict) -> dict:
+        """Create multiple clients."""
+        return super().create_batch(data.get('clients', []), Client, Client.validate_fields)
+
+    @classmethod
+    @routing('/api/clientsBatch', 'PATCH')
+    def upsert_batch(cls, data: dict) -> dict:
+        """Create multiple clients, replacing those whose ID exists."""
+        return super().upsert_batch(data.get('clients', []), Client, Client.validate_fields)
+
+    @classmethod
+    @routing('/api/clients', 'GET', query=('limit', 'cursor'), listing=True)
+    def get_all(cls, limit: str = None, cursor: str = None):
+        """Return all clients, or one page of them."""
+        return super().get_all(limit, cursor)
+
+    @classmethod
+    @routing('/api/tpps/{id}/clients', 'GET', resource=('client',))
+    def get_by_tpp(cls, id: str) -> list:
+        """Get the clients whose tppId is the given TPP ID, through the tppId index."""
+        return cls._dao.get_batch({'tppId': id})
 
     @classmethod
     @routing('/api/clients/{id}', 'GET')
@@ -0,0 +1,543 @@
+import json
+import os
+import queue
+import threading
+import weakref
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+from fragments import FragmentCache
+from records import RecordEncoder, materialize
+
+# Collections whose tombstones passed COMPACTION_RATIO, compacted by one background thread
+_compaction_queue = queue.SimpleQueue()
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def _schedule_compaction(collection: 'Collection') -> None:
+    """Hand a collection to the background compactor, starting it if needed."""
+    global _compactor
+    with _compactor_lock:
+        # Also restarts the compactor in a forked child, where threads do not survive
+        if _compactor is None or not _compactor.is_alive():
+            _compactor = threading.Thread(target=_compact_forever, name='compactor', daemon=True)
+            _compactor.start()
+    _compaction_queue.put(collection)
+
+
+def _reset_compactor() -> None:
+    """Forget the compactor in a forked child, where its thread and any lock it held are gone."""
+    global _compaction_queue, _compactor, _compactor_lock
+    _compaction_queue = queue.SimpleQueue()
+    _compactor = None
+    _compactor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_compactor)
+
+
+def _compact_forever() -> None:
+    """Compact scheduled collections, one at a time."""
+    while True:
+        collection = _compaction_queue.get()
+        collection._compaction_scheduled = False
+        collection.compact()
+        collection._maybe_compact()
+
+
+def _tokens(value: Any) -> set:
+    """Return the distinct whitespace-separated tokens of a string value."""
+    return set(value.split()) if isinstance(value, str) else set()
+
+
+class _Store:
+    """Dense slot storage of a collection, replaced as a whole on compaction."""
+
+    __slots__ = ('items', 'seqs', 'versions', 'index')
+
+    def __init__(self):
+        # Record of each slot, None for tombstones
+        self.items = []
+        # Insertion sequence of each slot; strictly increasing, survives compaction
+        self.seqs = []
+        # Collection version at the last write of each slot
+        self.versions = []
+        # Primary key -> slot position
+        self.index = {}
+
+
+class _Snapshot(list):
+    """Materialized records of one version, shared while any reader holds it."""
+
+    __slots__ = ('__weakref__',)
+
+
+class Listing:
+    """Stored records of one version, serialized without materializing them as dicts."""
+
+    __slots__ = ('_records', '_fragments')
+
+    def __init__(self, records: List[Any], fragments: Optional[FragmentCache]):
+        self._records = records
+        self._fragments = fragments
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def json_fragments(self) -> List[bytes]:
+        """Return the JSON encoding of each record, reusing cached encodings."""
+        if self._fragments is None:
+            return [json.dumps(materialize(record)).encode() for record in self._records]
+        return self._fragments.encode_all(self._records)
+
+
+class Collection:
+    """In-memory collection of records indexed by their primary key.
+
+    Writers serialize on a per-collection lock. Readers never take it for
+    full listings or point lookups: they read immutable snapshots published
+    per version, or a slot of the current store, which writers only ever
+    grow or overwrite and compaction replaces in a single assignment.
+
+    Records are stored as compact Records sharing repeated values (see
+    records.RecordEncoder); every read returns new dicts. Full listings
+    can also be serialized from a FragmentCache of encoded records,
+    without materializing any dict (see listing()).
+
+    Deletes leave a tombstone in their slot. Once tombstones pass
+    COMPACTION_RATIO of the slots, a background thread rebuilds the dense
+    storage while writers carry on.
+    """
+
+    # Compact the dense storage in the background once this share of slots are tombstones
+    COMPACTION_RATIO = 0.5
+    # Appended slots a compaction copies while holding the lock, after up to this many rounds without it
+    COMPACTION_LOCKED_TAIL = 1024
+    COMPACTION_CATCH_UP_ROUNDS = 8
+
+    def __init__(self, id_field: str, items: List[Dict[str, Any]] = None,
+                 fragments: FragmentCache = None):
+        """
+        Initialize an empty collection.
+
+        Args:
+            id_field: The field name used as identifier (e.g., 'clientId')
+            items: Optional records to load into the collection
+            fragments: Cache of the JSON encoding of records, told of every
+                record replaced or deleted
+        """
+        self.id_field = id_field
+        self._fragments = fragments
+        # Held by writers; callers may hold it to make several writes atomic
+        self.lock = threading.RLock()
+        self._store = _Store()
+        self._next_seq = 1
+        # Bumped on every mutation
+        self.version = 0
+        # (version, live stored records) published for lock-free readers
+        self._snapshot = (0, [])
+        # (version, weak reference to the dicts materialized from that snapshot)
+        self._materialized = (0, weakref.ref(_Snapshot()))
+        self._tombstones = 0
+        self._secondary = {}
+        # Field -> {token: record IDs} for fields holding whitespace-separated lists
+        self._inverted = {}
+        self._encoder = RecordEncoder()
+        self._compaction_scheduled = False
+        # Slots overwritten while a compaction copies the store, None when idle
+        self._dirty = None
+        if items:
+            self.load(items)
+
+    def __len__(self) -> int:
+        return len(self._store.index)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._store.index
+
+    def load(self, items: List[Dict[str, Any]]) -> None:
+        """Replace the contents of the collection with the given records."""
+        with self.lock:
+            for item in self._store.items:
+                if item is not None:
+                    self._discard_fragment(item)
+            self._store = _Store()
+            self._tombstones = 0
+            for field in self._secondary:
+                self._secondary[field] = {}
+            for field in self._inverted:
+                self._inverted[field] = {}
+            self.version += 1
+            for item in items:
+                self.add(item)
+
+    def create_index(self, field: str) -> None:
+        """Maintain a secondary hash index from field value to record IDs."""
+        with self.lock:
+            if field == self.id_field or field in self._secondary:
+                return
+            buckets = self._secondary[field] = {}
+            for item in self._store.items:
+                if item is not None:
+                    buckets.setdefault(item.get(field), set()).add(item.get(self.id_field))
+
+    def create_token_index(self, field: str) -> None:
+        """Maintain an inverted index from each whitespace-separated token of a field to record IDs."""
+        with self.lock:
+            if field in self._inverted:
+                return
+            buckets = self._inverted[field] = {}
+            for item in self._store.items:
+                if item is not None:
+                    for token in _tokens(item.get(field)):
+                        buckets.setdefault(token, set()).add(item.get(self.id_field))
+
+    def items(self) -> List[Dict[str, Any]]:
+        """
+        Return the live records in insertion order.
+
+        The list is shared by all concurrent readers of the same version and
+        must not be modified. It is only weakly cached, so the dicts are
+        freed once the last reader drops them and only the compact records
+        stay in memory.
+        """
+        version, records = self._records()
+        materialized_version, reference = self._materialized
+        snapshot = reference() if materialized_version == version else None
+        if snapshot is None:
+            snapshot = _Snapshot(map(materialize, records))
+            self._materialized = (version, weakref.ref(snapshot))
+        return snapshot
+
+    def listing(self) -> Listing:
+        """Return the live stored records for serialization, in insertion order."""
+        _, records = self._records()
+        return Listing(records, self._fragments)
+
+    def _records(self) -> Tuple[int, List[Any]]:
+        """Return the current version and its live stored records, rebuilt at most once per version."""
+        version, snapshot = self._snapshot
+        if version == self.version:
+            return version, snapshot
+
+        with self.lock:
+            if self._snapshot[0] != self.version:
+                live = [item for item in self._store.items if item is not None]
+                self._snapshot = (self.version, live)
+            return self._snapshot
+
+    def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        """Return the record with the given ID as a new dict, or None if not found."""
+        store = self._store
+        position = store.index.get(item_id)
+        if position is None:
+            return None
+        return materialize(store.items[position])
+
+    def item_version(self, item_id: str) -> Optional[int]:
+        """Return the collection version at the last write of a record, or None if not found."""
+        store = self._store
+        position = store.index.get(item_id)
+        if position is None:
+            return None
+        return store.versions[position]
+
+    def page(self, limit: int, after: int = 0) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Return up to limit live records inserted after the given sequence.
+
+        Sequences only grow, so a page boundary stays valid while records
+        are inserted (they sort after it) or deleted (they are skipped).
+
+        Args:
+            limit: Maximum number of records to return
+            after: Sequence of the last record of the previous page, 0 to start
+
+        Returns:
+            The records and the sequence to continue after, or None at the end
+        """
+        store = self._store
+        page = []
+        last_seq = after
+        position = bisect_right(store.seqs, after)
+        while position < len(store.items):
+            item = store.items[position]
+            if item is not None:
+                if len(page) == limit:
+                    return page, last_seq
+                page.append(materialize(item))
+                last_seq = store.seqs[position]
+            position += 1
+        return page, None
+
+    def find(self, filter_params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Return the live records matching every field/value pair.
+
+        Indexed fields are answered from the secondary indexes, smallest
+        candidate set first; the remaining fields are checked by scanning
+        the candidates only.
+        """
+        id_lookup = self.id_field in filter_params
+        if id_lookup:
+            item = self.get(filter_params[self.id_field])
+            candidates = [item] if item is not None else []
+        else:
+            with self.lock:
+                id_sets = sorted(
+                    (self._secondary[field].get(value, ())
+                     for field, value in filter_params.items() if field in self._secondary),
+                    key=len
+                )
+                if id_sets:
+                    store = self._store
+                    smallest, rest = id_sets[0], id_sets[1:]
+                    positions = sorted(
+                        store.index[item_id] for item_id in smallest
+                        if all(item_id in ids for ids in rest)
+                    )
+                    candidates = [materialize(store.items[position]) for position in positions]
+            if not id_sets:
+                candidates = self.items()
+
+        # A point lookup answers the ID only; every other field is checked on its single candidate
+        unindexed = [
+            (field, value) for field, value in filter_params.items()
+            if field != self.id_field and (id_lookup or field not in self._secondary)
+        ]
+        for field, value in unindexed:
+            candidates = [item for item in candidates if item.get(field) == value]
+        return candidates
+
+    def find_tokens(self, field: str, tokens: List[str],
+                    match_all: bool = True) -> List[Dict[str, Any]]:
+        """
+        Return the live records whose field lists all, or any, of the given tokens.
+
+        Answered by intersecting (or uniting) the ID sets of the tokens in
+        the inverted index of the field, smallest first.
+
+        Raises:
+            KeyError: If the field has no token index
+        """
+        with self.lock:
+            buckets = self._inverted[field]
+            id_sets = sorted((buckets.get(token, set()) for token in set(tokens)), key=len)
+            if not id_sets:
+                ids = self._store.index if match_all else ()
+            elif match_all:
+                ids = id_sets[0].intersection(*id_sets[1:])
+            else:
+                ids = set().union(*id_sets)
+            store = self._store
+            positions = sorted(store.index[item_id] for item_id in ids)
+            return [materialize(store.items[position]) for position in positions]
+
+    def add(self, item: Dict[str, Any]) -> None:
+        """
+        Append a record to the collection.
+
+        Raises:
+            ValueError: If a record with the same ID already exists
+        """
+        with self.lock:
+            store = self._store
+            item_id = item.get(self.id_field)
+            if item_id in store.index:
+                raise ValueError(f"Duplicate {self.id_field}: {item_id}")
+            item = self._encoder.encode(item)
+
+            self.version += 1
+            # Fill the slot before publishing it in the index
+            store.seqs.append(self._next_seq)
+            store.versions.append(self.version)
+            store.items.append(item)
+            store.index[item_id] = len(store.items) - 1
+            self._next_seq += 1
+            self._index_secondary(item_id, item)
+
+    def update(self, item_id: str, item: Dict[str, Any]) -> bool:
+        """
+        Replace the record with the given ID in place.
+
+        Returns:
+            True if the record was replaced, False if not found
+
+        Raises:
+            ValueError: If the record is re-keyed onto an existing ID
+        """
+        with self.lock:
+            store = self._store
+            position = store.index.get(item_id)
+            if position is None:
+                return False
+
+            new_id = item.get(self.id_field, item_id)
+            if new_id != item_id and new_id in store.index:
+                raise ValueError(f"Duplicate {self.id_field}: {new_id}")
+            item = self._encoder.encode(item)
+
+            self._unindex_secondary(item_id, store.items[position])
+            self._discard_fragment(store.items[position])
+            if self._dirty is not None:
+                self._dirty.append(position)
+            self.version += 1
+            store.versions[position] = self.version
+            store.items[position] = item
+            if new_id != item_id:
+                store.index[new_id] = position
+                del store.index[item_id]
+            self._index_secondary(new_id, item)
+            return True
+
+    def delete(self, item_id: str) -> bool:
+        """
+        Delete the record with the given ID in constant time.
+
+        The slot is left as a tombstone so that other positions stay valid;
+        the storage is compacted in the background once tombstones pass
+        COMPACTION_RATIO.
+
+        Returns:
+            True if the record was deleted, False if not found
+        """
+        with self.lock:
+            store = self._store
+            position = store.index.pop(item_id, None)
+            if position is None:
+                return False
+
+            self._unindex_secondary(item_id, store.items[position])
+            self._discard_fragment(store.items[position])
+            if self._dirty is not None:
+                self._dirty.append(position)
+            store.items[position] = None
+            self._tombstones += 1
+            self.version += 1
+            self._maybe_compact()
+            return True
+
+    def after_fork(self) -> None:
+        """
+        Make the collection usable in a forked child.
+
+        The fork must happen while the forking thread holds the lock, so no
+        write or compaction patch is half applied; the child gets a fresh
+        lock, drops any compaction the parent was running and schedules its
+        own if needed.
+        """
+        self.lock = threading.RLock()
+        self._dirty = None
+        self._compaction_scheduled = False
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        """Schedule a background compaction if tombstones passed COMPACTION_RATIO."""
+        with self.lock:
+            if (not self._compaction_scheduled
+                    and self._tombstones > len(self._store.items) * self.COMPACTION_RATIO):
+                self._compaction_scheduled = True
+                _schedule_compaction(self)
+
+    def compact(self) -> bool:
+        """
+        Rebuild the dense storage without tombstones.
+
+        Live slots, including most slots appended meanwhile, are copied
+        without holding the lock. Slots that writers overwrite or delete
+        meanwhile are recorded and patched, and the last appended slots are
+        copied, under the lock just before the new store is published.
+        Writers are therefore only held up for the slots written during the
+        copy.
+
+        Returns:
+            True if the storage was replaced, False if a compaction was
+            already running or the collection was reloaded meanwhile
+        """
+        with self.lock:
+            if self._dirty is not None:
+                return False
+            store = self._store
+            copied = len(store.items)
+            self._dirty = []
+
+        try:
+            new = _Store()
+            # Old position -> new position of every copied slot
+            moved = {}
+
+            def copy(start, end):
+                for position in range(start, end):
+                    item = store.items[position]
+                    if item is not None:
+                        moved[position] = len(new.items)
+                        new.index[item.get(self.id_field)] = len(new.items)
+                        new.items.append(item)
+                        new.seqs.append(store.seqs[position])
+                        new.versions.append(store.versions[position])
+
+            copy(0, copied)
+            # Catch up with slots appended during the copy, leaving a short tail for the lock
+            for _ in range(self.COMPACTION_CATCH_UP_ROUNDS):
+                end = len(store.items)
+                if end - copied <= self.COMPACTION_LOCKED_TAIL:
+                    break
+                copy(copied, end)
+                copied = end
+
+            with self.lock:
+                if self._store is not store:
+                    return False
+                tombstones = 0
+                for position in set(self._dirty):
+                    new_position = moved.get(position)
+                    if new_position is None:
+                        # Appended after the copy, or a tombstone already
+                        continue
+                    stale_id = new.items[new_position].get(self.id_field)
+                    if new.index.get(stale_id) == new_position:
+                        del new.index[stale_id]
+                    item = store.items[position]
+                    new.items[new_position] = item
+                    new.versions[new_position] = store.versions[position]
+                    if item is None:
+                        tombstones += 1
+                    else:
+                        new.index[item.get(self.id_field)] = new_position
+                copy(copied, len(store.items))
+                self._store = new
+                self._tombstones = tombstones
+                return True
+        finally:
+            with self.lock:
+                self._dirty = None
+
+    def _discard_fragment(self, item: Any) -> None:
+        """Drop the cached encoding of a record being replaced or deleted."""
+        if self._fragments is not None:
+            self._fragments.discard(item)
+
+    def _index_secondary(self, item_id: str, item: Dict[str, Any]) -> None:
+        """Add a record to every secondary and token index."""
+        for field, buckets in self._secondary.items():
+            buckets.setdefault(item.get(field), set()).add(item_id)
+        for field, buckets in self._inverted.items():
+            for token in _tokens(item.get(field)):
+                buckets.setdefault(token, set()).add(item_id)
+
+    def _unindex_secondary(self, item_id: str, item: Dict[str, Any]) -> None:
+        """Remove a record from every secondary and token index."""
+        for field, buckets in self._secondary.items():
+            value = item.get(field)
+            ids = buckets.get(value)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del buckets[value]
+        for field, buckets in self._inverted.items():
+            for token in _tokens(item.get(field)):
+                ids = buckets.get(token)
+                if ids is not None:
+                    ids.discard(item_id)
+                    if not ids:
+                        del buckets[token]
@@ -0,0 +1,259 @@
+import json
+import threading
+import time
+import unittest
+import unittest.mock
+from collection import Collection
+from fragments import FragmentCache
+from records import Record
+import records
+
+class _WriteDuringCopy(list):
+    """Slot list that runs a callback when the compactor copies a given slot."""
+
+    def __init__(self, items, position, callback):
+        super().__init__(items)
+        self.position = position
+        self.callback = callback
+
+    def __getitem__(self, position):
+        if position == self.position and self.callback is not None:
+            callback, self.callback = self.callback, None
+            callback()
+        return super().__getitem__(position)
+
+class TestCollection(unittest.TestCase):
+    """Test cases for tombstones and compaction in Collection."""
+
+    def setUp(self):
+        """Build a collection of 100 records."""
+        self.collection = Collection('id', [{'id': str(i), 'value': i} for i in range(100)])
+
+    def ids(self):
+        """Return the live IDs in insertion order."""
+        return [item['id'] for item in self.collection.items()]
+
+    def assertIndexed(self):
+        """Assert that every live record is found under its own ID."""
+        for item in self.collection.items():
+            self.assertEqual(self.collection.get(item['id']), item)
+        self.assertEqual(len(self.collection), len(self.collection.items()))
+
+    def test_compaction_patches_concurrent_writes(self):
+        """Test that writes made while the compactor copies are carried into the new store."""
+        with self.collection.lock:
+            self.collection.COMPACTION_RATIO = 1.0
+            for i in range(0, 40):
+                self.collection.delete(str(i))
+
+        def write():
+            self.collection.delete('41')
+            self.collection.update('42', {'id': 'renamed', 'value': 42})
+            self.collection.update('80', {'id': '80', 'value': 'changed'})
+            self.collection.delete('90')
+            self.collection.add({'id': '41', 'value': 'readded'})
+
+        store = self.collection._store
+        store.items = _WriteDuringCopy(store.items, 60, write)
+        self.assertTrue(self.collection.compact())
+
+        expected = ['40', 'renamed'] + [str(i) for i in range(43, 100) if i != 90] + ['41']
+        self.assertEqual(self.ids(), expected)
+        self.assertIsNot(self.collection._store, store)
+        # '41' was already copied and stays a tombstone; '90' was deleted before its copy
+        self.assertEqual(len(self.collection._store.items), 60)
+        self.assertEqual(self.collection._tombstones, 1)
+        self.assertEqual(self.collection.get('80')['value'], 'changed')
+        self.assertEqual(self.collection.get('41')['value'], 'readded')
+        self.assertIsNone(self.collection.get('42'))
+        self.assertIsNone(self.collection.get('90'))
+        self.assertIndexed()
+
+        page, after = self.collection.page(5, 0)
+        self.assertEqual([item['id'] for item in page], ['40', 'renamed', '43', '44', '45'])
+        self.assertEqual(self.collection.page(5, after)[0][0]['id'], '46')
+
+    def test_background_compaction(self):
+        """Test that passing the tombstone ratio compacts the storage without a caller waiting."""
+        for i in range(60):
+            self.collection.delete(str(i))
+        deadline = time.monotonic() + 5
+        while self.collection._tombstones and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.collection._tombstones, 0)
+        self.assertEqual(len(self.collection._store.items), 40)
+        self.assertEqual(self.ids(), [str(i) for i in range(60, 100)])
+        self.assertIndexed()
+
+    def test_compaction_under_concurrent_writers(self):
+        """Test that repeated compactions converge with a single-threaded model of the writes."""
+        model = {item['id']: item for item in self.collection.items()}
+        done = threading.Event()
+
+        def write():
+            for i in range(3000):
+                item_id = str(i % 150)
+                if item_id in model and i % 3:
+                    self.collection.delete(item_id)
+                    del model[item_id]
+                elif item_id in model:
+                    item = {'id': item_id, 'value': i}
+                    self.collection.update(item_id, item)
+                    model[item_id] = item
+                else:
+                    item = {'id': item_id, 'value': i}
+                    self.collection.add(item)
+                    model[item_id] = item
+            done.set()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        while not done.is_set():
+            self.collection.compact()
+        writer.join()
+        self.collection.compact()
+
+        self.assertEqual(self.ids(), list(model))
+        self.assertEqual(self.collection.items(), list(model.values()))
+        self.assertIndexed()
+
+class TestTokenIndex(unittest.TestCase):
+    """Test cases for inverted indexes over whitespace-separated list fields."""
+
+    def setUp(self):
+        """Build a collection of records with scope lists and index them."""
+        self.collection = Collection('id', [
+            {'id': '1', 'scopes': 'read write'},
+            {'id': '2', 'scopes': 'read'},
+            {'id': '3', 'scopes': 'admin  read write'},
+            {'id': '4', 'scopes': None},
+        ])
+        self.collection.create_token_index('scopes')
+
+    def ids(self, tokens, match_all=True):
+        """Return the IDs of the records holding the tokens."""
+        return [item['id'] for item in self.collection.find_tokens('scopes', tokens, match_all)]
+
+    def test_and_or_queries(self):
+        """Test intersections and unions of token sets."""
+        test_cases = [
+            # (tokens, match_all, expected_ids)
+            (['read'], True, ['1', '2', '3']),
+            (['read', 'write'], True, ['1', '3']),
+            (['write', 'admin'], True, ['3']),
+            (['admin', 'missing'], True, []),
+            (['admin', 'write'], False, ['1', '3']),
+            (['missing'], False, []),
+            ([], True, ['1', '2', '3', '4']),
+        ]
+        for tokens, match_all, expected_ids in test_cases:
+            with self.subTest(tokens=tokens, match_all=match_all):
+                self.assertEqual(self.ids(tokens, match_all), expected_ids)
+
+    def test_index_follows_mutations(self):
+        """Test that writes, reloads and compaction keep the inverted index in sync."""
+        self.collection.update('1', {'id': 'one', 'scopes': 'admin'})
+        self.collection.delete('3')
+        self.collection.add({'id': '5', 'scopes': 'write read'})
+        self.assertEqual(self.ids(['admin']), ['one'])
+        self.assertEqual(self.ids(['write', 'read']), ['5'])
+        self.assertNotIn('write', self.collection._inverted['scopes'].get('admin', ()))
+
+        self.collection.compact()
+        self.assertEqual(self.ids(['read']), ['2', '5'])
+        self.collection.load([{'id': '9', 'scopes': 'read'}])
+        self.assertEqual(self.ids(['read']), ['9'])
+        self.assertEqual(self.ids(['admin']), [])
+
+class TestRecordStorage(unittest.TestCase):
+    """Test cases for the compact record representation of stored items."""
+
+    def make_client(self, i, **overrides):
+        """Build a client whose strings are all separate objects."""
+        client = {'clientId': f'c{i}', 'tppId': ''.join(['TPP', '1']), 'status': 'active'[:],
+                  'contacts': [''.join(['ops@', 'example.com'])], 'stillUsing': True}
+        client.update(overrides)
+        return client
+
+    def test_records_share_repeated_values(self):
+        """Test that records are slotted and point at one copy of each repeated value."""
+        collection = Collection('clientId', [self.make_client(i) for i in range(3)])
+        first, second = (collection._store.items[position] for position in range(2))
+        self.assertIsInstance(first, Record)
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertIs(type(first), type(second))
+        self.assertIs(first.get('tppId'), second.get('tppId'))
+        self.assertIs(first.get('contacts'), second.get('contacts'))
+
+    def test_reads_return_independent_dicts(self):
+        """Test that every read returns new dicts equal to what was stored."""
+        collection = Collection('clientId', [self.make_client(i) for i in range(3)])
+        client = collection.get('c1')
+        self.assertEqual(client, self.make_client(1))
+        self.assertIs(type(client['contacts']), list)
+
+        client['contacts'].append('changed')
+        client['status'] = 'changed'
+        self.assertEqual(collection.get('c1'), self.make_client(1))
+        self.assertEqual(collection.get('c2')['contacts'], ['ops@example.com'])
+        self.assertEqual(collection.items()[1], self.make_client(1))
+        self.assertEqual(collection.page(1, 1)[0], [self.make_client(1)])
+        self.assertEqual(collection.find({'tppId': 'TPP1', 'clientId': 'c2'}), [self.make_client(2)])
+
+    def test_high_cardinality_fields_are_not_pooled(self):
+        """Test that a field stops being pooled once it passes POOL_LIMIT distinct values."""
+        with unittest.mock.patch.object(records, 'POOL_LIMIT', 4):
+            collection = Collection('clientId', [self.make_client(i, tppId=f'TPP{i}') for i in range(6)])
+        self.assertIsNone(collection._encoder._pools['tppId'])
+        self.assertIsNotNone(collection._encoder._pools['status'])
+        self.assertEqual([item['tppId'] for item in collection.items()], [f'TPP{i}' for i in range(6)])
+
+class TestFragmentCache(unittest.TestCase):
+    """Test cases for the cached JSON encoding of stored records."""
+
+    def setUp(self):
+        """Build a collection of 10 records sharing a fragment cache."""
+        self.fragments = FragmentCache()
+        self.collection = Collection('id', [{'id': str(i), 'tags': ['a', 'b'], 'value': i}
+                                            for i in range(10)], fragments=self.fragments)
+
+    def encode(self):
+        """Return a listing of the collection as one JSON array."""
+        return b'[' + b', '.join(self.collection.listing().json_fragments()) + b']'
+
+    def test_fragments_match_json_dumps(self):
+        """Test that joined fragments are byte-identical to encoding the listing."""
+        self.assertEqual(self.encode(), json.dumps(self.collection.items()).encode())
+        self.assertEqual(self.encode(), json.dumps(self.collection.items()).encode())
+        stats = self.fragments.stats()
+        self.assertEqual((stats['entries'], stats['misses'], stats['hits']), (10, 10, 10))
+
+    def test_writes_refresh_only_their_record(self):
+        """Test that an update or delete drops only the encoding of that record."""
+        self.encode()
+        self.collection.update('3', {'id': '3', 'tags': [], 'value': 'changed'})
+        self.collection.delete('5')
+        self.assertEqual(self.fragments.stats()['entries'], 8)
+        self.assertEqual(self.encode(), json.dumps(self.collection.items()).encode())
+        self.assertEqual(self.fragments.stats()['misses'], 11)
+
+        self.collection.load([])
+        self.assertEqual(self.fragments.stats()['entries'], 0)
+
+    def test_budget_evicts_least_recently_used(self):
+        """Test that entries are evicted past the budget and a budget of 0 disables caching."""
+        self.encode()
+        cost = self.fragments.stats()['bytes'] // 10
+        self.fragments.resize(cost * 4)
+        stats = self.fragments.stats()
+        self.assertEqual((stats['entries'], stats['evictions']), (4, 6))
+        self.assertLessEqual(stats['bytes'], stats['budget'])
+        self.assertEqual(self.encode(), json.dumps(self.collection.items()).encode())
+
+        self.fragments.resize(0)
+        self.assertEqual(self.encode(), json.dumps(self.collection.items()).encode())
+        self.assertEqual(self.fragments.stats()['entries'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+import copy
+import threading
+import weakref
+from typing import Any, Dict, List, TypeVar
+from data_access import DaoImplementation
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; only ColumnarDao needs it
+    np = None
+
+T = TypeVar('T')
+
+# Rows allocated per column up front; the capacity doubles when full
+INITIAL_CAPACITY = 1024
+# Rebuild the columns once this share of their rows are deleted
+COMPACTION_RATIO = 0.5
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _copy(value: Any) -> Any:
+    """Return a value that shares no mutable state with the caller's."""
+    return value if type(value) in _SCALARS else copy.deepcopy(value)
+
+
+class ColumnarDao(DaoImplementation):
+    """Data Access Object filtering entities as NumPy columns.
+
+    Writes go to the cache storage as with DaoImplementation, so the
+    write-ahead log, replication and ETags work unchanged; a cache listener
+    mirrors each mutation into row-aligned columns. Categorical fields are
+    stored as integer codes into a per-field category list, every other
+    field as an object array. Filters and counts are evaluated as boolean
+    masks over whole columns, and only the matching rows are turned back
+    into dicts. Point lookups, pages and full listings are left to the
+    cache, which answers them without a scan.
+
+    If the cache changes without notifying listeners (e.g. it is reloaded),
+    the next read rebuilds the columns from it.
+    """
+
+    def __init__(self, cache_storage, cache_type: str, id_field: str = 'id',
+                 categorical_fields: List[str] = (), token_fields: List[str] = ()):
+        """
+        Initialize DAO over columns mirrored from the cache storage.
+
+        Args:
+            cache_storage: The cache storage instance
+            cache_type: The type of entity in cache (e.g., 'client', 'tpp')
+            id_field: The field name used as identifier (default: 'id')
+            categorical_fields: Low-cardinality fields to store as category codes
+            token_fields: Whitespace-separated list fields to keep inverted indexes on in the cache
+
+        Raises:
+            ImportError: If NumPy is not installed
+        """
+        if np is None:
+            raise ImportError("ColumnarDao requires NumPy")
+        super().__init__(cache_storage, cache_type, id_field, token_fields=token_fields)
+        self.categorical_fields = tuple(field for field in categorical_fields if field != id_field)
+        self._lock = threading.Lock()
+        # Cache version the columns reflect; -1 until first loaded
+        self._version = -1
+        self._load([])
+
+        # Registered weakly, so a DAO replaced by initialize_dao stops mirroring once dropped
+        reference = weakref.WeakMethod(self._apply)
+
+        def listener(*mutation):
+            apply = reference()
+            if apply is not None:
+                apply(*mutation)
+
+        self._unregister = weakref.finalize(self, cache_storage.remove_listener, listener)
+        cache_storage.add_listener(listener)
+
+    def _load(self, items: List[Dict[str, Any]]) -> None:
+        """Replace the columns with the given records."""
+        self._size = 0
+        self._capacity = max(INITIAL_CAPACITY, len(items))
+        self._deleted = 0
+        self._live = np.zeros(self._capacity, dtype=bool)
+        # Field order of each row, as codes into _layouts
+        self._layout = np.zeros(self._capacity, dtype=np.int32)
+        self._layouts = []
+        self._layout_codes = {}
+        self._codes = {field: np.zeros(self._capacity, dtype=np.int32)
+                       for field in self.categorical_fields}
+        self._categories = {field: [] for field in self.categorical_fields}
+        self._category_codes = {field: {} for field in self.categorical_fields}
+        self._columns = {self.id_field: np.full(self._capacity, None, dtype=object)}
+        # Primary key -> row
+        self._rows = {}
+        for item in items:
+            self._append(item)
+
+    def _sync(self) -> None:
+        """Rebuild the columns if the cache changed without notifying them."""
+        if self.cache_storage.get_version(self.cache_type) == self._version:
+            return
+        # Writers notify under the cache locks, so no mutation is half applied here
+        with self.cache_storage.locked():
+            with self._lock:
+                version = self.cache_storage.get_version(self.cache_type)
+                if version != self._version:
+                    self._load(self.cache_storage.get_items(self.cache_type))
+                    self._version = version
+
+    def _apply(self, operation: str, cache_type: str, *args) -> None:
+        """CacheStorage listener: mirror a mutation into the columns."""
+        if cache_type != self.cache_type:
+            return
+        with self._lock:
+            version = self.cache_storage.get_version(cache_type)
+            # Every mutation bumps the version by one; after a gap, wait for _sync()
+            if self._version != version - 1:
+                return
+            if operation == 'add':
+                self._append(args[0])
+            elif operation == 'update':
+                self._write_row(self._rows.pop(args[0]), args[1])
+            elif operation == 'delete':
+                self._remove(args[0])
+            self._version = version
+
+    def _append(self, item: Dict[str, Any]) -> None:
+        """Write a record to a new row."""
+        if self._size == self._capacity:
+            self._resize(self._capacity * 2)
+        self._size += 1
+        self._live[self._size - 1] = True
+        self._write_row(self._size - 1, item)
+
+    def _write_row(self, row: int, item: Dict[str, Any]) -> None:
+        """Store a record in a row and index it under its ID."""
+        fields = tuple(item)
+        layout = self._layout_codes.get(fields)
+        if layout is None:
+            layout = self._layout_codes[fields] = len(self._layouts)
+            self._layouts.append(fields)
+        self._layout[row] = layout
+
+        for field, codes in self._codes.items():
+            codes[row] = self._category_code(field, item.get(field))
+        for field, column in self._columns.items():
+            column[row] = _copy(item.get(field))
+        for field in fields:
+            if field not in self._columns and field not in self._codes:
+                column = self._columns[field] = np.full(self._capacity, None, dtype=object)
+                column[row] = _copy(item[field])
+        self._rows[item.get(self.id_field)] = row
+
+    def _remove(self, item_id: str) -> None:
+        """Mark the row of a record as deleted, compacting once enough rows are."""
+        self._live[self._rows.pop(item_id)] = False
+        self._deleted += 1
+        if self._deleted > self._size * COMPACTION_RATIO:
+            keep = np.flatnonzero(self._live[:self._size])
+            self._live[:len(keep)] = True
+            self._live[len(keep):self._size] = False
+            for column in [self._layout, *self._codes.values(), *self._columns.values()]:
+                column[:len(keep)] = column[keep]
+                # Drop references held by the freed rows
+                column[len(keep):self._size] = None if column.dtype == object else 0
+            self._size = len(keep)
+            self._deleted = 0
+            ids = self._columns[self.id_field]
+            self._rows = {ids[row]: row for row in range(self._size)}
+
+    def _resize(self, capacity: int) -> None:
+        """Grow every column to the given number of rows."""
+        grow = capacity - self._capacity
+        self._live = np.concatenate([self._live, np.zeros(grow, dtype=bool)])
+        self._layout = np.concatenate([self._layout, np.zeros(grow, dtype=np.int32)])
+        for field, codes in self._codes.items():
+            self._codes[field] = np.concatenate([codes, np.zeros(grow, dtype=np.int32)])
+        for field, column in self._columns.items():
+            self._columns[field] = np.concatenate([column, np.full(grow, None, dtype=object)])
+        self._capacity = capacity
+
+    def _category_code(self, field: str, value: Any) -> int:
+        """Return the code of a categorical value, adding it to the categories if new."""
+        codes = self._category_codes[field]
+        try:
+            code = codes.get(value)
+        except TypeError:
+            # Unhashable values get a category each and are matched by scanning
+            codes = None
+            code = None
+        if code is None:
+            code = len(self._categories[field])
+            self._categories[field].append(_copy(value))
+            if codes is not None:
+                codes[value] = code
+        return code
+
+    def _matching_codes(self, field: str, value: Any) -> List[int]:
+        """Return the codes of the categories equal to a value."""
+        try:
+            code = self._category_codes[field].get(value)
+            return [code] if code is not None else []
+        except TypeError:
+            return [code for code, category in enumerate(self._categories[field]) if category == value]
+
+    def _mask(self, filter_params: Dict[str, Any]):
+        """Return the boolean mask of the live rows matching every field/value pair."""
+        size = self._size
+        mask = self._live[:size].copy()
+        for field, value in filter_params.items():
+            if field == self.id_field and type(value) in _SCALARS:
+                row = self._rows.get(value)
+                matches = np.zeros(size, dtype=bool)
+                if row is not None:
+                    matches[row] = True
+            elif field in self._codes:
+                matches = np.isin(self._codes[field][:size], self._matching_codes(field, value))
+            elif field in self._columns:
+                column = self._columns[field][:size]
+                if type(value) in _SCALARS:
+                    matches = column == value
+                else:
+                    matches = np.frompyfunc(lambda stored: stored == value, 1, 1)(column).astype(bool)
+            else:
+                # A field no record has matches only None, like item.get(field)
+                matches = np.full(size, value is None, dtype=bool)
+            mask &= matches
+        return mask
+
+    def _materialize(self, row: int) -> Dict[str, Any]:
+        """Return the record stored in a row as a new dict."""
+        item = {}
+        for field in self._layouts[self._layout[row]]:
+            if field in self._codes:
+                value = self._categories[field][self._codes[field][row]]
+            else:
+                value = self._columns[field][row]
+            item[field] = _copy(value)
+        return item
+
+    def get_batch(self, filter_params: Dict[str, Any] = None) -> List[T]:
+        """Retrieve multiple entities, optionally filtered."""
+        if not filter_params:
+            return super().get_batch()
+        self._sync()
+        with self._lock:
+            return [self._materialize(row) for row in np.flatnonzero(self._mask(filter_params))]
+
+    def count(self, filter_params: Dict[str, Any] = None) -> int:
+        """Count the entities matching all filter parameters without materializing them."""
+        self._sync()
+        with self._lock:
+            if not filter_params:
+                return self._size - self._deleted
+            return int(np.count_nonzero(self._mask(filter_params)))
+
+    def close(self) -> None:
+        """Stop mirroring cache mutations."""
+        self._unregister()
@@ -0,0 +1,91 @@
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+# Bodies smaller than this are sent uncompressed; the framing overhead outweighs the gain
+MIN_COMPRESS_SIZE = 1024
+COMPRESSION_LEVEL = 6
+# Preferred first when the client accepts both with the same quality
+SUPPORTED_ENCODINGS = ('gzip', 'deflate')
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a content coding from an Accept-Encoding header.
+
+    Returns:
+        'gzip', 'deflate', or None for identity
+    """
+    if not accept_encoding:
+        return None
+
+    qualities = {}
+    for entry in accept_encoding.split(','):
+        coding, _, params = entry.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    wildcard = qualities.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a body with the given content coding."""
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(body) + compressor.flush()
+    if encoding == 'deflate':
+        return zlib.compress(body, COMPRESSION_LEVEL)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class CompressedBodyCache:
+    """LRU cache of compressed response bodies keyed on (route, path parameters, ETag, encoding).
+
+    ETags embed the collection or record version, so a write implicitly
+    invalidates every cached body of the old version; stale entries simply
+    age out of the LRU. The route and its parameters are part of the key,
+    so two routes can never be served each other's body, whatever their
+    ETags.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        Initialize an empty cache.
+
+        Args:
+            max_entries: Number of bodies kept before the least recently used is evicted
+        """
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, route: tuple, etag: str, encoding: str) -> Optional[bytes]:
+        """Return the cached body of a route, given as (route key, path parameters), or None."""
+        key = (route, etag, encoding)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def put(self, route: tuple, etag: str, encoding: str, body: bytes) -> None:
+        """Cache a compressed body of a route, evicting the least recently used one if full."""
+        key = (route, etag, encoding)
+        with self._lock:
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
@@ -1,8 +1,56 @@
+import base64
+import binascii
+import json
+import os
+import sqlite3
+import threading
 from abc import ABC, abstractmethod
 from typing import TypeVar, Generic, List, Optional, Dict, Any
 
 T = TypeVar('T')  # Generic type for the entity
 
+# IDs per statement in batch lookups, below SQLite's bound parameter limit
+SQLITE_BATCH_SIZE = 500
+
+
+def encode_cursor(position: int) -> str:
+    """Encode a page position as an opaque cursor."""
+    return base64.urlsafe_b64encode(str(position).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if position < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return position
+
+def batch_result(key: str, verb: str, success_ids: list, failed_ids: list) -> Dict[str, Any]:
+    """
+    Build the per-item result of a batch operation.
+
+    Args:
+        key: Result key listing the successful IDs (e.g., 'deleted')
+        verb: Infinitive of the operation (e.g., 'delete')
+        success_ids: IDs the operation succeeded for
+        failed_ids: IDs the operation failed for
+    """
+    return {
+        "status": "success" if not failed_ids else "partial",
+        key: success_ids,
+        "failed": failed_ids,
+        "message": f"Successfully {key} {len(success_ids)} items, failed to {verb} {len(failed_ids)} items"
+    }
+
 class Dao(ABC, Generic[T]):
     """Abstract base class for Data Access Objects."""
 
@@ -32,6 +80,56 @@ class Dao(ABC, Generic[T]):
         """
         pass
 
+    @abstractmethod
+    def get_page(self, limit: int, cursor: str = None) -> Dict[str, Any]:
+        """
+        Retrieve one page of entities in a stable order.
+        
+        Args:
+            limit: Maximum number of entities to return
+            cursor: Opaque cursor from the previous page, None for the first page
+            
+        Returns:
+            Dictionary with the page 'items' and the 'nextCursor' (None on the last page)
+            
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        pass
+
+    def count(self, filter_params: Dict[str, Any] = None) -> int:
+        """
+        Count the entities matching the filter.
+
+        Args:
+            filter_params: Optional dictionary of filter parameters
+
+        Returns:
+            Number of entities get_batch would return
+        """
+        return len(self.get_batch(filter_params))
+
+    def find_by_tokens(self, field: str, tokens: List[str], match_all: bool = True) -> List[T]:
+        """
+        Retrieve the entities whose field, a whitespace-separated list, holds the tokens.
+
+        Args:
+            field: Field holding a whitespace-separated list (e.g., 'scopeNameList')
+            tokens: Tokens to look for
+            match_all: True to require every token, False to require any
+
+        Returns:
+            List of matching entities, in insertion order
+        """
+        wanted = set(tokens)
+        matches = []
+        for entity in self.get_batch():
+            value = entity.get(field)
+            present = set(value.split()) if isinstance(value, str) else set()
+            if (wanted <= present) if match_all else (wanted & present):
+                matches.append(entity)
+        return matches
+
     @abstractmethod
     def create(self, entity: T) -> T:
         """
@@ -78,6 +176,32 @@ class Dao(ABC, Generic[T]):
         """
         pass
 
+    @abstractmethod
+    def create_batch(self, entities: List[T]) -> Dict[str, List[str]]:
+        """
+        Create multiple entities in one write critical section.
+        
+        Args:
+            entities: The entities to create
+            
+        Returns:
+            Dictionary containing lists of created IDs and failed (duplicate) IDs
+        """
+        pass
+
+    @abstractmethod
+    def upsert_batch(self, entities: List[T]) -> Dict[str, List[str]]:
+        """
+        Create or replace multiple entities in one write critical section.
+        
+        Args:
+            entities: The entities to create, or to replace if their ID exists
+            
+        Returns:
+            Dictionary containing lists of upserted and failed IDs
+        """
+        pass
+
     @abstractmethod
     def delete_batch(self, ids: List[str]) -> Dict[str, List[str]]:
         """
@@ -94,7 +218,8 @@ class Dao(ABC, Generic[T]):
 class DaoImplementation(Dao[T]):
     """Implementation of Data Access Object for any entity type."""
 
-    def __init__(self, cache_storage, cache_type: str, id_field: str = 'id'):
+    def __init__(self, cache_storage, cache_type: str, id_field: str = 'id',
+                 indexed_fields: List[str] = (), token_fields: List[str] = ()):
         """
         Initialize DAO with cache storage settings.
         
@@ -102,50 +227,56 @@ class DaoImplementation(Dao[T]):
             cache_storage: The cache storage instance
             cache_type: The type of entity in cache (e.g., 'client', 'tpp')
             id_field: The field name used as identifier (default: 'id')
+            indexed_fields: Fields to keep secondary indexes on for filtering
+            token_fields: Whitespace-separated list fields to keep inverted indexes on
         """
         self.cache_storage = cache_storage
         self.cache_type = cache_type
         self.id_field = id_field
+        self.indexed_fields = tuple(indexed_fields)
+        self.token_fields = tuple(token_fields)
+        for field in self.indexed_fields:
+            self.cache_storage.create_index(cache_type, field)
+        for field in self.token_fields:
+            self.cache_storage.create_token_index(cache_type, field)
 
     def get_by_id(self, id: str) -> Optional[T]:
         """Retrieve an entity by its ID."""
-        items = self.get_batch()
-        return next((item for item in items if item[self.id_field] == id), None)
+        return self.cache_storage.get_from_cache(id, self.cache_type)
 
     def get_batch(self, filter_params: Dict[str, Any] = None) -> List[T]:
         """Retrieve multiple entities, optionally filtered."""
-        if not self.cache_storage._cache_initialized:
-            self.cache_storage.initialize_cache()
-            
-        items = self.cache_storage._cache[self.cache_type]
-        
         if not filter_params:
-            return items
+            return self.cache_storage.get_items(self.cache_type)
 
-        # Apply filters if provided
-        filtered_items = items
-        for key, value in filter_params.items():
-            filtered_items = [item for item in filtered_items if item.get(key) == value]
-        
-        return filtered_items
+        # Indexed filters narrow the candidates, the rest are scanned
+        return self.cache_storage.find_in_cache(filter_params, self.cache_type)
+
+    def find_by_tokens(self, field: str, tokens: List[str], match_all: bool = True) -> List[T]:
+        """Retrieve the entities holding the tokens, from the inverted index if the field has one."""
+        if field not in self.token_fields:
+            return super().find_by_tokens(field, tokens, match_all)
+        return self.cache_storage.find_tokens_in_cache(field, tokens, self.cache_type, match_all)
+
+    def get_page(self, limit: int, cursor: str = None) -> Dict[str, Any]:
+        """Retrieve one page of entities in insertion order."""
+        after = decode_cursor(cursor) if cursor else 0
+        items, next_after = self.cache_storage.get_page(self.cache_type, limit, after)
+        return {
+            "items": items,
+            "nextCursor": encode_cursor(next_after) if next_after is not None else None
+        }
 
     def create(self, entity: T) -> T:
         """Create a new entity."""
-        if hasattr(entity, 'to_dict'):
-            entity_dict = entity.to_dict()
-        else:
-            entity_dict = dict(entity)
-            
+        # The cache encodes the record into its own storage, so a dict is passed as is
+        entity_dict = entity.to_dict() if hasattr(entity, 'to_dict') else entity
         self.cache_storage.add_to_cache(entity_dict, self.cache_type)
         return entity
 
     def update(self, id: str, entity: T) -> Optional[T]:
         """Update an existing entity."""
-        if hasattr(entity, 'to_dict'):
-            entity_dict = entity.to_dict()
-        else:
-            entity_dict = dict(entity)
-
+        entity_dict = entity.to_dict() if hasattr(entity, 'to_dict') else entity
         if self.cache_storage.update_cache(id, entity_dict, self.cache_type, self.id_field):
             return entity
         return None
@@ -154,20 +285,290 @@ class DaoImplementation(Dao[T]):
         """Delete an entity by its ID."""
         return self.cache_storage.delete_from_cache(id, self.cache_type, self.id_field)
 
+    def create_batch(self, entities: List[T]) -> Dict[str, List[str]]:
+        """Create multiple entities under one cache lock."""
+        entity_dicts = [entity.to_dict() if hasattr(entity, 'to_dict') else entity
+                        for entity in entities]
+        added_ids, failed_ids = self.cache_storage.add_batch(entity_dicts, self.cache_type)
+        return batch_result('created', 'create', added_ids, failed_ids)
+
+    def upsert_batch(self, entities: List[T]) -> Dict[str, List[str]]:
+        """Create or replace multiple entities under one cache lock."""
+        entity_dicts = [entity.to_dict() if hasattr(entity, 'to_dict') else entity
+                        for entity in entities]
+        upserted_ids = self.cache_storage.upsert_batch(entity_dicts, self.cache_type)
+        return batch_result('upserted', 'upsert', upserted_ids, [])
+
     def delete_batch(self, ids: List[str]) -> Dict[str, List[str]]:
-        """Delete multiple entities by their IDs."""
+        """Delete multiple entities by their IDs under one cache lock."""
+        success_ids, failed_ids = self.cache_storage.delete_batch(ids, self.cache_type)
+        return batch_result('deleted', 'delete', success_ids, failed_ids)
+
+
+class SqliteDao(Dao[T]):
+    """Data Access Object storing entities as JSON documents in a SQLite database.
+
+    Every thread, and every forked process, gets its own pooled connection
+    in WAL journal mode, so readers proceed while a write is in progress.
+    Rows carry an auto-increment sequence that orders them by insertion and
+    serves as the page cursor. The ID and each indexed field are kept in
+    indexed columns next to the document; other filter fields are checked
+    on the decoded candidates. SQL is fixed per DAO, so sqlite3's
+    per-connection statement cache prepares each statement once.
+    """
+
+    def __init__(self, cache_storage, cache_type: str, id_field: str = 'id',
+                 indexed_fields: List[str] = (), database: str = 'metadata.db'):
+        """
+        Initialize DAO over a table of the given database, creating it if needed.
+
+        A newly created table is seeded with the items of the cache storage.
+
+        Args:
+            cache_storage: The cache storage a new table is seeded from
+            cache_type: The type of entity (e.g., 'client', 'tpp'), used as table name
+            id_field: The field name used as identifier (default: 'id')
+            indexed_fields: Fields to keep indexed columns on for filtering
+            database: Path of the SQLite database file
+        """
+        self.cache_storage = cache_storage
+        self.cache_type = cache_type
+        self.id_field = id_field
+        self.indexed_fields = tuple(field for field in indexed_fields if field != id_field)
+        self.database = database
+        self._local = threading.local()
+        self._connections = []
+        self._pool_lock = threading.Lock()
+
+        table = self._quote(cache_type)
+        columns = ''.join(f', {self._column(field)}' for field in self.indexed_fields)
+        placeholders = ', ?' * len(self.indexed_fields)
+        assignments = ''.join(f', {self._column(field)} = ?' for field in self.indexed_fields)
+        self._table = table
+        self._select_by_id = f'SELECT data FROM {table} WHERE item_id = ?'
+        self._select_all = f'SELECT data FROM {table} ORDER BY seq'
+        self._select_page = f'SELECT seq, data FROM {table} WHERE seq > ? ORDER BY seq LIMIT ?'
+        self._insert = f'INSERT INTO {table} (item_id, data{columns}) VALUES (?, ?{placeholders})'
+        self._update = f'UPDATE {table} SET item_id = ?, data = ?{assignments} WHERE item_id = ?'
+        self._delete = f'DELETE FROM {table} WHERE item_id = ?'
+        self._upsert = self._insert + ' ON CONFLICT (item_id) DO UPDATE SET data = excluded.data' + ''.join(
+            f', {self._column(field)} = excluded.{self._column(field)}' for field in self.indexed_fields
+        )
+        self._create_schema()
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        """Quote an SQL identifier."""
+        return '"' + name.replace('"', '""') + '"'
+
+    def _column(self, field: str) -> str:
+        """Return the quoted column name of an indexed field."""
+        return self._quote(f'field_{field}')
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        pid, connection = getattr(self._local, 'connection', (None, None))
+        if pid != os.getpid():
+            # Connections must not cross a fork; the child opens its own
+            connection = sqlite3.connect(self.database, timeout=30, isolation_level=None,
+                                         check_same_thread=False, cached_statements=64)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = (os.getpid(), connection)
+            with self._pool_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _transaction(self):
+        """Return a connection with a write transaction begun; commit or roll back with it."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        return connection
+
+    def _create_schema(self) -> None:
+        """Create the table and indexes, add missing indexed columns and seed a new table."""
+        connection = self._transaction()
+        try:
+            created = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.cache_type,)
+            ).fetchone() is None
+            connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {self._table} ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'item_id TEXT NOT NULL UNIQUE, '
+                'data TEXT NOT NULL)'
+            )
+            existing = {row[1] for row in connection.execute(f'PRAGMA table_info({self._table})')}
+            for field in self.indexed_fields:
+                column = self._column(field)
+                if f'field_{field}' not in existing:
+                    connection.execute(f'ALTER TABLE {self._table} ADD COLUMN {column}')
+                    rows = connection.execute(f'SELECT item_id, data FROM {self._table}').fetchall()
+                    connection.executemany(
+                        f'UPDATE {self._table} SET {column} = ? WHERE item_id = ?',
+                        [(json.loads(data).get(field), item_id) for item_id, data in rows]
+                    )
+                index = self._quote(f'{self.cache_type}_{field}_index')
+                connection.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {self._table} ({column})')
+            if created:
+                connection.executemany(
+                    self._insert, [self._row(item) for item in self.cache_storage.get_items(self.cache_type)]
+                )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _row(self, entity_dict: Dict[str, Any]) -> tuple:
+        """Return the insert parameters of an entity."""
+        return (entity_dict.get(self.id_field), json.dumps(entity_dict)) + tuple(
+            entity_dict.get(field) for field in self.indexed_fields
+        )
+
+    @staticmethod
+    def _to_dict(entity) -> Dict[str, Any]:
+        """Return an entity as a dict, without copying one that already is."""
+        return entity.to_dict() if hasattr(entity, 'to_dict') else entity
+
+    def get_by_id(self, id: str) -> Optional[T]:
+        """Retrieve an entity by its ID."""
+        row = self._connection().execute(self._select_by_id, (id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def get_batch(self, filter_params: Dict[str, Any] = None) -> List[T]:
+        """Retrieve multiple entities, optionally filtered."""
+        if not filter_params:
+            rows = self._connection().execute(self._select_all)
+            return [json.loads(data) for data, in rows]
+
+        # Indexed columns narrow the candidates in SQL, the rest are checked here
+        conditions, parameters, unindexed = [], [], []
+        for field, value in filter_params.items():
+            if field == self.id_field:
+                conditions.append('item_id IS ?')
+            elif field in self.indexed_fields:
+                conditions.append(f'{self._column(field)} IS ?')
+            else:
+                unindexed.append((field, value))
+                continue
+            parameters.append(value)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = self._connection().execute(
+            f'SELECT data FROM {self._table}{where} ORDER BY seq', parameters
+        )
+        items = [json.loads(data) for data, in rows]
+        for field, value in unindexed:
+            items = [item for item in items if item.get(field) == value]
+        return items
+
+    def get_page(self, limit: int, cursor: str = None) -> Dict[str, Any]:
+        """Retrieve one page of entities in insertion order."""
+        after = decode_cursor(cursor) if cursor else 0
+        rows = self._connection().execute(self._select_page, (after, limit + 1)).fetchall()
+        items = [json.loads(data) for _, data in rows[:limit]]
+        return {
+            "items": items,
+            "nextCursor": encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        }
+
+    def create(self, entity: T) -> T:
+        """Create a new entity."""
+        entity_dict = self._to_dict(entity)
+        try:
+            self._connection().execute(self._insert, self._row(entity_dict))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Duplicate {self.id_field}: {entity_dict.get(self.id_field)}")
+        return entity
+
+    def update(self, id: str, entity: T) -> Optional[T]:
+        """Update an existing entity."""
+        entity_dict = self._to_dict(entity)
+        new_id = entity_dict.get(self.id_field, id)
+        row = self._row({**entity_dict, self.id_field: new_id})
+        try:
+            cursor = self._connection().execute(self._update, row + (id,))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Duplicate {self.id_field}: {new_id}")
+        return entity if cursor.rowcount else None
+
+    def delete_by_id(self, id: str) -> bool:
+        """Delete an entity by its ID."""
+        return self._connection().execute(self._delete, (id,)).rowcount > 0
+
+    def _existing_ids(self, connection: sqlite3.Connection, ids: List[str]) -> set:
+        """Return which of the given IDs are stored, in chunks of SQLITE_BATCH_SIZE."""
+        existing = set()
+        for start in range(0, len(ids), SQLITE_BATCH_SIZE):
+            chunk = ids[start:start + SQLITE_BATCH_SIZE]
+            rows = connection.execute(
+                f'SELECT item_id FROM {self._table} WHERE item_id IN ({", ".join("?" * len(chunk))})',
+                chunk
+            )
+            existing.update(item_id for item_id, in rows)
+        return existing
+
+    def create_batch(self, entities: List[T]) -> Dict[str, List[str]]:
+        """Create multiple entities in one transaction."""
+        rows = [self._row(self._to_dict(entity)) for entity in entities]
+        created_ids = []
+        failed_ids = []
+        connection = self._transaction()
+        try:
+            taken = self._existing_ids(connection, [row[0] for row in rows])
+            new_rows = []
+            for row in rows:
+                if row[0] in taken:
+                    failed_ids.append(row[0])
+                else:
+                    taken.add(row[0])
+                    created_ids.append(row[0])
+                    new_rows.append(row)
+            connection.executemany(self._insert, new_rows)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return batch_result('created', 'create', created_ids, failed_ids)
+
+    def upsert_batch(self, entities: List[T]) -> Dict[str, List[str]]:
+        """Create or replace multiple entities in one transaction."""
+        rows = [self._row(self._to_dict(entity)) for entity in entities]
+        connection = self._transaction()
+        try:
+            connection.executemany(self._upsert, rows)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return batch_result('upserted', 'upsert', [row[0] for row in rows], [])
+
+    def delete_batch(self, ids: List[str]) -> Dict[str, List[str]]:
+        """Delete multiple entities by their IDs in one transaction."""
+        connection = self._transaction()
+        try:
+            existing = self._existing_ids(connection, ids)
+            connection.executemany(self._delete, [(item_id,) for item_id in existing])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
         success_ids = []
         failed_ids = []
-        
         for item_id in ids:
-            if self.delete_by_id(item_id):
+            if item_id in existing:
+                # A repeated ID only counts as deleted once
+                existing.discard(item_id)
                 success_ids.append(item_id)
             else:
                 failed_ids.append(item_id)
-                
-        return {
-            "status": "success" if not failed_ids else "partial",
-            "deleted": success_ids,
-            "failed": failed_ids,
-            "message": f"Successfully deleted {len(success_ids)} items, failed to delete {len(failed_ids)} items"
-        }
+
+        return batch_result('deleted', 'delete', success_ids, failed_ids)
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        with self._pool_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,395 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+import columnar
+from client_service import ClientService
+from columnar import ColumnarDao
+from data_access import DaoImplementation, SqliteDao
+from services import CacheStorage
+
+class DaoTests:
+    """Test cases every Dao implementation must pass, over the default client data."""
+
+    def setUp(self):
+        """Set up a freshly loaded cache before each test."""
+        CacheStorage.reset_cache()
+        CacheStorage.initialize_cache()
+        self.dao = self.make_dao()
+
+    def tearDown(self):
+        """Leave a clean cache for other test modules."""
+        CacheStorage.reset_cache()
+
+    def make_dao(self, indexed_fields=()):
+        """Build the client DAO under test."""
+        raise NotImplementedError
+
+    def make_client(self, client_id, **overrides):
+        """Build a client record with the given ID."""
+        client = {
+            'clientId': client_id,
+            'clientName': f'Client {client_id}',
+            'clientDesc': 'Test Description',
+            'tppId': 'TPP1',
+            'clientSecret': 'secret123',
+            'logoUri': 'http://example.com/logo.png',
+            'uri': 'http://example.com',
+            'contacts': ['test@example.com'],
+            'status': 'active'
+        }
+        client.update(overrides)
+        return client
+
+    def test_get_by_id(self):
+        """Test point lookups through the primary-key index."""
+        self.assertEqual(self.dao.get_by_id('3')['clientId'], '3')
+        self.assertIsNone(self.dao.get_by_id('missing'))
+
+    def test_create_rejects_duplicate_ids(self):
+        """Test that creating an existing ID raises ValueError."""
+        self.dao.create(self.make_client('new1'))
+        self.assertEqual(self.dao.get_by_id('new1')['clientName'], 'Client new1')
+
+        with self.assertRaises(ValueError) as context:
+            self.dao.create(self.make_client('new1'))
+        self.assertIn('Duplicate clientId', str(context.exception))
+
+    def test_update(self):
+        """Test updating existing and missing entities."""
+        updated = self.make_client('2', clientName='Renamed')
+        self.assertEqual(self.dao.update('2', updated), updated)
+        self.assertEqual(self.dao.get_by_id('2')['clientName'], 'Renamed')
+        self.assertIsNone(self.dao.update('missing', self.make_client('missing')))
+
+    def test_update_rekeys_index(self):
+        """Test that changing the ID of a record moves its index entry."""
+        self.dao.update('2', self.make_client('two'))
+        self.assertIsNone(self.dao.get_by_id('2'))
+        self.assertEqual(self.dao.get_by_id('two')['clientId'], 'two')
+
+        with self.assertRaises(ValueError):
+            self.dao.update('two', self.make_client('3'))
+
+    def test_delete_keeps_order_and_index(self):
+        """Test that deletes keep the remaining records ordered and indexed."""
+        before = [item['clientId'] for item in self.dao.get_batch()]
+        self.assertTrue(self.dao.delete_by_id('4'))
+        self.assertFalse(self.dao.delete_by_id('4'))
+
+        after = [item['clientId'] for item in self.dao.get_batch()]
+        self.assertEqual(after, [item_id for item_id in before if item_id != '4'])
+        for item_id in after:
+            self.assertEqual(self.dao.get_by_id(item_id)['clientId'], item_id)
+
+    def test_delete_batch(self):
+        """Test batch deletion across compaction."""
+        ids = [str(i) for i in range(1, 12)]
+        result = self.dao.delete_batch(ids + ['missing'])
+        self.assertEqual(result['status'], 'partial')
+        self.assertEqual(result['deleted'], ids)
+        self.assertEqual(result['failed'], ['missing'])
+
+        remaining = [item['clientId'] for item in self.dao.get_batch()]
+        self.assertEqual(remaining, ['12', '13', '14', '15'])
+        self.assertEqual(self.dao.get_by_id('14')['clientId'], '14')
+
+    def test_create_batch(self):
+        """Test that batch creation reports duplicates per item and keeps input order."""
+        result = self.dao.create_batch([
+            self.make_client('b1'), self.make_client('3'), self.make_client('b2'), self.make_client('b1')
+        ])
+        self.assertEqual(result['status'], 'partial')
+        self.assertEqual(result['created'], ['b1', 'b2'])
+        self.assertEqual(result['failed'], ['3', 'b1'])
+        self.assertEqual([item['clientId'] for item in self.dao.get_batch()][-2:], ['b1', 'b2'])
+        self.assertEqual(self.dao.get_by_id('3')['clientName'], 'Robinshood client 3')
+
+    def test_upsert_batch(self):
+        """Test that batch upserts replace existing records in place and append new ones."""
+        dao = self.make_dao(('tppId',))
+        result = dao.upsert_batch([self.make_client('2', tppId='TPP9'), self.make_client('u1')])
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['upserted'], ['2', 'u1'])
+
+        ids = [item['clientId'] for item in dao.get_batch()]
+        self.assertEqual(ids[1], '2')
+        self.assertEqual(ids[-1], 'u1')
+        self.assertEqual([item['clientId'] for item in dao.get_batch({'tppId': 'TPP9'})], ['2'])
+
+    def test_get_batch_filters(self):
+        """Test filtering on indexed, unindexed and mixed fields."""
+        dao = self.make_dao(('tppId', 'status'))
+        dao.create(self.make_client('a', tppId='TPP9', status='inactive'))
+        dao.create(self.make_client('b', tppId='TPP9'))
+        dao.create(self.make_client('c', tppId='TPP9', clientDesc='special'))
+
+        test_cases = [
+            # (filter_params, expected_ids)
+            ({'tppId': 'TPP9'}, ['a', 'b', 'c']),
+            ({'tppId': 'TPP9', 'status': 'active'}, ['b', 'c']),
+            ({'tppId': 'TPP9', 'clientDesc': 'special'}, ['c']),
+            ({'clientDesc': 'special'}, ['c']),
+            ({'tppId': 'unknown'}, []),
+            ({'clientId': 'b', 'status': 'active'}, ['b']),
+            ({'clientId': 'b', 'status': 'inactive'}, []),
+            ({'clientId': 'a', 'tppId': 'TPP9', 'clientDesc': 'special'}, []),
+        ]
+        for filter_params, expected_ids in test_cases:
+            with self.subTest(filter_params=filter_params):
+                result = dao.get_batch(filter_params)
+                self.assertEqual([item['clientId'] for item in result], expected_ids)
+
+    def test_find_by_tokens(self):
+        """Test token lookups over a whitespace-separated field."""
+        self.dao.create(self.make_client('a', clientDesc='special test client'))
+        self.dao.create(self.make_client('b', clientDesc='special'))
+        found = lambda tokens, match_all: [item['clientId'] for item in
+                                           self.dao.find_by_tokens('clientDesc', tokens, match_all)]
+        self.assertEqual(found(['special', 'client'], True), ['a'])
+        self.assertEqual(found(['special', 'missing'], False), ['a', 'b'])
+
+    def test_secondary_indexes_follow_mutations(self):
+        """Test that updates and deletes keep secondary indexes in sync."""
+        dao = self.make_dao(('tppId', 'status'))
+        dao.update('1', self.make_client('1', tppId='TPP9'))
+        dao.delete_by_id('2')
+
+        self.assertEqual([item['clientId'] for item in dao.get_batch({'tppId': 'TPP9'})], ['1'])
+        active_ids = [item['clientId'] for item in dao.get_batch({'status': 'active'})]
+        self.assertNotIn('2', active_ids)
+        self.assertEqual(len(active_ids), 14)
+
+    def test_get_page_is_stable_under_mutations(self):
+        """Test that cursors stay correct while records are inserted and deleted."""
+        first = self.dao.get_page(4)
+        self.assertEqual([item['clientId'] for item in first['items']], ['1', '2', '3', '4'])
+
+        self.dao.delete_batch(['4', '5', '6', '7', '8', '9', '10', '11'])
+        self.dao.create(self.make_client('new1'))
+        second = self.dao.get_page(4, first['nextCursor'])
+        self.assertEqual([item['clientId'] for item in second['items']], ['12', '13', '14', '15'])
+
+        last = self.dao.get_page(4, second['nextCursor'])
+        self.assertEqual([item['clientId'] for item in last['items']], ['new1'])
+        self.assertIsNone(last['nextCursor'])
+
+    def test_get_page_rejects_invalid_cursor(self):
+        """Test that malformed cursors raise ValueError."""
+        for cursor in ['not-a-cursor', '!!', 'LTE']:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    self.dao.get_page(5, cursor)
+
+    def test_concurrent_readers_see_consistent_snapshots(self):
+        """Test that readers never see torn lists while writers mutate and compact."""
+        errors = []
+        done = threading.Event()
+
+        def write(prefix):
+            for i in range(300):
+                item_id = f'{prefix}{i}'
+                self.dao.create(self.make_client(item_id))
+                self.dao.update(item_id, self.make_client(item_id, clientName='Renamed'))
+                if i % 3:
+                    self.dao.delete_by_id(item_id)
+
+        def read():
+            while not done.is_set():
+                try:
+                    ids = [item['clientId'] for item in self.dao.get_batch()]
+                    if len(ids) != len(set(ids)):
+                        errors.append('duplicate records in snapshot')
+                    for item_id in ids[-5:]:
+                        item = self.dao.get_by_id(item_id)
+                        if item is not None and item['clientId'] != item_id:
+                            errors.append(f'index points at {item["clientId"]} for {item_id}')
+                    self.dao.get_page(7)
+                    self.dao.get_batch({'clientName': 'Renamed'})
+                except Exception as e:
+                    errors.append(repr(e))
+
+        writers = [threading.Thread(target=write, args=(prefix,)) for prefix in 'abc']
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.dao.get_batch()), 15 + 3 * 100)
+
+class TestDaoImplementation(DaoTests, unittest.TestCase):
+    """Test cases for DaoImplementation backed by CacheStorage."""
+
+    def make_dao(self, indexed_fields=()):
+        """Build a cache-backed client DAO."""
+        return DaoImplementation(CacheStorage, 'client', 'clientId', indexed_fields)
+
+    def test_replayed_mutations_converge(self):
+        """Test that replaying recorded mutations reproduces the same cache state."""
+        mutations = []
+        listener = lambda *mutation: mutations.append(mutation)
+        CacheStorage.add_listener(listener)
+        try:
+            self.dao.create(self.make_client('new1'))
+            self.dao.update('2', self.make_client('2', clientName='Renamed'))
+            self.dao.delete_batch(['3', 'missing'])
+        finally:
+            CacheStorage.remove_listener(listener)
+        expected = self.dao.get_batch()
+
+        self.assertEqual([mutation[0] for mutation in mutations], ['add', 'update', 'delete'])
+        CacheStorage.reset_cache()
+        for mutation in mutations:
+            CacheStorage.apply_mutation(*mutation)
+        self.assertEqual(self.dao.get_batch(), expected)
+
+class TestSqliteDao(DaoTests, unittest.TestCase):
+    """Test cases for SqliteDao over a database seeded from CacheStorage."""
+
+    def setUp(self):
+        """Use a fresh database file for each test."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'test.db')
+        self.daos = []
+        super().setUp()
+
+    def tearDown(self):
+        """Close every connection and remove the database."""
+        for dao in self.daos:
+            dao.close()
+        self.directory.cleanup()
+        super().tearDown()
+
+    def make_dao(self, indexed_fields=()):
+        """Build a client DAO over the test database."""
+        dao = SqliteDao(CacheStorage, 'client', 'clientId', indexed_fields, self.database)
+        self.daos.append(dao)
+        return dao
+
+    def test_data_persists_without_the_cache(self):
+        """Test that a reopened database keeps its data and is not seeded again."""
+        self.dao.create(self.make_client('new1'))
+        self.dao.delete_by_id('1')
+        expected = self.dao.get_batch()
+
+        CacheStorage.reset_cache()
+        CacheStorage.initialize_cache()
+        self.assertEqual(self.make_dao(('tppId',)).get_batch(), expected)
+
+    def test_schema_and_journal_mode(self):
+        """Test WAL journaling and the indexes used by lookups and filters."""
+        dao = self.make_dao(('tppId', 'status'))
+        connection = sqlite3.connect(self.database)
+        try:
+            self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            plan = ' '.join(row[-1] for row in connection.execute(
+                'EXPLAIN QUERY PLAN SELECT data FROM client WHERE field_tppId IS ?', ('TPP1',)
+            ))
+            self.assertIn('client_tppId_index', plan)
+        finally:
+            connection.close()
+        self.assertEqual([item['clientId'] for item in dao.get_batch({'status': 'active'})][:2],
+                         ['1', '2'])
+
+    def test_connections_are_per_thread(self):
+        """Test that each thread reuses its own pooled connection."""
+        connections = []
+        self.dao.get_by_id('1')
+        self.dao.get_by_id('2')
+        thread = threading.Thread(target=lambda: connections.append(self.dao._connection()))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(len(self.dao._connections), 2)
+        self.assertIsNot(connections[0], self.dao._connection())
+
+@unittest.skipIf(columnar.np is None, "NumPy is not installed")
+class TestColumnarDao(DaoTests, unittest.TestCase):
+    """Test cases for ColumnarDao filtering columns mirrored from CacheStorage."""
+
+    def setUp(self):
+        """Track the DAOs so their listeners can be removed."""
+        self.daos = []
+        super().setUp()
+
+    def tearDown(self):
+        """Stop mirroring the cache."""
+        for dao in self.daos:
+            dao.close()
+        super().tearDown()
+
+    def make_dao(self, indexed_fields=()):
+        """Build a columnar client DAO storing the indexed fields as categories."""
+        dao = ColumnarDao(CacheStorage, 'client', 'clientId', indexed_fields)
+        self.daos.append(dao)
+        return dao
+
+    def test_filters_match_the_cache(self):
+        """Test that columnar filters and counts agree with scanning the cached dicts."""
+        dao = self.make_dao(('tppId', 'status'))
+        dao.create(self.make_client('a', tppId='TPP9', status='inactive', contacts=['a@example.com']))
+        dao.create(self.make_client('b', clientDesc=None, extra={'nested': [1]}))
+        dao.delete_by_id('3')
+        items = CacheStorage.get_items('client')
+
+        test_cases = [
+            {'tppId': 'TPP9'},
+            {'status': 'active', 'clientDesc': 'Test Description'},
+            {'contacts': ['a@example.com']},
+            {'clientDesc': None},
+            {'extra': {'nested': [1]}},
+            {'extra': None, 'tppId': 'TPP1'},
+            {'status': ['active']},
+            {'unknown': None},
+            {'unknown': 'x'},
+            {'clientId': '3'},
+        ]
+        for filter_params in test_cases:
+            with self.subTest(filter_params=filter_params):
+                expected = [item for item in items
+                            if all(item.get(field) == value for field, value in filter_params.items())]
+                self.assertEqual(dao.get_batch(filter_params), expected)
+                self.assertEqual(dao.count(filter_params), len(expected))
+        self.assertEqual(dao.count(), len(items))
+
+    def test_results_do_not_alias_columns(self):
+        """Test that changing returned or written records leaves the columns untouched."""
+        dao = self.make_dao(('status',))
+        client = self.make_client('a')
+        dao.create(client)
+        client['contacts'].append('written@example.com')
+        dao.get_batch({'clientId': 'a'})[0]['contacts'].append('read@example.com')
+        self.assertEqual(dao.get_batch({'clientId': 'a'})[0]['contacts'], ['test@example.com'])
+
+    def test_columns_follow_reloads_and_compaction(self):
+        """Test that reloading the cache rebuilds the columns and deletes compact them."""
+        dao = self.make_dao(('tppId', 'status'))
+        self.assertEqual(dao.count({'status': 'active'}), 15)
+        CacheStorage.reset_cache()
+        CacheStorage.initialize_cache()
+        dao.create(self.make_client('a'))
+        self.assertEqual(dao.count({'status': 'active'}), 16)
+
+        dao.delete_batch([str(i) for i in range(1, 13)])
+        # 9 deletes passed the ratio and dropped their rows; the other 3 are still marked
+        self.assertEqual((dao._size, dao._deleted), (7, 3))
+        self.assertEqual([item['clientId'] for item in dao.get_batch({'status': 'active'})],
+                         ['13', '14', '15', 'a'])
+
+    def test_replaced_dao_stops_listening(self):
+        """Test that a dropped DAO unregisters its listener without close()."""
+        listeners = len(CacheStorage._listeners)
+        ClientService.initialize_dao(CacheStorage, columnar=True)
+        ClientService.initialize_dao(CacheStorage, columnar=True)
+        self.assertEqual(len(CacheStorage._listeners), listeners + 1)
+        ClientService.initialize_dao(CacheStorage)
+        self.assertEqual(len(CacheStorage._listeners), listeners)
+
+if __name__ == '__main__':
+    unittest.main()
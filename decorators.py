@@ -1,15 +1,20 @@
 from functools import wraps
-from typing import List
+from typing import List, Sequence
 
 VALID_METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
 
-def routing(path: str, method: str):
+def routing(path: str, method: str, query: Sequence[str] = (), resource=None, listing: bool = False):
     """
     Decorator to register route handlers.
     
     Args:
         path: URL path pattern (must start with '/')
         method: HTTP method (must be one of VALID_METHODS)
+        query: Optional query string parameters passed to the handler as keywords
+        resource: Cache type, or tuple of cache types, a GET route reads when
+            it is not the service's own; see Router.add_route
+        listing: Whether the GET route returns every record of its resource
+            when called without query parameters; see Router.add_route
     """
     if not path.startswith('/'):
         raise ValueError("Path must start with '/'")
@@ -30,5 +35,8 @@ def routing(path: str, method: str):
             for segment in path.split('/')
             if segment.startswith('{') and segment.endswith('}')
         ]
+        wrapper._route_query = tuple(query)
+        wrapper._route_resource = resource
+        wrapper._route_listing = listing
         return wrapper
     return decorator
\ No newline at end of file
@@ -0,0 +1,101 @@
+import json
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence
+from records import materialize
+
+# Bytes of encoded records kept by default, across all collections
+DEFAULT_BUDGET = 64 * 1024 * 1024
+# Estimated bytes per entry besides the encoded bytes: the OrderedDict node, its key and tuple
+ENTRY_OVERHEAD = 120
+
+
+class FragmentCache:
+    """LRU cache of the JSON encoding of stored records, within a memory budget.
+
+    Stored records are immutable and replaced as a whole on every write,
+    so a record object identifies one encoding: entries are keyed by the
+    record's identity and hold the record, so the identity cannot be
+    reused while the entry exists. Collections discard the entry of a
+    record they replace or delete; an entry re-added by a reader of an
+    older snapshot only ages out.
+
+    Each entry costs the size of its bytes object plus ENTRY_OVERHEAD.
+    Once the total passes the budget, the least recently used entries are
+    evicted and their records are encoded again on demand. A budget of 0
+    disables the cache.
+    """
+
+    def __init__(self, budget: int = DEFAULT_BUDGET):
+        """
+        Initialize an empty cache.
+
+        Args:
+            budget: Bytes the entries may take in total
+        """
+        self.budget = budget
+        # id(record) -> (record, encoded bytes, cost), least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def encode_all(self, records: Sequence[Any]) -> List[bytes]:
+        """Return the JSON encoding of each stored record, from the cache where possible."""
+        if self.budget <= 0:
+            return [json.dumps(materialize(record)).encode() for record in records]
+        fragments = []
+        misses = 0
+        with self._lock:
+            entries = self._entries
+            for record in records:
+                entry = entries.get(id(record))
+                if entry is not None:
+                    entries.move_to_end(id(record))
+                    fragments.append(entry[1])
+                    continue
+                fragment = json.dumps(materialize(record)).encode()
+                cost = sys.getsizeof(fragment) + ENTRY_OVERHEAD
+                entries[id(record)] = (record, fragment, cost)
+                self._size += cost
+                misses += 1
+                fragments.append(fragment)
+            self._hits += len(fragments) - misses
+            self._misses += misses
+            self._evict()
+        return fragments
+
+    def discard(self, record: Any) -> None:
+        """Drop the encoding of a record that was replaced or deleted."""
+        with self._lock:
+            entry = self._entries.pop(id(record), None)
+            if entry is not None:
+                self._size -= entry[2]
+
+    def resize(self, budget: int) -> None:
+        """Change the budget, evicting entries until they fit."""
+        with self._lock:
+            self.budget = budget
+            self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of entries, their bytes, the budget and the lookup counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'budget': self.budget,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+    def _evict(self) -> None:
+        """Evict the least recently used entries until the total fits the budget."""
+        while self._size > self.budget and self._entries:
+            _, (_, _, cost) = self._entries.popitem(last=False)
+            self._size -= cost
+            self._evictions += 1
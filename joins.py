@@ -0,0 +1,100 @@
+from typing import Any, Dict, List, Sequence, Tuple
+
+
+class Join:
+    """Embedded view of a link collection, joining each link to the records it references.
+
+    Links are stored normalized, holding only the IDs of the records they
+    connect, with a secondary index on every foreign key so the links of
+    a record are found from either side. The view replaces each ID with
+    the current referenced record. It is materialized once per
+    combination of the versions of the link and referenced collections
+    and shared by readers until one of them changes, so an updated TPP or
+    org shows up in every relationship without rewriting the links. Each
+    referenced record is materialized once per view and shared by all of
+    its links.
+
+    Referenced records stored outside the cache, e.g. in a SQLite
+    database, are read through the lookup set for their cache type. Their
+    writes do not bump a cache version, so such a view is rebuilt on every
+    read.
+    """
+
+    def __init__(self, cache_storage, link_type: str, id_field: str,
+                 references: Sequence[Tuple[str, str, str]]):
+        """
+        Initialize a join over a link collection and index its foreign keys.
+
+        Args:
+            cache_storage: The cache storage holding the links and the records
+            link_type: Cache type of the links (e.g., 'tppOrg')
+            id_field: Field of a link holding its own ID, kept in the view
+            references: (embedded key, foreign key field, referenced cache type)
+                per referenced record, in view order
+        """
+        self.cache_storage = cache_storage
+        self.link_type = link_type
+        self.id_field = id_field
+        self.references = tuple(references)
+        self.cache_types = (link_type,) + tuple(cache_type for _, _, cache_type in self.references)
+        for _, foreign_key, _ in self.references:
+            cache_storage.create_index(link_type, foreign_key)
+        # Referenced cache type -> callable returning a record by ID, for records outside the cache
+        self._lookups = {}
+        # (versions of cache_types, view) shared by readers
+        self._view = (None, [])
+
+    def set_lookup(self, cache_type: str, lookup) -> None:
+        """Read the referenced records of a cache type through lookup(id); None reads the cache."""
+        lookups = dict(self._lookups)
+        if lookup is None:
+            lookups.pop(cache_type, None)
+        else:
+            lookups[cache_type] = lookup
+        self._lookups = lookups
+        self._view = (None, [])
+
+    def versions(self) -> Tuple[int, ...]:
+        """Return the versions of the link and referenced collections."""
+        return tuple(self.cache_storage.get_version(cache_type) for cache_type in self.cache_types)
+
+    def items(self) -> List[Dict[str, Any]]:
+        """
+        Return every link with its referenced records embedded, in link order.
+
+        The list is shared by all concurrent readers of the same versions
+        and must not be modified. A referenced record that no longer exists
+        is embedded as None.
+        """
+        # Read the versions first: a write racing the build makes the view newer, never staler
+        versions = self.versions()
+        cached_versions, view = self._view
+        if cached_versions == versions:
+            return view
+        view = self._embed(self.cache_storage.get_items(self.link_type))
+        if not self._lookups:
+            self._view = (versions, view)
+        return view
+
+    def find(self, foreign_key: str, value: str) -> List[Dict[str, Any]]:
+        """Return the links whose foreign key has the given value, with their records embedded."""
+        return self._embed(self.cache_storage.find_in_cache({foreign_key: value}, self.link_type))
+
+    def _embed(self, links: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replace the foreign keys of links with the records they reference."""
+        # (cache type, ID) -> record, fetched once per call
+        records = {}
+        lookups = self._lookups
+        view = []
+        for link in links:
+            item = {}
+            for key, foreign_key, cache_type in self.references:
+                record_key = (cache_type, link.get(foreign_key))
+                if record_key not in records:
+                    lookup = lookups.get(cache_type)
+                    records[record_key] = (lookup(record_key[1]) if lookup is not None else
+                                           self.cache_storage.get_from_cache(record_key[1], cache_type))
+                item[key] = records[record_key]
+            item[self.id_field] = link.get(self.id_field)
+            view.append(item)
+        return view
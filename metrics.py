@@ -0,0 +1,214 @@
+import itertools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, List, Tuple
+
+METRICS_PATH = '/api/_metrics'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Request phases with a latency histogram, in the order they happen
+PHASES = ('parse', 'dispatch', 'serialize', 'write')
+_WRITE = PHASES.index('write')
+# Route label of requests that matched no route
+UNMATCHED = 'unmatched'
+
+
+class RequestTimer:
+    """Phase boundaries of one request, marked by Application.handle and dispatch."""
+
+    __slots__ = ('start', 'parsed', 'dispatched', 'done', 'route')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # Set once the body is decoded, the route matched and conditional headers checked;
+        # never set for requests answered from validators (304s, cached compressed bodies)
+        self.parsed = None
+        # Set once the handler returned
+        self.dispatched = None
+        # Set once the response is rendered, before writes are committed to the log
+        self.done = None
+        # Matched (route path, method) key, if any
+        self.route = None
+
+
+class _RouteStats:
+    """Counters and phase histograms of one route."""
+
+    __slots__ = ('statuses', 'buckets', 'sums')
+
+    def __init__(self):
+        # Status code -> requests
+        self.statuses = {}
+        # Requests per bucket of each phase, in PHASES order; the last bucket is past every bound
+        self.buckets = [[0] * (len(LATENCY_BUCKETS) + 1) for _ in PHASES]
+        # Total seconds of each phase, in PHASES order
+        self.sums = [0.0] * len(PHASES)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Request counters, per-phase latency histograms and gauges, rendered for Prometheus.
+
+    Recording a request takes a few clock reads, one short lock
+    acquisition and one bisect per phase; everything else, such as
+    cumulative bucket counts and gauge reads, is computed when the
+    metrics are scraped.
+    """
+
+    def __init__(self, cache_storage):
+        """
+        Initialize empty metrics.
+
+        Args:
+            cache_storage: The cache storage whose collection sizes are reported
+        """
+        self.cache_storage = cache_storage
+        # Requests started and finished; next() on a count is atomic, so starting takes no lock
+        self._started = itertools.count()
+        self._finished = 0
+        self._scrapes = 0
+        # (route path, method) -> _RouteStats
+        self._routes = {}
+        # Name -> (help, callable returning the value), read on every scrape
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def add_gauge(self, name: str, help: str, read: Callable[[], float]) -> None:
+        """Report read() under name on every scrape, replacing any gauge of the same name."""
+        # Copied on write, so a scrape iterating the gauges is not disturbed
+        gauges = dict(self._gauges)
+        gauges[name] = (help, read)
+        self._gauges = gauges
+
+    def start(self) -> RequestTimer:
+        """Count a request in flight and return its timer."""
+        next(self._started)
+        return RequestTimer()
+
+    def finish(self, timer: RequestTimer, method: str, status: int) -> None:
+        """Count a handled request and observe the phases it went through."""
+        end = timer.done if timer.done is not None else time.perf_counter()
+        key = timer.route or (UNMATCHED, method)
+        with self._lock:
+            self._finished += 1
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = _RouteStats()
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            buckets, sums = stats.buckets, stats.sums
+            # Phases a request did not reach are not observed: requests rejected while parsed or
+            # answered from validators only have a parse phase, failed handlers no serialize phase
+            if timer.parsed is None:
+                seconds = end - timer.start
+                buckets[0][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+                sums[0] += seconds
+                return
+            seconds = timer.parsed - timer.start
+            buckets[0][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            sums[0] += seconds
+            if timer.dispatched is None:
+                seconds = end - timer.parsed
+                buckets[1][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+                sums[1] += seconds
+                return
+            seconds = timer.dispatched - timer.parsed
+            buckets[1][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            sums[1] += seconds
+            seconds = end - timer.dispatched
+            buckets[2][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            sums[2] += seconds
+
+    def observe_write(self, route: Tuple[str, str], seconds: float) -> None:
+        """Observe the time a server took to send the response of a route; None is ignored."""
+        if route is None:
+            return
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = _RouteStats()
+            stats.buckets[_WRITE][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.sums[_WRITE] += seconds
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            routes = [(key, dict(stats.statuses), [list(counts) for counts in stats.buckets],
+                       list(stats.sums))
+                      for key, stats in sorted(self._routes.items())]
+            # Finishes take the lock, so none is missed between these reads; the count also
+            # yielded one value to every earlier scrape
+            in_flight = next(self._started) - self._scrapes - self._finished
+            self._scrapes += 1
+
+        lines = [
+            '# HELP metadata_http_requests_total Requests handled, by route and status code.',
+            '# TYPE metadata_http_requests_total counter',
+        ]
+        for (path, method), statuses, _, _ in routes:
+            labels = f'method="{method}",route="{_escape(path)}"'
+            for status, count in sorted(statuses.items()):
+                lines.append(f'metadata_http_requests_total{{{labels},status="{status}"}} {count}')
+
+        lines += [
+            '# HELP metadata_http_request_phase_seconds Time spent per request phase, by route.',
+            '# TYPE metadata_http_request_phase_seconds histogram',
+        ]
+        for (path, method), _, buckets, sums in routes:
+            labels = f'method="{method}",route="{_escape(path)}"'
+            for position, phase in enumerate(PHASES):
+                counts = buckets[position]
+                total = sum(counts)
+                if not total:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, counts):
+                    cumulative += count
+                    lines.append(f'metadata_http_request_phase_seconds_bucket'
+                                 f'{{{labels},phase="{phase}",le="{bound}"}} {cumulative}')
+                lines += [
+                    f'metadata_http_request_phase_seconds_bucket'
+                    f'{{{labels},phase="{phase}",le="+Inf"}} {total}',
+                    f'metadata_http_request_phase_seconds_sum{{{labels},phase="{phase}"}} '
+                    f'{sums[position]:.9f}',
+                    f'metadata_http_request_phase_seconds_count{{{labels},phase="{phase}"}} {total}',
+                ]
+
+        lines += self._samples('metadata_http_requests_in_flight', 'gauge',
+                               'Requests being handled.', [('', in_flight)])
+        for name, (help, read) in self._gauges.items():
+            lines += self._samples(name, 'gauge', help, [('', read())])
+        lines += self._samples(
+            'metadata_collection_records', 'gauge', 'Records per cached collection.',
+            [(f'{{collection="{cache_type}"}}', size)
+             for cache_type, size in self.cache_storage.get_sizes().items()])
+
+        fragments = self.cache_storage.get_fragment_stats()
+        lines += self._samples('metadata_fragment_cache_entries', 'gauge',
+                               'Records with a cached JSON encoding.', [('', fragments['entries'])])
+        lines += self._samples('metadata_fragment_cache_bytes', 'gauge',
+                               'Estimated memory of the cached encodings.', [('', fragments['bytes'])])
+        lines += self._samples('metadata_fragment_cache_budget_bytes', 'gauge',
+                               'Memory budget of the cached encodings.', [('', fragments['budget'])])
+        lines += self._samples('metadata_fragment_cache_lookups_total', 'counter',
+                               'Encodings served from the cache or encoded on demand.',
+                               [('{result="hit"}', fragments['hits']),
+                                ('{result="miss"}', fragments['misses'])])
+        lines += self._samples('metadata_fragment_cache_evictions_total', 'counter',
+                               'Encodings evicted to stay within the budget.',
+                               [('', fragments['evictions'])])
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _samples(name: str, kind: str, help: str, samples: List[Tuple[str, float]]) -> List[str]:
+        """Return the lines of a metric with its (labels, value) samples."""
+        return [f'# HELP {name} {help}', f'# TYPE {name} {kind}'] + [
+            f'{name}{labels} {value}' for labels, value in samples
+        ]
@@ -0,0 +1,118 @@
+import json
+import re
+import unittest
+from app import Application
+from metrics import METRICS_PATH
+from server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from services import CacheStorage
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for request metrics and their Prometheus exposition."""
+
+    def setUp(self):
+        """Start an application over a freshly loaded cache."""
+        CacheStorage.reset_cache()
+        self.app = Application().start()
+
+    def tearDown(self):
+        """Leave a clean cache for other test modules."""
+        CacheStorage.reset_cache()
+
+    def scrape(self):
+        """Return the samples of the metrics endpoint as {series: value}."""
+        response = self.app.handle('GET', METRICS_PATH, {})
+        self.assertEqual(response.status, 200)
+        self.assertIn(('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'), response.headers)
+        samples = {}
+        for line in response.body.decode().splitlines():
+            if not line.startswith('#'):
+                series, value = line.rsplit(' ', 1)
+                samples[series] = float(value)
+        return samples
+
+    def test_requests_are_counted_per_route_and_status(self):
+        """Test request counts by status and the phases each request went through."""
+        self.app.handle('GET', '/api/clients/2', {})
+        self.app.handle('GET', '/api/clients/3', {})
+        self.app.handle('GET', '/api/scopes/fdx:read/tpps?match=some', {})
+        self.app.handle('POST', '/api/clients', {}, b'{not json')
+        self.app.handle('GET', '/api/nowhere', {})
+        samples = self.scrape()
+
+        route = 'method="GET",route="/api/clients/{id}"'
+        test_cases = [
+            (f'metadata_http_requests_total{{{route},status="200"}}', 2),
+            ('metadata_http_requests_total{method="GET",route="/api/scopes/{name}/tpps",'
+             'status="400"}', 1),
+            ('metadata_http_requests_total{method="POST",route="unmatched",status="400"}', 1),
+            ('metadata_http_requests_total{method="GET",route="unmatched",status="404"}', 1),
+            (f'metadata_http_request_phase_seconds_count{{{route},phase="parse"}}', 2),
+            (f'metadata_http_request_phase_seconds_count{{{route},phase="dispatch"}}', 2),
+            (f'metadata_http_request_phase_seconds_bucket{{{route},phase="serialize",le="+Inf"}}', 2),
+            ('metadata_http_requests_in_flight', 0),
+            ('metadata_collection_records{collection="client"}', 15),
+            ('metadata_collection_records{collection="scope"}', 4),
+        ]
+        for series, expected in test_cases:
+            with self.subTest(series=series):
+                self.assertEqual(samples[series], expected)
+        self.assertNotIn(f'metadata_http_request_phase_seconds_count{{{route},phase="write"}}', samples)
+        self.assertIn('metadata_fragment_cache_bytes', samples)
+
+    def test_conditional_hits_only_have_a_parse_phase(self):
+        """Test that a 304 is observed as parsed but never dispatched or serialized."""
+        etag = dict(self.app.handle('GET', '/api/clients/2', {}).headers)['ETag']
+        response = self.app.handle('GET', '/api/clients/2', {'if-none-match': etag})
+        self.assertEqual(response.status, 304)
+        samples = self.scrape()
+
+        route = 'method="GET",route="/api/clients/{id}"'
+        test_cases = [
+            (f'metadata_http_requests_total{{{route},status="304"}}', 1),
+            (f'metadata_http_request_phase_seconds_count{{{route},phase="parse"}}', 2),
+            (f'metadata_http_request_phase_seconds_count{{{route},phase="dispatch"}}', 1),
+            (f'metadata_http_request_phase_seconds_count{{{route},phase="serialize"}}', 1),
+        ]
+        for series, expected in test_cases:
+            with self.subTest(series=series):
+                self.assertEqual(samples[series], expected)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that bucket counts never decrease and end at the total count."""
+        for _ in range(5):
+            self.app.handle('GET', '/api/tpps', {})
+        self.app.metrics.observe_write(('/api/tpps', 'GET'), 0.003)
+        self.app.metrics.observe_write(None, 1.0)
+        samples = self.scrape()
+        for phase, count in [('parse', 5), ('write', 1)]:
+            with self.subTest(phase=phase):
+                pattern = re.compile(r'metadata_http_request_phase_seconds_bucket\{method="GET",'
+                                     rf'route="/api/tpps",phase="{phase}",le="[^"]+"\}}')
+                buckets = [value for series, value in samples.items() if pattern.fullmatch(series)]
+                self.assertEqual(buckets, sorted(buckets))
+                self.assertEqual(buckets[-1], count)
+        self.assertEqual(samples['metadata_http_request_phase_seconds_bucket{method="GET",'
+                                 'route="/api/tpps",phase="write",le="0.0025"}'], 0)
+
+    def test_gauges_are_exposed_once_per_name(self):
+        """Test that servers sharing an application report one executor queue depth."""
+        servers = [ThreadingHTTPServer(('127.0.0.1', 0), SimpleHTTPRequestHandler, app=self.app)
+                   for _ in range(2)]
+        try:
+            exposition = self.app.handle('GET', METRICS_PATH, {}).body.decode()
+            self.assertEqual(self.scrape()['metadata_executor_queue_depth'], 0)
+        finally:
+            for server in servers:
+                server.server_close()
+                server.executor.shutdown()
+        self.assertEqual(exposition.count('# TYPE metadata_executor_queue_depth gauge'), 1)
+
+    def test_metrics_can_be_disabled(self):
+        """Test that an application without metrics records nothing and serves no endpoint."""
+        app = Application(metrics=False).start()
+        self.assertIsNone(app.metrics)
+        self.assertEqual(json.loads(app.handle('GET', '/api/clients/2', {}).body)['clientId'], '2')
+        self.assertEqual(app.handle('GET', METRICS_PATH, {}).status, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -75,17 +75,14 @@ class MockDataProducer:
     @staticmethod
     def generate_tpp_org_relationships(tpps: list, orgs: list, count: int = 3) -> list:
         """Generate mock TPP-Org relationships."""
-        relationships = []
-        for i in range(min(count, len(tpps), len(orgs))):
-            tpp = Tpp.from_dict(tpps[i])
-            org = Org.from_dict(orgs[i])
-            relationship = TppOrg(
-                org=org,
-                tpp=tpp,
-                tpp_org_id=f"TPP_ORG_{i+1}"
-            )
-            relationships.append(relationship.to_dict())
-        return relationships
+        return [
+            TppOrg(
+                tpp_org_id=f"TPP_ORG_{i+1}",
+                tpp_id=tpps[i]['tppId'],
+                org_id=orgs[i]['orgId']
+            ).to_dict()
+            for i in range(min(count, len(tpps), len(orgs)))
+        ]
 
     @staticmethod
     def generate_env_data() -> list:
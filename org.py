@@ -1,6 +1,10 @@
+from schema import Field, compile_schema
+
 class Org:
     """Entity class representing an Organization."""
 
+    __slots__ = ('org_id', 'customer_id_type_code', 'org_name', 'org_desc', 'status')
+
     def __init__(self, org_id: str, customer_id_type_code: str,
                  org_name: str, org_desc: str, status: str):
         """Initialize a new Organization instance."""
@@ -30,3 +34,13 @@ class Org:
             org_desc=data.get('orgDesc', ''),
             status=data.get('status', '')
         )
+
+    # Schema of request bodies, compiled once into validate_fields
+    SCHEMA = {
+        'orgId': Field(str),
+        'customerIdTypeCode': Field(str, required=False),
+        'orgName': Field(str),
+        'orgDesc': Field(str, required=False),
+        'status': Field(str, required=False)
+    }
+    validate_fields = staticmethod(compile_schema('Org', SCHEMA))
@@ -0,0 +1,222 @@
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import threading
+from multiprocessing.connection import wait
+from app import Response
+
+# How long a worker waits for the supervisor to answer a forwarded write
+FORWARD_TIMEOUT = 30
+
+
+class WorkerChannel:
+    """Worker side of the pipe to the supervisor.
+
+    Writes are forwarded to the supervisor, which owns all mutations. A
+    reader thread applies the mutations the supervisor replicates and hands
+    forwarded responses back to the waiting request threads. The supervisor
+    replicates a write before answering it, so a worker has applied its own
+    write by the time the response arrives.
+    """
+
+    def __init__(self, conn, cache_storage):
+        """
+        Initialize the channel and start its reader thread.
+
+        Args:
+            conn: This worker's end of the supervisor pipe
+            cache_storage: The cache storage replicated mutations are applied to
+        """
+        self.conn = conn
+        self.cache_storage = cache_storage
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._request_ids = itertools.count()
+        threading.Thread(target=self._read_loop, name='replication', daemon=True).start()
+
+    def forward(self, method: str, path: str, headers: dict, body: bytes) -> Response:
+        """Send a write request to the supervisor and wait for its response."""
+        request_id = next(self._request_ids)
+        done = threading.Event()
+        self._pending[request_id] = [done, None]
+        with self._send_lock:
+            self.conn.send(('write', request_id, method, path, headers, body))
+
+        if not done.wait(FORWARD_TIMEOUT):
+            self._pending.pop(request_id, None)
+            message = "Write owner unavailable"
+            return Response(503, json.dumps({"error": message}).encode(), error=message)
+        status, body, headers, error = self._pending.pop(request_id)[1]
+        return Response(status, body, headers, error)
+
+    def _read_loop(self):
+        """Apply replicated mutations and deliver forwarded responses in order."""
+        try:
+            while True:
+                message = self.conn.recv()
+                if message[0] == 'apply':
+                    for mutation in message[1]:
+                        self.cache_storage.apply_mutation(*mutation)
+                elif message[0] == 'response':
+                    pending = self._pending.get(message[1])
+                    if pending is not None:
+                        pending[1] = message[2:]
+                        pending[0].set()
+        except (EOFError, OSError):
+            # The supervisor is gone; without a write owner the worker must stop
+            os._exit(1)
+
+
+class PreforkSupervisor:
+    """Runs N worker processes on one port and owns all writes.
+
+    Workers bind the port with SO_REUSEPORT so the kernel spreads
+    connections across them and serve reads from their own copy of the
+    cache. Writes are forwarded to the supervisor, applied once to its
+    cache and replicated to every worker in the same order, so all copies
+    converge. Crashed workers are restarted from the supervisor's current
+    state.
+    """
+
+    def __init__(self, app, host: str = '', port: int = 8000, workers: int = None,
+                 engine: str = 'threaded'):
+        """
+        Initialize the supervisor.
+
+        Args:
+            app: The started Application that applies writes
+            host: Interface to bind to
+            port: Port to listen on
+            workers: Number of worker processes (default: CPU count)
+            engine: Server engine each worker runs, as in run_server
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.worker_count = workers or os.cpu_count() or 1
+        self.engine = engine
+        self._context = multiprocessing.get_context('fork')
+        self._workers = {}
+        self._mutations = []
+        self._running = False
+
+    def serve_forever(self):
+        """Start the workers and serve their write requests until stopped."""
+        self._running = True
+        signal.signal(signal.SIGTERM, self._handle_sigterm)
+        self.app.cache_storage.add_listener(self._record_mutation)
+        for slot in range(self.worker_count):
+            self._spawn(slot)
+
+        try:
+            while self._running:
+                conns = [conn for _, conn in self._workers.values()]
+                sentinels = {process.sentinel: slot for slot, (process, _) in self._workers.items()}
+                for ready in wait(conns + list(sentinels), timeout=1):
+                    if not self._running:
+                        break
+                    if ready in sentinels:
+                        self._restart(sentinels[ready])
+                    else:
+                        self._serve_write(ready)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            self.app.cache_storage.remove_listener(self._record_mutation)
+
+    def _handle_sigterm(self, signum, frame):
+        """Leave the serve loop; workers are terminated on the way out."""
+        self._running = False
+
+    def stop(self):
+        """Stop serving and terminate all workers."""
+        self._running = False
+        for process, conn in self._workers.values():
+            if process.is_alive():
+                process.terminate()
+            process.join(timeout=5)
+            conn.close()
+        self._workers = {}
+
+    def _spawn(self, slot: int):
+        """Fork a worker that inherits the supervisor's current cache."""
+        parent_conn, child_conn = self._context.Pipe()
+        sibling_conns = [conn for _, conn in self._workers.values()]
+        process = self._context.Process(
+            target=self._worker_main, args=(child_conn, sibling_conns),
+            name=f'worker-{slot}', daemon=True
+        )
+        # Background compactions and WAL snapshots write under the cache locks; holding
+        # them all, the child never inherits a half-applied write or a lock held by a
+        # thread it does not have
+        with self.app.cache_storage.locked():
+            process.start()
+        child_conn.close()
+        self._workers[slot] = (process, parent_conn)
+
+    def _restart(self, slot: int):
+        """Replace a worker that exited."""
+        process, conn = self._workers.pop(slot)
+        conn.close()
+        process.join()
+        if self._running:
+            print(f'Worker {slot} exited with code {process.exitcode}, restarting')
+            self._spawn(slot)
+
+    def _record_mutation(self, operation, cache_type, *args):
+        """Collect mutations applied while serving a write."""
+        self._mutations.append((operation, cache_type) + args)
+
+    def _serve_write(self, conn):
+        """Apply one forwarded write and replicate its mutations before answering."""
+        try:
+            _, request_id, method, path, headers, body = conn.recv()
+        except (EOFError, OSError):
+            # The worker died; its sentinel triggers the restart
+            return
+
+        self._mutations = []
+        response = self.app.handle(method, path, headers, body)
+        if response.chunks is not None:
+            response.body = b''.join(response.chunks)
+        if self._mutations:
+            for _, worker_conn in self._workers.values():
+                self._send(worker_conn, ('apply', self._mutations))
+        self._send(conn, ('response', request_id, response.status, response.body,
+                          response.headers, response.error))
+
+    def _send(self, conn, message):
+        """Send to a worker, ignoring workers that are shutting down."""
+        try:
+            conn.send(message)
+        except (BrokenPipeError, OSError):
+            pass
+
+    def _worker_main(self, conn, sibling_conns):
+        """Entry point of a worker process."""
+        # Forked inside locked(): replace the locks held on the parent's behalf
+        self.app.cache_storage.after_fork()
+        for sibling_conn in sibling_conns:
+            sibling_conn.close()
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self.app.cache_storage.remove_listener(self._record_mutation)
+        if self.app.wal is not None:
+            # Only the supervisor, which applies every write, logs them
+            self.app.wal.detach()
+            self.app.wal = None
+        self.app.write_forwarder = WorkerChannel(conn, self.app.cache_storage).forward
+        self._serve_worker()
+
+    def _serve_worker(self):
+        """Serve requests on the shared port until the worker is terminated."""
+        if self.engine == 'asyncio':
+            from async_server import run_async_server
+            run_async_server(self.app, self.host, self.port, reuse_port=True)
+        else:
+            from server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+            httpd = ThreadingHTTPServer((self.host, self.port), SimpleHTTPRequestHandler,
+                                        app=self.app, reuse_port=True)
+            httpd.serve_forever()
@@ -0,0 +1,122 @@
+import json
+import os
+import signal
+import threading
+import unittest
+from app import Application
+from prefork import PreforkSupervisor
+from services import CacheStorage
+
+# Seconds to wait for a worker to answer before failing
+TIMEOUT = 10
+
+
+class CommandSupervisor(PreforkSupervisor):
+    """Supervisor whose workers answer requests sent over a pipe, so each worker can be addressed."""
+
+    def __init__(self, app, workers: int):
+        super().__init__(app, workers=workers)
+        # Slot -> supervisor end of the command pipe of its current worker
+        self.commands = {}
+        self._command_conn = None
+
+    def _spawn(self, slot: int):
+        commands, self._command_conn = self._context.Pipe()
+        super()._spawn(slot)
+        self._command_conn.close()
+        self.commands[slot] = commands
+
+    def _serve_worker(self):
+        while True:
+            method, path, body = self._command_conn.recv()
+            response = self.app.handle(method, path, {}, body)
+            self._command_conn.send((response.status, response.body, os.getpid()))
+
+
+class TestPreforkSupervisor(unittest.TestCase):
+    """Test cases for forwarded writes, their replication and worker restarts."""
+
+    def setUp(self):
+        """Start an application over a freshly loaded cache."""
+        CacheStorage.reset_cache()
+        self.supervisor = CommandSupervisor(Application().start(), workers=2)
+
+    def tearDown(self):
+        """Leave a clean cache for other test modules."""
+        CacheStorage.reset_cache()
+
+    def request(self, slot, method, path, body=None):
+        """Have one worker handle a request and return (status, decoded body, worker PID)."""
+        commands = self.supervisor.commands[slot]
+        commands.send((method, path, body))
+        self.assertTrue(commands.poll(TIMEOUT), f"worker {slot} did not answer")
+        status, body, pid = commands.recv()
+        return status, json.loads(body), pid
+
+    def serve(self, driver):
+        """Run the supervisor in this thread while driver() talks to its workers."""
+        errors = []
+
+        def drive():
+            try:
+                driver()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                self.supervisor._running = False
+
+        sigterm = signal.getsignal(signal.SIGTERM)
+        thread = threading.Thread(target=drive)
+        thread.start()
+        try:
+            self.supervisor.serve_forever()
+        finally:
+            thread.join()
+            signal.signal(signal.SIGTERM, sigterm)
+        if errors:
+            raise errors[0]
+
+    def test_forwarded_writes_reach_every_worker(self):
+        """Test that a write sent to one worker is applied once and visible in the other, and
+        in a restarted worker, even when a cache lock was held as the workers were forked."""
+        lock = CacheStorage._cache['client'].lock
+        held = threading.Event()
+
+        def hold_lock():
+            # Stands in for a compaction or WAL snapshot running while workers are forked
+            with lock:
+                held.set()
+                threading.Event().wait(0.3)
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        held.wait()
+
+        def driver():
+            holder.join()
+            while len(self.supervisor.commands) < 2:
+                threading.Event().wait(0.05)
+            status, client, writer_pid = self.request(0, 'PATCH', '/api/clients/3',
+                                                      b'{"clientName": "Forwarded"}')
+            self.assertEqual((status, client['clientName']), (200, 'Forwarded'))
+            status, client, reader_pid = self.request(1, 'GET', '/api/clients/3')
+            self.assertEqual((status, client['clientName']), (200, 'Forwarded'))
+            self.assertNotEqual(writer_pid, reader_pid)
+            self.assertEqual(CacheStorage.get_from_cache('3', 'client')['clientName'], 'Forwarded')
+
+            commands = self.supervisor.commands[1]
+            self.supervisor._workers[1][0].terminate()
+            while self.supervisor.commands[1] is commands:
+                threading.Event().wait(0.05)
+            status, client, restarted_pid = self.request(1, 'GET', '/api/clients/3')
+            self.assertEqual(client['clientName'], 'Forwarded')
+            self.assertNotEqual(restarted_pid, reader_pid)
+
+            status, _, _ = self.request(1, 'DELETE', '/api/clients/4')
+            self.assertEqual(status, 200)
+            self.assertEqual(self.request(0, 'GET', '/api/clients/4')[1], None)
+
+        self.serve(driver)
+
+if __name__ == '__main__':
+    unittest.main()
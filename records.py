@@ -0,0 +1,133 @@
+import sys
+import threading
+from operator import attrgetter
+from typing import Any, Dict, Tuple
+
+# Record types are generated per field layout; past this, records are stored as dicts
+MAX_RECORD_TYPES = 256
+# Distinct values pooled per field before the field is treated as high-cardinality
+POOL_LIMIT = 4096
+
+
+class FrozenList(tuple):
+    """Immutable, shareable form of a list of strings; read back as a new list."""
+
+    __slots__ = ()
+
+
+class Record:
+    """Compact stored form of a record: one slot per field instead of a dict.
+
+    Subclasses are generated per field layout by record_type(), so field
+    names live once on the class and a record holds only its values.
+    Records are immutable and never leave the collection: readers get a
+    new dict from to_dict().
+    """
+
+    __slots__ = ()
+    # Set on generated subclasses
+    _fields = ()
+    _slots = {}
+    _list_fields = ()
+    _values = staticmethod(lambda record: ())
+
+    def get(self, field: str, default: Any = None) -> Any:
+        """Return the stored value of a field, or default."""
+        slot = self._slots.get(field)
+        return slot.__get__(self) if slot is not None else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the record as a new dict."""
+        values = dict(zip(self._fields, self._values(self)))
+        for field in self._list_fields:
+            values[field] = list(values[field])
+        return values
+
+
+_record_types = {}
+_record_types_lock = threading.Lock()
+
+
+def record_type(fields: Tuple[str, ...], list_fields: Tuple[str, ...]):
+    """
+    Return the Record subclass for a field layout, generating it on first use.
+
+    Args:
+        fields: Field names in order
+        list_fields: Fields holding a FrozenList
+
+    Returns:
+        The class, or None once MAX_RECORD_TYPES classes exist
+    """
+    layout = (fields, list_fields)
+    cls = _record_types.get(layout)
+    if cls is not None:
+        return cls
+    with _record_types_lock:
+        cls = _record_types.get(layout)
+        if cls is None and len(_record_types) < MAX_RECORD_TYPES:
+            slot_names = tuple(f'_{position}' for position in range(len(fields)))
+            cls = type('Record', (Record,), {'__slots__': slot_names})
+            cls._fields = tuple(sys.intern(field) for field in fields)
+            cls._slots = {field: getattr(cls, name) for field, name in zip(cls._fields, slot_names)}
+            cls._list_fields = list_fields
+            if len(slot_names) == 1:
+                getter = attrgetter(slot_names[0])
+                cls._values = staticmethod(lambda record: (getter(record),))
+            elif slot_names:
+                cls._values = staticmethod(attrgetter(*slot_names))
+            _record_types[layout] = cls
+        return cls
+
+
+class RecordEncoder:
+    """Turns dicts into Records, sharing one object per repeated field value.
+
+    Strings and lists of strings are dictionary-encoded per field: each
+    distinct value is kept once in a pool and every record refers to it,
+    which costs one reference per record, the same as an integer code
+    would. A field whose distinct values pass POOL_LIMIT is no longer
+    pooled. Callers serialize calls, e.g. under the owning collection's lock.
+    """
+
+    def __init__(self):
+        # Field -> {value: shared value}, or None for high-cardinality fields
+        self._pools = {}
+
+    def encode(self, item: Dict[str, Any]):
+        """Return a Record with the items of a dict, or a copy of the dict if no type is left."""
+        values = tuple(self._pooled(field, value) for field, value in item.items())
+        list_fields = tuple(field for field, value in zip(item, values) if type(value) is FrozenList)
+        cls = record_type(tuple(item), list_fields)
+        if cls is None:
+            return dict(item)
+        record = object.__new__(cls)
+        for field, value in zip(cls._fields, values):
+            cls._slots[field].__set__(record, value)
+        return record
+
+    def _pooled(self, field: str, value: Any) -> Any:
+        """Return the shared copy of a value, pooling it if the field is low-cardinality."""
+        if type(value) is str:
+            key = value
+        elif type(value) is list and all(type(element) is str for element in value):
+            key = FrozenList(value)
+        else:
+            return value
+
+        pool = self._pools.get(field, {})
+        if pool is None:
+            return key
+        shared = pool.get(key)
+        if shared is None:
+            if len(pool) >= POOL_LIMIT:
+                self._pools[field] = None
+                return key
+            shared = pool[key] = key
+            self._pools[field] = pool
+        return shared
+
+
+def materialize(item) -> Dict[str, Any]:
+    """Return a new dict with the items of a stored Record or dict."""
+    return item.to_dict() if isinstance(item, Record) else dict(item)
@@ -2,21 +2,45 @@ from client_service import ClientService
 from tpp_service import TppService
 from services import CacheStorage
 
+class _RouteNode:
+    """Node of the per-method route trie, one level per path segment."""
+
+    __slots__ = ('static', 'param', 'route')
+
+    def __init__(self):
+        self.static = {}
+        self.param = None
+        self.route = None
+
+
 class Router:
     """Router class to handle request dispatching."""
 
-    def __init__(self):
-        """Initialize router with route mappings."""
+    def __init__(self, wire_services: bool = True):
+        """
+        Initialize router with route mappings.
+
+        Args:
+            wire_services: Initialize the service DAOs while registering routes;
+                disable when the application has already wired them
+        """
+        self._wire_services = wire_services
         self._routes = {}
+        # Cache type read by each GET route, used for conditional requests
+        self._resources = {}
+        # GET routes returning every record of their resource when called without a query
+        self._listings = set()
         self._register_client_routes()
         self._register_tpp_routes()
         self._register_other_routes()
+        self._compile_routes()
 
     def _register_client_routes(self):
         """Register all client routes from decorated methods dynamically."""
         registered_routes = {}
         client_service = ClientService()
-        client_service.initialize_dao(CacheStorage)
+        if self._wire_services:
+            client_service.initialize_dao(CacheStorage)
         
         # Scan all methods in ClientService class
         for method_name in dir(ClientService):
@@ -34,6 +58,11 @@ class Router:
                     required_params = ['clientIds']
 
                 registered_routes[route_key] = (method, required_params)
+                if method._route_method == 'GET':
+                    resource = method._route_resource or client_service._dao.cache_type
+                    self._resources[route_key] = resource
+                    if method._route_listing:
+                        self._listings.add(route_key)
 
         if not registered_routes:
             raise ValueError("No routes found in ClientService class")
@@ -44,7 +73,8 @@ class Router:
         """Register all TPP routes from decorated methods dynamically."""
         registered_routes = {}
         tpp_service = TppService()
-        tpp_service.initialize_dao(CacheStorage)
+        if self._wire_services:
+            tpp_service.initialize_dao(CacheStorage)
         
         # Scan all methods in TppService class
         for method_name in dir(TppService):
@@ -62,6 +92,11 @@ class Router:
                     required_params = ['tppIds']
 
                 registered_routes[route_key] = (method, required_params)
+                if method._route_method == 'GET':
+                    resource = method._route_resource or tpp_service._dao.cache_type
+                    self._resources[route_key] = resource
+                    if method._route_listing:
+                        self._listings.add(route_key)
 
         if not registered_routes:
             raise ValueError("No routes found in TppService class")
@@ -71,15 +106,6 @@ class Router:
     def _register_other_routes(self):
         """Register non-client routes."""
         other_routes = {
-            # TPP routes
-            ('/api/tpps', 'GET'): (
-                lambda: CacheStorage.get_tpp_data(), 
-                []
-            ),
-            ('/api/tpps/{id}', 'GET'): (
-                lambda id: CacheStorage.get_tpp_by_id(id), 
-                ['id']
-            ),
             # Other routes
             ('/api/scopes', 'GET'): (
                 lambda: CacheStorage.get_scope_data(), 
@@ -93,12 +119,97 @@ class Router:
                 lambda: CacheStorage.get_tpp_org_data(), 
                 []
             ),
+            ('/api/orgs/{id}/tpps', 'GET'): (
+                lambda id: CacheStorage.get_tpps_of_org(id),
+                ['id']
+            ),
             ('/api/environment', 'GET'): (
                 lambda: CacheStorage.get_env_data(), 
                 []
             )
         }
         self._routes.update(other_routes)
+        self._resources.update({
+            ('/api/scopes', 'GET'): 'scope',
+            ('/api/orgs', 'GET'): 'org',
+            # The embedded view changes with the links, TPPs and orgs
+            ('/api/tpp_orgs', 'GET'): ('tppOrg', 'tpp', 'org'),
+            ('/api/orgs/{id}/tpps', 'GET'): ('tppOrg', 'tpp'),
+            ('/api/environment', 'GET'): 'env',
+        })
+        self._listings.update({('/api/scopes', 'GET'), ('/api/orgs', 'GET'), ('/api/environment', 'GET')})
+
+    def add_route(self, path: str, method: str, handler, required_params: list,
+                  resource: str = None, listing: bool = False) -> None:
+        """
+        Register a single route and add it to the compiled trie.
+
+        Args:
+            path: URL path pattern
+            method: HTTP method
+            handler: Callable receiving the route parameters as keywords
+            required_params: Parameters the handler requires
+            resource: Cache type the route reads, or a tuple of the cache
+                types it joins, enabling conditional GETs; a '/{id}' route
+                with a single cache type reads the record with that ID
+            listing: Whether the route returns every record of its single
+                cache type when called without query parameters, so the
+                application may serialize them from the stored records instead
+        """
+        self._routes[(path, method)] = (handler, required_params)
+        if resource is not None:
+            self._resources[(path, method)] = resource
+        if listing:
+            self._listings.add((path, method))
+        self._insert_route(path, method)
+
+    def resource_of(self, route_key: tuple):
+        """Return the cache type, or tuple of cache types, a route reads, or None."""
+        return self._resources.get(route_key)
+
+    def listing_of(self, route_key: tuple):
+        """Return the cache type a route lists in full when called without a query, or None."""
+        return self._resources.get(route_key) if route_key in self._listings else None
+
+    def _compile_routes(self):
+        """Compile all registered routes into one segment trie per method."""
+        self._trie = {}
+        for route_path, route_method in self._routes:
+            self._insert_route(route_path, route_method)
+
+    def _insert_route(self, route_path: str, route_method: str):
+        """Insert a route pattern into the trie of its method."""
+        node = self._trie.setdefault(route_method, _RouteNode())
+        param_names = []
+        for segment in route_path.split('/'):
+            if segment.startswith('{') and segment.endswith('}'):
+                param_names.append(segment[1:-1])
+                if node.param is None:
+                    node.param = _RouteNode()
+                node = node.param
+            else:
+                node = node.static.setdefault(segment, _RouteNode())
+        node.route = ((route_path, route_method), param_names)
+
+    def _match_route(self, node: _RouteNode, segments: list, index: int, values: list):
+        """Walk the trie preferring static segments over parameters."""
+        if index == len(segments):
+            return node.route
+
+        child = node.static.get(segments[index])
+        if child is not None:
+            route = self._match_route(child, segments, index + 1, values)
+            if route is not None:
+                return route
+
+        if node.param is not None:
+            values.append(segments[index])
+            route = self._match_route(node.param, segments, index + 1, values)
+            if route is not None:
+                return route
+            values.pop()
+
+        return None
 
     def extract_path_params(self, route_path: str, actual_path: str) -> tuple[bool, dict]:
         """
@@ -137,7 +248,7 @@ class Router:
         Args:
             path: The request path
             method: The HTTP method
-            **kwargs: Additional parameters (data, id, etc.)
+            **kwargs: Additional parameters (data, query, etc.)
             
         Returns:
             dict: The response data
@@ -145,24 +256,32 @@ class Router:
         Raises:
             ValueError: If route not found or invalid parameters
         """
-        # Find matching route
-        route_match = None
-        route_params = {}
-
-        for (route_path, route_method), (handler, required_params) in self._routes.items():
-            if method != route_method:
-                continue
-
-            # Check if route matches and extract parameters
-            matches, params = self.extract_path_params(route_path, path)
-            if matches:
-                route_match = (route_path, route_method)
-                route_params = params
-                break
-
-        if not route_match:
+        route_match, route_params = self.match(path, method)
+        return self.invoke(route_match, route_params, **kwargs)
+
+    def match(self, path: str, method: str) -> tuple:
+        """
+        Find the route for a request.
+
+        Returns:
+            tuple: The (route_path, method) key and the extracted path parameters
+
+        Raises:
+            ValueError: If route not found
+        """
+        # Find matching route with a single walk over the path segments
+        root = self._trie.get(method)
+        values = []
+        route = self._match_route(root, path.split('/'), 0, values) if root else None
+
+        if not route:
             raise ValueError(f"Route not found: {method} {path}")
 
+        route_match, param_names = route
+        return route_match, dict(zip(param_names, values))
+
+    def invoke(self, route_match: tuple, route_params: dict, **kwargs):
+        """Call the handler of a matched route with its collected parameters."""
         handler, required_params = self._routes[route_match]
 
         # Validate and collect parameters
@@ -173,5 +292,11 @@ class Router:
             elif kwargs['data']:
                 handler_params['data'] = kwargs['data']
 
+        # Pass through the query parameters the handler declared
+        query = kwargs.get('query') or {}
+        for param in getattr(handler, '_route_query', ()):
+            if param in query:
+                handler_params[param] = query[param]
+
         # Call handler with collected parameters
         return handler(**handler_params)
@@ -1,5 +1,7 @@
+import json
 import unittest
 from unittest.mock import MagicMock
+from app import Application
 from router import Router
 from services import CacheStorage
 
@@ -29,6 +31,29 @@ class TestRouter(unittest.TestCase):
                 self.assertEqual(matches, exp_match)
                 self.assertEqual(params, exp_params)
 
+    def test_compiled_route_matching(self):
+        """Test that the route trie prefers static segments and backtracks."""
+        self.router.add_route('/api/{resource}/{id}', 'GET',
+                              lambda resource, id: (resource, id), ['resource', 'id'])
+        self.router.add_route('/api/{resource}/{id}/static', 'GET',
+                              lambda resource, id: ('static', resource, id), ['resource', 'id'])
+        self.router.add_route('/api/clients/{id}/details', 'GET',
+                              lambda id: ('details', id), ['id'])
+
+        test_cases = [
+            ('/api/clients/1', dict),
+            ('/api/users/7', ('users', '7')),
+            ('/api/clients/5/details', ('details', '5')),
+            ('/api/clients/5/static', ('static', 'clients', '5')),
+        ]
+        for path, expected in test_cases:
+            with self.subTest(path=path):
+                result = self.router.dispatch(path, 'GET')
+                if isinstance(expected, type):
+                    self.assertIsInstance(result, expected)
+                else:
+                    self.assertEqual(result, expected)
+
     def test_dispatch_get_requests(self):
         """Test dispatching GET requests."""
         test_cases = [
@@ -44,6 +69,25 @@ class TestRouter(unittest.TestCase):
                 result = self.router.dispatch(path, 'GET')
                 self.assertIsInstance(result, expected_type)
 
+    def test_paginated_collection_requests(self):
+        """Test that limit and cursor query parameters page through collections."""
+        app = Application()
+        app.router = self.router
+
+        seen = []
+        path = '/api/clients?limit=4'
+        while path:
+            response = app.handle('GET', path, {})
+            self.assertEqual(response.status, 200)
+            page = json.loads(response.body)
+            self.assertLessEqual(len(page['items']), 4)
+            seen.extend(item['clientId'] for item in page['items'])
+            path = page['nextCursor'] and f"/api/clients?limit=4&cursor={page['nextCursor']}"
+        self.assertEqual(seen, [item['clientId'] for item in CacheStorage.get_items('client')])
+
+        self.assertIsInstance(self.router.dispatch('/api/tpps', 'GET', query={'limit': '2'}), dict)
+        self.assertEqual(app.handle('GET', '/api/clients?limit=0', {}).status, 400)
+
     def test_dispatch_post_requests(self):
         """Test dispatching POST requests."""
         client_data = {
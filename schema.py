@@ -0,0 +1,109 @@
+from typing import Any, Callable, Dict, Sequence
+
+# Marks a field absent from the validated data
+_MISSING = object()
+
+# Names of list element types in messages
+_PLURALS = {str: 'strings', int: 'integers', bool: 'booleans', dict: 'objects'}
+
+
+class ValidationError(ValueError):
+    """Raised when data does not match an entity schema, listing every problem found."""
+
+    def __init__(self, errors: Sequence[str]):
+        super().__init__('; '.join(errors))
+        self.errors = list(errors)
+
+
+class Field:
+    """Declaration of one field of an entity schema."""
+
+    __slots__ = ('type', 'required', 'items', 'choices')
+
+    def __init__(self, type: type, required: bool = True, items: type = None,
+                 choices: Sequence[Any] = None):
+        """
+        Declare a field.
+
+        Args:
+            type: Type the value must be an instance of
+            required: Whether the field must be present in full (non-partial) data
+            items: Type every element of a list value must be an instance of
+            choices: Values the field is restricted to
+        """
+        self.type = type
+        self.required = required
+        self.items = items
+        self.choices = tuple(choices) if choices is not None else None
+
+
+def _error(errors, message: str) -> list:
+    """Append a message to the errors of a validation, creating the list on the first one."""
+    if errors is None:
+        errors = []
+    errors.append(message)
+    return errors
+
+
+def compile_schema(name: str, fields: Dict[str, Field]) -> Callable[..., None]:
+    """
+    Compile a schema into a validator function specialized to its fields.
+
+    The validator is generated as straight-line code with one branch per
+    field, its types and messages bound as constants, so valid data costs
+    one dict lookup and one isinstance() per field. Every field is checked
+    before raising, so one ValidationError reports all problems of the data.
+
+    Args:
+        name: Entity name, used in messages
+        fields: Field name -> Field, in the order problems are reported
+
+    Returns:
+        validate(data, partial=False), raising ValidationError; with partial
+        set, absent fields are not reported, e.g. for PATCH bodies
+    """
+    namespace = {'_MISSING': _MISSING, '_error': _error, 'ValidationError': ValidationError}
+    lines = [
+        'def validate(data, partial=False):',
+        '    if not isinstance(data, dict):',
+        f'        raise ValidationError([{f"{name} must be an object"!r}])',
+        '    errors = None',
+    ]
+    for position, (field, spec) in enumerate(fields.items()):
+        type_name = f'_type_{position}'
+        namespace[type_name] = spec.type
+        lines += [
+            f'    value = data.get({field!r}, _MISSING)',
+            '    if value is _MISSING:',
+            (f'        if not partial: errors = _error(errors, {f"Missing required field: {field}"!r})'
+             if spec.required else '        pass'),
+            f'    elif not isinstance(value, {type_name}):',
+            f'        errors = _error(errors, '
+            f'{f"Invalid type for {field}: expected {spec.type.__name__}"!r})',
+        ]
+        if spec.items is not None:
+            items_name = f'_items_{position}'
+            namespace[items_name] = spec.items
+            lines += [
+                f'    elif not all(isinstance(element, {items_name}) for element in value):',
+                f'        errors = _error(errors, '
+                f'{f"All {field} must be {_PLURALS.get(spec.items, spec.items.__name__)}"!r})',
+            ]
+        if spec.choices is not None:
+            choices_name = f'_choices_{position}'
+            namespace[choices_name] = frozenset(spec.choices)
+            expected = ', '.join(str(choice) for choice in spec.choices)
+            lines += [
+                f'    elif value not in {choices_name}:',
+                f'        errors = _error(errors, '
+                f'{f"Invalid value for {field}: expected one of {expected}"!r})',
+            ]
+    lines += [
+        '    if errors is not None:',
+        '        raise ValidationError(errors)',
+    ]
+    exec(compile('\n'.join(lines), f'<{name} validator>', 'exec'), namespace)
+    validate = namespace['validate']
+    validate.__qualname__ = f'{name}.validate_fields'
+    validate.__doc__ = f"Validate {name} data fields; with partial set, only those present in data."
+    return validate
@@ -0,0 +1,68 @@
+import unittest
+from boa_env import BoaEnv
+from client import Client
+from mock_data import MockDataProducer
+from org import Org
+from schema import Field, ValidationError, compile_schema
+from scope import Scope
+from tpp import Tpp
+
+class TestCompiledSchema(unittest.TestCase):
+    """Test cases for validators compiled from entity schemas."""
+
+    def setUp(self):
+        """Compile a schema covering every kind of check."""
+        self.validate = compile_schema('Thing', {
+            'id': Field(str),
+            'tags': Field(list, items=str),
+            'kind': Field(str, required=False, choices=('a', 'b')),
+        })
+
+    def test_reports_every_error(self):
+        """Test that one ValidationError lists all problems, in schema order."""
+        test_cases = [
+            # (data, expected errors)
+            ({'id': '1', 'tags': ['x']}, None),
+            ({'id': '1', 'tags': [], 'kind': 'b', 'extra': 1}, None),
+            ({}, ['Missing required field: id', 'Missing required field: tags']),
+            ({'id': 1, 'tags': 'x', 'kind': 'c'},
+             ['Invalid type for id: expected str', 'Invalid type for tags: expected list',
+              'Invalid value for kind: expected one of a, b']),
+            ({'id': '1', 'tags': ['x', 2]}, ['All tags must be strings']),
+            ([], ['Thing must be an object']),
+        ]
+        for data, expected in test_cases:
+            with self.subTest(data=data):
+                if expected is None:
+                    self.assertIsNone(self.validate(data))
+                    continue
+                with self.assertRaises(ValidationError) as context:
+                    self.validate(data)
+                self.assertEqual(context.exception.errors, expected)
+                self.assertEqual(str(context.exception), '; '.join(expected))
+
+    def test_partial_data(self):
+        """Test that partial validation skips absent fields but checks present ones."""
+        self.assertIsNone(self.validate({}, partial=True))
+        with self.assertRaises(ValidationError) as context:
+            self.validate({'kind': 'c'}, partial=True)
+        self.assertEqual(context.exception.errors, ['Invalid value for kind: expected one of a, b'])
+
+    def test_entity_schemas_accept_mock_data(self):
+        """Test that every entity validator accepts the records it is generated with."""
+        test_cases = [
+            (Client, MockDataProducer.generate_clients()),
+            (Tpp, MockDataProducer.generate_tpps()),
+            (Org, MockDataProducer.generate_orgs()),
+            (Scope, MockDataProducer.generate_scopes()),
+            (BoaEnv, MockDataProducer.generate_env_data()),
+        ]
+        for entity_class, items in test_cases:
+            with self.subTest(entity=entity_class.__name__):
+                for item in items:
+                    entity_class.validate_fields(item)
+        with self.assertRaises(ValueError):
+            Tpp.validate_fields({'tppId': 'TPP9', 'tppName': 'New', 'status': 'bogus'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
+from schema import Field, compile_schema
+
 class Scope:
     """Entity class representing a Scope."""
 
+    __slots__ = ('scope_name', 'mapping_url', 'scope_desc')
+
     def __init__(self, scope_name: str, mapping_url: str, scope_desc: str):
         """Initialize a new Scope instance."""
         self.scope_name = scope_name
@@ -23,3 +27,11 @@ class Scope:
             mapping_url=data.get('mappingUrl', ''),
             scope_desc=data.get('scopeDesc', '')
         )
+
+    # Schema of request bodies, compiled once into validate_fields
+    SCHEMA = {
+        'scopeName': Field(str),
+        'mappingUrl': Field(str, required=False),
+        'scopeDesc': Field(str, required=False)
+    }
+    validate_fields = staticmethod(compile_schema('Scope', SCHEMA))
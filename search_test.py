@@ -0,0 +1,85 @@
+import json
+import unittest
+from app import Application
+from search import SearchIndex
+from services import CacheStorage
+
+class TestSearchIndex(unittest.TestCase):
+    """Test cases for prefix and trigram search over cached names and descriptions."""
+
+    def setUp(self):
+        """Index a freshly loaded cache with a few extra clients."""
+        CacheStorage.reset_cache()
+        CacheStorage.initialize_cache()
+        self.index = SearchIndex(CacheStorage)
+        for client_id, name, desc in [('a', 'Acme Payments', 'payments hub'),
+                                      ('b', 'Acme', 'short name'),
+                                      ('c', 'Zeta', 'acme reseller')]:
+            self.add_client(client_id, clientName=name, clientDesc=desc)
+
+    def tearDown(self):
+        """Stop indexing and leave a clean cache for other test modules."""
+        self.index.close()
+        CacheStorage.reset_cache()
+
+    def add_client(self, client_id, **fields):
+        """Add a client built from the default client 2."""
+        CacheStorage.add_to_cache(dict(CacheStorage.get_from_cache('2', 'client'),
+                                       clientId=client_id, **fields), 'client')
+
+    def test_prefix_matches_are_ranked(self):
+        """Test that name matches come first, shorter names first, then descriptions."""
+        test_cases = [
+            # (query, expected keys)
+            ('acme', [('client', 'b'), ('client', 'a'), ('client', 'c')]),
+            ('ACM', [('client', 'b'), ('client', 'a'), ('client', 'c')]),
+            ('acme pay', [('client', 'a')]),
+            ('organization 3', [('org', 'ORG3')]),
+            ('test tpp 4', [('tpp', 'TPP4')]),
+            ('missing', []),
+            ('', []),
+        ]
+        for query, expected in test_cases:
+            with self.subTest(query=query):
+                self.assertEqual(self.index.find(query), expected)
+
+    def test_substring_matches_follow_prefix_matches(self):
+        """Test that trigram matches inside words fill the slots after prefix matches."""
+        self.add_client('d', clientName='Megacme', clientDesc='')
+        self.assertEqual(self.index.find('acme')[-1], ('client', 'd'))
+        self.assertEqual(self.index.find('ayment'), [('client', 'a')])
+        self.assertEqual(self.index.find('acme', limit=2), [('client', 'b'), ('client', 'a')])
+        self.assertEqual(self.index.find('acme', cache_types=['org']), [])
+
+    def test_index_follows_mutations(self):
+        """Test that updates, renames, deletes and reloads are reflected in results."""
+        CacheStorage.update_cache('b', dict(CacheStorage.get_from_cache('b', 'client'),
+                                            clientId='renamed', clientName='Omega'), 'client')
+        CacheStorage.delete_from_cache('c', 'client')
+        self.assertEqual(self.index.find('acme'), [('client', 'a')])
+        self.assertEqual(self.index.find('omega'), [('client', 'renamed')])
+        self.assertEqual([rank[2:] for rank in self.index._prefixes['acm']], [('client', 'a')])
+
+        CacheStorage.reset_cache()
+        CacheStorage.initialize_cache()
+        self.assertEqual(self.index.find('omega'), [])
+        self.assertEqual(self.index.find('acme'), [])
+        self.assertEqual(len(self.index.find('robinshood', limit=100)), 15)
+
+    def test_search_route(self):
+        """Test /api/search results, limits and parameter validation."""
+        app = Application().start()
+        response = app.handle('GET', '/api/search?q=acme&limit=2', {})
+        results = json.loads(response.body)
+        self.assertEqual([(result['type'], result['item']['clientId']) for result in results],
+                         [('client', 'b'), ('client', 'a')])
+        self.assertEqual(results[0]['item'], CacheStorage.get_from_cache('b', 'client'))
+
+        response = app.handle('GET', '/api/search?q=test%20tpp&type=tpp,org', {})
+        self.assertEqual(len(json.loads(response.body)), 5)
+        for query in ['', 'q=acme&limit=0', 'q=acme&limit=x', 'q=acme&type=bogus', 'q=acme&type=scope']:
+            with self.subTest(query=query):
+                self.assertEqual(app.handle('GET', f'/api/search?{query}', {}).status, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,35 +1,33 @@
-import json
+import argparse
+import threading
+import time
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from socketserver import ThreadingMixIn
 from concurrent.futures import ThreadPoolExecutor
-from router import Router
+from app import Application
 
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
     """A simple HTTP request handler with GET and POST functionality."""
     
-    def __init__(self, *args, **kwargs):
-        self.router = Router()
-        super().__init__(*args, **kwargs)
+    def __init__(self, request, client_address, server):
+        # Routes, DAOs and cache are built once by the server's application
+        self.app = server.app
+        super().__init__(request, client_address, server)
 
     def handle_request(self, method):
         """Handle HTTP requests."""
-        try:
-            data = None
-            if method in ['POST', 'PATCH', 'DELETE']:
-                content_length = self.headers.get('Content-Length')
-                if content_length:
-                    content_length = int(content_length)
-                    request_data = self.rfile.read(content_length)
-                    data = json.loads(request_data.decode('utf-8'))
-            
-            response_data = self.router.dispatch(self.path, method, data=data)
-            self.attach_headers(response_data)
-        except json.JSONDecodeError:
-            self.send_error(400, "Invalid JSON format")
-        except ValueError as e:
-            self.send_error(400 if method != 'GET' else 404, str(e))
-        except Exception as e:
-            self.send_error(500, f"Internal server error: {str(e)}")
+        body = None
+        if method in ['POST', 'PATCH', 'DELETE']:
+            content_length = self.headers.get('Content-Length')
+            if content_length:
+                body = self.rfile.read(int(content_length))
+
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        response = self.app.handle(method, self.path, headers, body)
+        start = time.perf_counter()
+        self.write_response(response)
+        if self.app.metrics is not None:
+            self.app.metrics.observe_write(response.route, time.perf_counter() - start)
 
     def do_GET(self):
         """Handle GET requests."""
@@ -49,48 +47,126 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
 
     def do_OPTIONS(self):
         """Handle OPTIONS requests for CORS preflight."""
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Content-Length', '0')
-        self.add_cors_headers()
+        self.handle_request('OPTIONS')
+
+    def write_response(self, response):
+        """
+        Send an application response with explicit Content-Length framing.
+
+        Streamed responses have no length up front; HTTP/1.0 has no chunked
+        coding, so they are written as they are produced and delimited by
+        closing the connection.
+        """
+        if response.error is not None:
+            self.send_error(response.status, response.error)
+            return
+
+        self.send_response(response.status)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        if response.chunks is not None:
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for chunk in response.chunks:
+                self.wfile.write(chunk)
+            self.close_connection = True
+            return
+        if response.status != 304:
+            self.send_header("Content-Length", str(len(response.body)))
         self.end_headers()
-
-    def attach_headers(self, data):
-        """Attach headers and send JSON response."""
-        self.send_response(200)
-        self.send_header("Content-Type", "application/json")
-        self.add_cors_headers()
-        self.end_headers()
-        if hasattr(data, 'to_dict'):
-            data = data.to_dict()
-        self.wfile.write(json.dumps(data).encode())
-
-    def add_cors_headers(self):
-        """Add CORS headers to the response."""
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, DELETE, PATCH, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
-        self.send_header("Access-Control-Max-Age", "3600")
+        self.wfile.write(response.body)
 
 
 class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
     """Handle requests in a separate thread."""
-    def __init__(self, server_address, RequestHandlerClass, bind_and_activate=True):
+    def __init__(self, server_address, RequestHandlerClass, bind_and_activate=True, app=None,
+                 reuse_port=False):
+        # SO_REUSEPORT lets pre-fork workers bind the same port
+        self.allow_reuse_port = reuse_port
         super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+        self.app = app or Application().start()
         self.executor = ThreadPoolExecutor(max_workers=10)  # Adjust the number of workers as needed
+        # Connections submitted to the executor that no worker thread picked up yet
+        self._queued = 0
+        self._queued_lock = threading.Lock()
+        if self.app.metrics is not None:
+            # The latest server built on the application reports its backlog
+            self.app.metrics.add_gauge('metadata_executor_queue_depth',
+                                       'Connections waiting for a worker thread.',
+                                       lambda: self._queued)
 
     def process_request(self, request, client_address):
         """Start a new thread to process the request."""
-        self.executor.submit(self.process_request_thread, request, client_address)
-
+        with self._queued_lock:
+            self._queued += 1
+        self.executor.submit(self._process_queued, request, client_address)
+
+    def _process_queued(self, request, client_address):
+        """Process a connection once a worker thread picks it up."""
+        with self._queued_lock:
+            self._queued -= 1
+        self.process_request_thread(request, client_address)
+
+
+ENGINES = ('threaded', 'asyncio')
+
+
+def run_server(host='', port=8000, engine='threaded', workers=0, data_dir=None, database=None,
+               columnar=False, fragment_budget=None, metrics=True):
+    """
+    Start the HTTP server.
+
+    Args:
+        host: Interface to bind to
+        port: Port to listen on
+        engine: 'threaded' for the thread pool server, 'asyncio' for the
+            event loop server with HTTP/1.1 keep-alive and pipelining
+        workers: Number of pre-forked worker processes sharing the port;
+            0 serves from this process only
+        data_dir: Directory to log writes and snapshots to, so data survives
+            restarts; None keeps all data in memory only
+        database: SQLite database file to store clients and TPPs in
+        columnar: Filter clients and TPPs in NumPy columns (requires NumPy)
+        fragment_budget: Bytes of encoded records cached for list responses
+        metrics: Record request metrics and serve them at /api/_metrics
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Engine must be one of: {', '.join(ENGINES)}")
 
-def run_server(host='', port=8000):
-    """Start the HTTP server."""
     server_address = (host, port)
-    httpd = ThreadingHTTPServer(server_address, SimpleHTTPRequestHandler)
-    print(f'Serving at {host}:{port}')
-    httpd.serve_forever()
+    app = Application(data_dir=data_dir, database=database, columnar=columnar,
+                      fragment_budget=fragment_budget, metrics=metrics).start()
+    print(app.startup_report())
+    print(f'Serving at {host}:{port} ({engine})')
+    if workers:
+        from prefork import PreforkSupervisor
+        PreforkSupervisor(app, host, port, workers, engine).serve_forever()
+    elif engine == 'asyncio':
+        from async_server import run_async_server
+        run_async_server(app, host, port)
+    else:
+        httpd = ThreadingHTTPServer(server_address, SimpleHTTPRequestHandler, app=app)
+        httpd.serve_forever()
 
 
 if __name__ == '__main__':
-    run_server()
+    parser = argparse.ArgumentParser(description='Run the metadata backend server.')
+    parser.add_argument('--host', default='')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--engine', choices=ENGINES, default='threaded')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='pre-fork this many worker processes on the same port')
+    parser.add_argument('--data-dir', default=None,
+                        help='persist writes to a write-ahead log and snapshots in this directory')
+    parser.add_argument('--database', default=None,
+                        help='store clients and TPPs in this SQLite database file')
+    parser.add_argument('--columnar', action='store_true',
+                        help='filter clients and TPPs in NumPy columns (requires NumPy)')
+    parser.add_argument('--fragment-cache-mb', type=int, default=None,
+                        help='cap the encoded records cached for list responses (0 disables it)')
+    parser.add_argument('--no-metrics', action='store_true',
+                        help='do not record request metrics or serve /api/_metrics')
+    args = parser.parse_args()
+    fragment_budget = args.fragment_cache_mb * 1024 * 1024 if args.fragment_cache_mb is not None else None
+    run_server(args.host, args.port, args.engine, args.workers, args.data_dir, args.database,
+               args.columnar, fragment_budget, not args.no_metrics)
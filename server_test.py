@@ -0,0 +1,87 @@
+import http.client
+import json
+import threading
+import unittest
+from unittest.mock import patch
+from app import Application
+from router import Router
+from server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from services import CacheStorage
+
+class TestThreadingHTTPServer(unittest.TestCase):
+    """Test cases for the threaded server engine."""
+
+    def setUp(self):
+        """Start a server on an ephemeral port."""
+        CacheStorage.reset_cache()
+        self.app = Application().start()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SimpleHTTPRequestHandler, app=self.app)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        """Stop the server and leave a clean cache."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.server.executor.shutdown()
+        CacheStorage.reset_cache()
+
+    def get(self, path):
+        """Issue a GET request on a new connection and return (status, decoded body)."""
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=10)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def test_handlers_share_the_application(self):
+        """Test that every handler uses the application built at startup, without building routes."""
+        handlers = []
+        handle_request = SimpleHTTPRequestHandler.handle_request
+
+        def recording_handle_request(handler, method):
+            handlers.append(handler)
+            return handle_request(handler, method)
+
+        router = self.app.router
+        with patch.object(SimpleHTTPRequestHandler, 'handle_request', recording_handle_request), \
+                patch.object(Router, '__init__', side_effect=AssertionError("router rebuilt")), \
+                patch.object(Router, 'add_route', side_effect=AssertionError("route registered")), \
+                patch.object(Application, 'start', side_effect=AssertionError("app restarted")):
+            self.assertEqual(self.get('/api/clients/2'), (200, CacheStorage.get_from_cache('2', 'client')))
+            self.assertEqual(self.get('/api/scopes')[0], 200)
+
+        self.assertEqual(len(handlers), 2)
+        self.assertIsNot(handlers[0], handlers[1])
+        self.assertIs(handlers[0].app, self.app)
+        self.assertIs(handlers[1].app, self.app)
+        self.assertIs(self.app.router, router)
+
+    def test_queue_depth_counts_connections_waiting_for_a_thread(self):
+        """Test the executor backlog gauge while every worker thread is busy."""
+        started = threading.Semaphore(0)
+        release = threading.Event()
+        finished = threading.Semaphore(0)
+
+        def process_request_thread(request, client_address):
+            started.release()
+            release.wait(10)
+            finished.release()
+
+        depth = lambda: next(line for line in self.app.metrics.render().splitlines()
+                             if line.startswith('metadata_executor_queue_depth '))
+        self.server.process_request_thread = process_request_thread
+        for _ in range(self.server.executor._max_workers + 2):
+            self.server.process_request(None, None)
+        for _ in range(self.server.executor._max_workers):
+            self.assertTrue(started.acquire(timeout=10))
+        self.assertEqual(depth(), 'metadata_executor_queue_depth 2')
+        release.set()
+        for _ in range(self.server.executor._max_workers + 2):
+            self.assertTrue(finished.acquire(timeout=10))
+        self.assertEqual(depth(), 'metadata_executor_queue_depth 0')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,97 +1,370 @@
+import threading
+from contextlib import contextmanager
 from mock_data import MockDataProducer
+from collection import Collection
+from fragments import FragmentCache
+from joins import Join
+from tpp_org import TppOrg
+
+# Encoded JSON of cached records, shared by every collection under one budget
+_fragments = FragmentCache()
 
 class CacheStorage:
     """Class to manage all data operations through cache."""
     
+    # Primary key of every cached collection
+    _id_fields = {
+        'client': 'clientId',
+        'tpp': 'tppId',
+        'scope': 'scopeName',
+        'org': 'orgId',
+        'tppOrg': 'tppOrgId',
+        'env': 'id'  # Add env to cache
+    }
     _cache = {
-        'client': [],
-        'tpp': [],
-        'scope': [],
-        'org': [],
-        'tppOrg': [],
-        'env': []  # Add env to cache
+        cache_type: Collection(id_field, fragments=_fragments)
+        for cache_type, id_field in _id_fields.items()
     }
     _cache_initialized = False
+    _init_lock = threading.Lock()
+    # Callables notified of every mutation as (operation, cache_type, *args)
+    _listeners = []
+    # Embedded view of the TPP-Org links, built on first use
+    _tpp_org_join = None
 
     @classmethod
     def initialize_cache(cls):
         """Initialize the cache with default data."""
-        if not cls._cache_initialized:
+        with cls._init_lock:
+            if cls._cache_initialized:
+                return
             # Load all mock data at startup
-            cls._cache['client'] = MockDataProducer.generate_clients()
-            cls._cache['tpp'] = MockDataProducer.generate_tpps()
-            cls._cache['scope'] = MockDataProducer.generate_scopes()
-            cls._cache['org'] = MockDataProducer.generate_orgs()
-            cls._cache['env'] = MockDataProducer.generate_env_data()
+            cls._cache['client'].load(MockDataProducer.generate_clients())
+            cls._cache['tpp'].load(MockDataProducer.generate_tpps())
+            cls._cache['scope'].load(MockDataProducer.generate_scopes())
+            cls._cache['org'].load(MockDataProducer.generate_orgs())
+            cls._cache['env'].load(MockDataProducer.generate_env_data())
             # TPP-Org relationships need TPP and Org data
-            cls._cache['tppOrg'] = MockDataProducer.generate_tpp_org_relationships(
-                cls._cache['tpp'],
-                cls._cache['org']
-            )
+            cls._cache['tppOrg'].load(MockDataProducer.generate_tpp_org_relationships(
+                cls._cache['tpp'].items(),
+                cls._cache['org'].items()
+            ))
+            cls._cache_initialized = True
+
+    @classmethod
+    def reset_cache(cls):
+        """Drop all cached data so the next access reloads it."""
+        with cls._init_lock:
+            for collection in cls._cache.values():
+                collection.load([])
+            cls._cache_initialized = False
+
+    @classmethod
+    def restore(cls, collections):
+        """Load the cache from dumped item lists instead of the default data."""
+        with cls._init_lock:
+            for cache_type, items in collections.items():
+                if cache_type == 'tppOrg':
+                    # Snapshots taken before links were normalized embed the TPP and org
+                    items = [TppOrg.from_dict(item).to_dict() for item in items]
+                cls._cache[cache_type].load(items)
             cls._cache_initialized = True
 
+    @classmethod
+    def dump(cls):
+        """Return the items of every cache; hold locked() for a consistent cut."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return {cache_type: collection.items() for cache_type, collection in cls._cache.items()}
+
+    @classmethod
+    @contextmanager
+    def locked(cls):
+        """Hold the write lock of every cache, always acquired in the same order."""
+        acquired = []
+        try:
+            for collection in cls._cache.values():
+                collection.lock.acquire()
+                acquired.append(collection)
+            yield
+        finally:
+            for collection in reversed(acquired):
+                collection.lock.release()
+
+    @classmethod
+    def after_fork(cls):
+        """Make every cache usable in a child forked while holding locked()."""
+        for collection in cls._cache.values():
+            collection.after_fork()
+
+    @classmethod
+    def get_sizes(cls):
+        """Return the number of records in every cache."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return {cache_type: len(collection) for cache_type, collection in cls._cache.items()}
+
+    @classmethod
+    def set_fragment_budget(cls, budget):
+        """Cap the bytes of cached record encodings, evicting the least recently used."""
+        _fragments.resize(budget)
+
+    @classmethod
+    def get_fragment_stats(cls):
+        """Return the size, budget and hit counters of the cache of record encodings."""
+        return _fragments.stats()
+
+    @classmethod
+    def get_id_field(cls, cache_type):
+        """Return the primary key field of the specified cache."""
+        return cls._id_fields[cache_type]
+
+    @classmethod
+    def create_index(cls, cache_type, field):
+        """Maintain a secondary index on a field of the specified cache."""
+        cls._cache[cache_type].create_index(field)
+
+    @classmethod
+    def create_token_index(cls, cache_type, field):
+        """Maintain an inverted index on the whitespace-separated tokens of a field."""
+        cls._cache[cache_type].create_token_index(field)
+
+    @classmethod
+    def get_items(cls, cache_type):
+        """Return all items of the specified cache."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return cls._cache[cache_type].items()
+
+    @classmethod
+    def get_listing(cls, cache_type):
+        """Return all items of the specified cache as a Listing, serialized without copying them."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return cls._cache[cache_type].listing()
+
+    @classmethod
+    def get_version(cls, cache_type):
+        """Return the version of the specified cache, bumped on every mutation."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return cls._cache[cache_type].version
+
+    @classmethod
+    def get_item_version(cls, item_id, cache_type):
+        """Return the version of a single item, or None if not found."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return cls._cache[cache_type].item_version(item_id)
+
+    @classmethod
+    def get_page(cls, cache_type, limit, after=0):
+        """Return a page of items of the specified cache and the sequence to continue after."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return cls._cache[cache_type].page(limit, after)
+
+    @classmethod
+    def get_from_cache(cls, item_id, cache_type):
+        """Get a single item from the specified cache by its ID."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return cls._cache[cache_type].get(item_id)
+
+    @classmethod
+    def find_in_cache(cls, filter_params, cache_type):
+        """Get the items of the specified cache matching all filter parameters."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return cls._cache[cache_type].find(filter_params)
+
+    @classmethod
+    def find_tokens_in_cache(cls, field, tokens, cache_type, match_all=True):
+        """Get the items of the specified cache whose token-indexed field lists all (or any) tokens."""
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        return cls._cache[cache_type].find_tokens(field, tokens, match_all)
+
     @classmethod
     def add_to_cache(cls, item, cache_type):
         """Add a new item to the specified cache."""
-        cls._cache[cache_type].append(item)
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        collection = cls._cache[cache_type]
+        with collection.lock:
+            collection.add(item)
+            cls._notify('add', cache_type, item)
 
     @classmethod
     def update_cache(cls, item_id, updated_item, cache_type, id_field='clientId'):
         """Update an item in the specified cache."""
-        for i, item in enumerate(cls._cache[cache_type]):
-            if item[id_field] == item_id:
-                cls._cache[cache_type][i] = updated_item
-                return True
-        return False
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        collection = cls._cache[cache_type]
+        with collection.lock:
+            updated = collection.update(item_id, updated_item)
+            if updated:
+                cls._notify('update', cache_type, item_id, updated_item)
+        return updated
 
     @classmethod
     def delete_from_cache(cls, item_id, cache_type, id_field='clientId'):
         """Delete an item from the specified cache."""
-        for i, item in enumerate(cls._cache[cache_type]):
-            if item[id_field] == item_id:
-                del cls._cache[cache_type][i]
-                return True
-        return False
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        collection = cls._cache[cache_type]
+        with collection.lock:
+            deleted = collection.delete(item_id)
+            if deleted:
+                cls._notify('delete', cache_type, item_id)
+        return deleted
+
+    @classmethod
+    def add_batch(cls, items, cache_type):
+        """
+        Add new items to the specified cache under one lock.
+
+        Returns:
+            (added IDs, IDs that already existed), each in input order
+        """
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        collection = cls._cache[cache_type]
+        added_ids = []
+        failed_ids = []
+        with collection.lock:
+            for item in items:
+                item_id = item.get(collection.id_field)
+                if item_id in collection:
+                    failed_ids.append(item_id)
+                    continue
+                collection.add(item)
+                cls._notify('add', cache_type, item)
+                added_ids.append(item_id)
+        return added_ids, failed_ids
+
+    @classmethod
+    def upsert_batch(cls, items, cache_type):
+        """
+        Add items to the specified cache, replacing existing ones, under one lock.
+
+        Returns:
+            The IDs of the items, in input order
+        """
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        collection = cls._cache[cache_type]
+        item_ids = []
+        with collection.lock:
+            for item in items:
+                item_id = item.get(collection.id_field)
+                if collection.update(item_id, item):
+                    cls._notify('update', cache_type, item_id, item)
+                else:
+                    collection.add(item)
+                    cls._notify('add', cache_type, item)
+                item_ids.append(item_id)
+        return item_ids
+
+    @classmethod
+    def delete_batch(cls, item_ids, cache_type):
+        """
+        Delete items from the specified cache under one lock.
+
+        Returns:
+            (deleted IDs, IDs not found), each in input order
+        """
+        if not cls._cache_initialized:
+            cls.initialize_cache()
+        collection = cls._cache[cache_type]
+        deleted_ids = []
+        failed_ids = []
+        with collection.lock:
+            for item_id in item_ids:
+                if collection.delete(item_id):
+                    cls._notify('delete', cache_type, item_id)
+                    deleted_ids.append(item_id)
+                else:
+                    failed_ids.append(item_id)
+        return deleted_ids, failed_ids
+
+    @classmethod
+    def add_listener(cls, listener):
+        """Register a callable notified of every mutation."""
+        # Copied on write, so a listener removed during a notification does not skip another
+        cls._listeners = cls._listeners + [listener]
+
+    @classmethod
+    def remove_listener(cls, listener):
+        """Unregister a mutation listener."""
+        listeners = list(cls._listeners)
+        listeners.remove(listener)
+        cls._listeners = listeners
+
+    @classmethod
+    def _notify(cls, operation, cache_type, *args):
+        """Notify all listeners of a mutation, in the order mutations are applied."""
+        for listener in cls._listeners:
+            listener(operation, cache_type, *args)
+
+    @classmethod
+    def apply_mutation(cls, operation, cache_type, *args):
+        """Replay a mutation recorded by a listener, e.g. from another process."""
+        if operation == 'add':
+            cls.add_to_cache(*args, cache_type)
+        elif operation == 'update':
+            cls.update_cache(*args[:2], cache_type)
+        elif operation == 'delete':
+            cls.delete_from_cache(*args, cache_type)
+        else:
+            raise ValueError(f"Unknown cache operation: {operation}")
 
     # Remove delete_client_batch method as it's now in Client class
 
     @classmethod
     def get_env_data(cls):
         """Return environment data from cache."""
-        if not cls._cache_initialized:
-            cls.initialize_cache()
-        return cls._cache['env']
+        return cls.get_items('env')
 
     @classmethod
     def get_tpp_data(cls):
         """Return TPP data from cache."""
-        if not cls._cache_initialized:
-            cls.initialize_cache()
-        return cls._cache['tpp']
+        return cls.get_items('tpp')
 
     @classmethod
     def get_tpp_by_id(cls, tpp_id):
         """Get a single TPP by ID."""
-        tpps = cls.get_tpp_data()
-        return next((tpp for tpp in tpps if tpp['tppId'] == tpp_id), None)
+        return cls.get_from_cache(tpp_id, 'tpp')
 
     @classmethod
     def get_scope_data(cls):
         """Return scope data from cache."""
-        if not cls._cache_initialized:
-            cls.initialize_cache()
-        return cls._cache['scope']
+        return cls.get_items('scope')
 
     @classmethod
     def get_org_data(cls):
         """Return organization data from cache."""
-        if not cls._cache_initialized:
-            cls.initialize_cache()
-        return cls._cache['org']
+        return cls.get_items('org')
+
+    @classmethod
+    def tpp_org_join(cls):
+        """Return the join embedding the TPP and org of every TPP-Org link."""
+        if cls._tpp_org_join is None:
+            cls._tpp_org_join = Join(cls, 'tppOrg', 'tppOrgId',
+                                     [('org', 'orgId', 'org'), ('tpp', 'tppId', 'tpp')])
+        return cls._tpp_org_join
 
     @classmethod
     def get_tpp_org_data(cls):
-        """Return TPP-Organization relationship data from cache."""
-        if not cls._cache_initialized:
-            cls.initialize_cache()
-        return cls._cache['tppOrg']
+        """Return TPP-Organization relationships with the current TPP and org embedded."""
+        return cls.tpp_org_join().items()
+
+    @classmethod
+    def get_tpps_of_org(cls, org_id):
+        """Return the TPPs linked to an organization, found through the orgId index of the links."""
+        tpps = {}
+        for link in cls.tpp_org_join().find('orgId', org_id):
+            tpp = link['tpp']
+            if tpp is not None:
+                tpps.setdefault(tpp['tppId'], tpp)
+        return list(tpps.values())
@@ -0,0 +1,45 @@
+import json
+from typing import Iterable, Iterator
+
+# List responses with at least this many elements are streamed instead of buffered
+STREAM_MIN_ITEMS = 500
+# Serialized elements are flushed once the pending buffer reaches this size
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(items: Iterable, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Serialize a list element by element into bounded chunks.
+
+    The concatenated chunks are byte-for-byte what json.dumps(list(items))
+    would produce, but at most about chunk_size bytes (plus one element)
+    are held in memory at a time, besides encodings already cached.
+    """
+    if hasattr(items, 'json_fragments'):
+        # Cached collection listings come with their elements already encoded
+        fragments = items.json_fragments()
+    else:
+        fragments = (json.dumps(item.to_dict() if hasattr(item, 'to_dict') else item).encode()
+                     for item in items)
+    pending = [b'[']
+    pending_size = 1
+    separator = b''
+    for fragment in fragments:
+        encoded = separator + fragment
+        separator = b', '
+        pending.append(encoded)
+        pending_size += len(encoded)
+        if pending_size >= chunk_size:
+            yield b''.join(pending)
+            pending = []
+            pending_size = 0
+    pending.append(b']')
+    yield b''.join(pending)
+
+
+def frame_chunk(chunk: bytes) -> bytes:
+    """Frame one chunk for Transfer-Encoding: chunked."""
+    return b'%x\r\n%s\r\n' % (len(chunk), chunk)
+
+
+LAST_CHUNK = b'0\r\n\r\n'
@@ -1,4 +1,5 @@
 from enum import Enum
+from schema import Field, compile_schema
 
 class Status(Enum):
     ACTIVE = "active"
@@ -7,6 +8,9 @@ class Status(Enum):
 class Tpp:
     """Entity class representing a Third Party Provider (TPP)."""
 
+    __slots__ = ('tpp_id', 'tpp_name', 'tpp_type', 'verified_client', 'scope_name_list',
+                 'tpp_desc', 'contact_name', 'contact_email', 'status')
+
     def __init__(self, tpp_id: str, tpp_name: str, tpp_type: str,
                  verified_client: str, scope_name_list: str, tpp_desc: str,
                  contact_name: str, contact_email: str, status: Status = Status.ACTIVE):
@@ -49,3 +53,49 @@ class Tpp:
             contact_email=data.get('contactEmail', ''),
             status=Status(data.get('status', 'active'))
         )
+
+    # Stored fields and their defaults, in to_dict() order
+    _DEFAULTS = {
+        'tppId': '',
+        'tppName': '',
+        'tppType': '',
+        'verifiedClient': '',
+        'scopeNameList': '',
+        'tppDesc': '',
+        'contactName': '',
+        'contactEmail': '',
+        'status': 'active'
+    }
+
+    @classmethod
+    def to_record(cls, data: dict, partial: bool = False) -> dict:
+        """
+        Return the stored form of TPP data, as from_dict(data).to_dict() would.
+
+        With partial set, return only the known fields present in data, to
+        apply as changes to a stored record.
+
+        Raises:
+            ValueError: If the status is not a Status value
+        """
+        if partial:
+            record = {field: data[field] for field in cls._DEFAULTS if field in data}
+        else:
+            record = {field: data.get(field, default) for field, default in cls._DEFAULTS.items()}
+        if 'status' in record:
+            record['status'] = Status(record['status']).value
+        return record
+
+    # Schema of request bodies, compiled once into validate_fields
+    SCHEMA = {
+        'tppId': Field(str),
+        'tppName': Field(str),
+        'tppType': Field(str, required=False),
+        'verifiedClient': Field(str, required=False),
+        'scopeNameList': Field(str, required=False),
+        'tppDesc': Field(str, required=False),
+        'contactName': Field(str, required=False),
+        'contactEmail': Field(str, required=False),
+        'status': Field(str, required=False, choices=[status.value for status in Status])
+    }
+    validate_fields = staticmethod(compile_schema('Tpp', SCHEMA))
@@ -1,28 +1,31 @@
-from tpp import Tpp
-from org import Org
-
 class TppOrg:
-    """Entity class representing a TPP-Organization relationship."""
+    """Entity class representing a TPP-Organization relationship.
+
+    Only the IDs of the TPP and the organization are stored; the embedded
+    view served by /api/tpp_orgs is joined from the current records.
+    """
+
+    __slots__ = ('tpp_org_id', 'tpp_id', 'org_id')
 
-    def __init__(self, org: Org, tpp: Tpp, tpp_org_id: str):
+    def __init__(self, tpp_org_id: str, tpp_id: str, org_id: str):
         """Initialize a new TPP-Organization relationship instance."""
-        self.org = org
-        self.tpp = tpp
         self.tpp_org_id = tpp_org_id
+        self.tpp_id = tpp_id
+        self.org_id = org_id
 
     def to_dict(self) -> dict:
         """Convert TppOrg instance to dictionary."""
         return {
-            'org': self.org.to_dict(),
-            'tpp': self.tpp.to_dict(),
-            'tppOrgId': self.tpp_org_id
+            'tppOrgId': self.tpp_org_id,
+            'tppId': self.tpp_id,
+            'orgId': self.org_id
         }
 
     @classmethod
     def from_dict(cls, data: dict) -> 'TppOrg':
-        """Create TppOrg instance from dictionary."""
+        """Create TppOrg instance from dictionary, also accepting the embedded form."""
         return cls(
-            org=Org.from_dict(data.get('org', {})),
-            tpp=Tpp.from_dict(data.get('tpp', {})),
-            tpp_org_id=data.get('tppOrgId', '')
+            tpp_org_id=data.get('tppOrgId', ''),
+            tpp_id=data.get('tppId', (data.get('tpp') or {}).get('tppId', '')),
+            org_id=data.get('orgId', (data.get('org') or {}).get('orgId', ''))
         )
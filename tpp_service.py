@@ -6,20 +6,24 @@ class TppService(BaseService):
     """Service class for handling TPP operations."""
 
     @classmethod
-    def initialize_dao(cls, cache_storage):
+    def initialize_dao(cls, cache_storage, database=None, columnar=False):
         """Initialize the TPP DAO."""
-        super().initialize_dao(cache_storage, 'tpp', 'tppId')
+        super().initialize_dao(cache_storage, 'tpp', 'tppId',
+                                 indexed_fields=('tppType', 'status'), database=database,
+                                 columnar=columnar, token_fields=('scopeNameList',))
 
     @classmethod
     @routing('/api/tpps', 'POST')
-    def create(cls, data: dict) -> Tpp:
+    def create(cls, data: dict) -> dict:
         """Create a new TPP instance."""
+        Tpp.validate_fields(data)
         return super().create(data, Tpp)
 
     @classmethod
     @routing('/api/tpps/{id}', 'PATCH')
-    def update(cls, id: str, data: dict) -> Tpp:
-        """Update an existing TPP instance."""
+    def update(cls, id: str, data: dict) -> dict:
+        """Update the fields of an existing TPP given in data."""
+        Tpp.validate_fields(data, partial=True)
         return super().update(id, data, Tpp)
 
     @classmethod
@@ -36,10 +40,35 @@ class TppService(BaseService):
         return super().delete_batch(tpp_ids)
 
     @classmethod
-    @routing('/api/tpps', 'GET')
-    def get_all(cls) -> list:
-        """Return all TPPs."""
-        return super().get_all()
+    @routing('/api/tppsBatch', 'POST')
+    def create_batch(cls, data: dict) -> dict:
+        """Create multiple TPPs."""
+        return super().create_batch(data.get('tpps', []), Tpp, Tpp.validate_fields)
+
+    @classmethod
+    @routing('/api/tppsBatch', 'PATCH')
+    def upsert_batch(cls, data: dict) -> dict:
+        """Create multiple TPPs, replacing those whose ID exists."""
+        return super().upsert_batch(data.get('tpps', []), Tpp, Tpp.validate_fields)
+
+    @classmethod
+    @routing('/api/tpps', 'GET', query=('limit', 'cursor'), listing=True)
+    def get_all(cls, limit: str = None, cursor: str = None):
+        """Return all TPPs, or one page of them."""
+        return super().get_all(limit, cursor)
+
+    @classmethod
+    @routing('/api/scopes/{name}/tpps', 'GET', query=('match',), resource=('tpp',))
+    def get_by_scopes(cls, name: str, match: str = 'all') -> list:
+        """
+        Get the TPPs granted a scope, through the inverted scope index.
+
+        Several scopes may be given separated by commas; TPPs must have all
+        of them, or any of them with match=any.
+        """
+        if match not in ('all', 'any'):
+            raise ValueError(f"Invalid match: {match}")
+        return cls._dao.find_by_tokens('scopeNameList', name.split(','), match == 'all')
 
     @classmethod
     @routing('/api/tpps/{id}', 'GET')
@@ -0,0 +1,272 @@
+import json
+import os
+import threading
+import zlib
+
+# Take a snapshot once this many records were logged since the last one
+SNAPSHOT_EVERY = 10000
+
+SNAPSHOT_PREFIX = 'snapshot-'
+SEGMENT_PREFIX = 'wal-'
+
+
+def _file_name(prefix: str, lsn: int, suffix: str) -> str:
+    """Name a snapshot or log segment so that names sort by LSN."""
+    return f'{prefix}{lsn:020d}{suffix}'
+
+
+def _lsn_of(name: str, prefix: str) -> int:
+    """Return the LSN encoded in a snapshot or log segment name."""
+    return int(name[len(prefix):].partition('.')[0])
+
+
+def encode_record(lsn: int, operation: str, cache_type: str, args: tuple) -> bytes:
+    """Frame one mutation as a checksummed JSON line."""
+    payload = json.dumps({'lsn': lsn, 'op': operation, 'type': cache_type, 'args': list(args)})
+    return b'%08x %s\n' % (zlib.crc32(payload.encode()), payload.encode())
+
+
+def decode_record(line: bytes):
+    """
+    Parse one framed mutation.
+
+    Returns:
+        The record dict, or None if the line is torn or corrupt
+    """
+    checksum, _, payload = line.rstrip(b'\n').partition(b' ')
+    if not line.endswith(b'\n') or len(checksum) != 8:
+        return None
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+class WriteAheadLog:
+    """Append-only log of CacheStorage mutations with periodic snapshots.
+
+    Mutations are framed into an in-memory buffer by a CacheStorage listener,
+    which runs under the collection lock, so log order is apply order. Writers
+    then call commit() to wait until their last mutation is on disk. Commits
+    use group commit: the first waiter writes and fsyncs everything buffered
+    so far while later waiters queue up behind it, so concurrent writers
+    share one fsync.
+
+    Every SNAPSHOT_EVERY records a compacted snapshot of all collections is
+    written in the background and new records go to a fresh log segment;
+    older segments and snapshots are then deleted, so recovery loads the
+    newest snapshot and replays only the segment tail written after it.
+    """
+
+    def __init__(self, directory: str, cache_storage, snapshot_every: int = SNAPSHOT_EVERY):
+        """
+        Initialize a log over a data directory; call recover() before use.
+
+        Args:
+            directory: Directory holding the snapshots and log segments
+            cache_storage: The cache storage whose mutations are logged
+            snapshot_every: Records between snapshots
+        """
+        self.directory = directory
+        self.cache_storage = cache_storage
+        self.snapshot_every = snapshot_every
+        self._cond = threading.Condition()
+        # Framed records not yet written
+        self._buffer = []
+        # Last LSN appended and last LSN fsynced
+        self._lsn = 0
+        self._durable_lsn = 0
+        self._flushing = False
+        self._error = None
+        self._file = None
+        self._segment_lsn = 0
+        self._snapshot_lsn = 0
+        self._snapshotting = False
+        self._local = threading.local()
+
+    def recover(self) -> int:
+        """
+        Rebuild the cache from the newest snapshot and the log tail, then start logging.
+
+        An empty directory is seeded with the default data, which is
+        snapshotted before anything is logged. A torn record at the end of
+        the last segment (a crash mid-write) is truncated away.
+
+        Returns:
+            The number of log records replayed
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        snapshots = self._list(SNAPSHOT_PREFIX, '.json')
+        if snapshots:
+            with open(os.path.join(self.directory, snapshots[-1]), 'rb') as f:
+                snapshot = json.load(f)
+            self.cache_storage.restore(snapshot['collections'])
+            self._snapshot_lsn = self._lsn = snapshot['lsn']
+        else:
+            self.cache_storage.initialize_cache()
+            self._write_snapshot(0, self.cache_storage.dump())
+
+        replayed = 0
+        segments = self._list(SEGMENT_PREFIX, '.log')
+        for position, name in enumerate(segments):
+            is_last = position == len(segments) - 1
+            replayed += self._replay(os.path.join(self.directory, name), is_last)
+
+        self._durable_lsn = self._lsn
+        self._open_segment(self._lsn + 1)
+        self.cache_storage.add_listener(self.append)
+        return replayed
+
+    def _replay(self, path: str, is_last: bool) -> int:
+        """Apply the records of one segment newer than the loaded state."""
+        replayed = 0
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                record = decode_record(line)
+                if record is None:
+                    if not is_last:
+                        raise ValueError(f"Corrupt write-ahead log segment: {path}")
+                    break
+                offset += len(line)
+                if record['lsn'] <= self._lsn:
+                    continue
+                self.cache_storage.apply_mutation(record['op'], record['type'], *record['args'])
+                self._lsn = record['lsn']
+                replayed += 1
+        if offset != os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+                os.fsync(f.fileno())
+        return replayed
+
+    def append(self, operation: str, cache_type: str, *args) -> None:
+        """CacheStorage listener: buffer a mutation for the next group commit."""
+        with self._cond:
+            self._lsn += 1
+            self._buffer.append(encode_record(self._lsn, operation, cache_type, args))
+            self._local.lsn = self._lsn
+
+    def commit(self) -> None:
+        """
+        Wait until every mutation made by the calling thread is durable.
+
+        Raises:
+            OSError: If the log could not be written
+        """
+        lsn = getattr(self._local, 'lsn', 0)
+        self._wait_durable(lsn)
+        if lsn - self._snapshot_lsn >= self.snapshot_every:
+            self._start_snapshot()
+
+    def _wait_durable(self, lsn: int) -> None:
+        """Flush the buffer as the group leader, or wait for the leader's flush."""
+        with self._cond:
+            while self._durable_lsn < lsn:
+                if self._error is not None:
+                    raise OSError("Write-ahead log unavailable") from self._error
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+
+                self._flushing = True
+                batch, self._buffer = self._buffer, []
+                target = self._lsn
+                self._cond.release()
+                try:
+                    self._file.write(b''.join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError as e:
+                    self._error = e
+                    raise
+                finally:
+                    self._cond.acquire()
+                    self._flushing = False
+                    self._cond.notify_all()
+                self._durable_lsn = target
+
+    def _start_snapshot(self) -> None:
+        """Take a snapshot in the background unless one is already running."""
+        with self._cond:
+            if self._snapshotting:
+                return
+            self._snapshotting = True
+        threading.Thread(target=self.snapshot, name='wal-snapshot', daemon=True).start()
+
+    def snapshot(self) -> int:
+        """
+        Write a snapshot of all collections and drop the log it covers.
+
+        Writers are paused only while the buffered records are flushed and
+        the log switches to a new segment; the snapshot file itself is
+        written from the immutable per-version item lists afterwards.
+
+        Returns:
+            The LSN the snapshot covers
+        """
+        try:
+            with self.cache_storage.locked():
+                lsn = self._lsn
+                self._wait_durable(lsn)
+                with self._cond:
+                    self._open_segment(lsn + 1)
+                collections = self.cache_storage.dump()
+            self._write_snapshot(lsn, collections)
+            self._snapshot_lsn = lsn
+            for name in self._list(SEGMENT_PREFIX, '.log'):
+                if _lsn_of(name, SEGMENT_PREFIX) < self._segment_lsn:
+                    os.remove(os.path.join(self.directory, name))
+            for name in self._list(SNAPSHOT_PREFIX, '.json'):
+                if _lsn_of(name, SNAPSHOT_PREFIX) < lsn:
+                    os.remove(os.path.join(self.directory, name))
+            return lsn
+        finally:
+            self._snapshotting = False
+
+    def _write_snapshot(self, lsn: int, collections: dict) -> None:
+        """Atomically write a snapshot file."""
+        path = os.path.join(self.directory, _file_name(SNAPSHOT_PREFIX, lsn, '.json'))
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'lsn': lsn, 'collections': collections}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        self._fsync_directory()
+
+    def _open_segment(self, first_lsn: int) -> None:
+        """Direct new records to a segment starting at the given LSN."""
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(self.directory, _file_name(SEGMENT_PREFIX, first_lsn, '.log'))
+        self._file = open(path, 'ab')
+        self._segment_lsn = first_lsn
+        self._fsync_directory()
+
+    def _fsync_directory(self) -> None:
+        """Make file creations and renames in the data directory durable."""
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _list(self, prefix: str, suffix: str) -> list:
+        """Return the snapshot or segment file names, oldest first."""
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith(prefix) and name.endswith(suffix))
+
+    def detach(self) -> None:
+        """Stop logging, e.g. in a forked worker that must not write the parent's log."""
+        if self._file is None:
+            return
+        self.cache_storage.remove_listener(self.append)
+        self._file.close()
+        self._file = None
+
+    def close(self) -> None:
+        """Flush buffered records and stop logging."""
+        self._wait_durable(self._lsn)
+        self.detach()
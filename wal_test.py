@@ -0,0 +1,131 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from app import Application
+from services import CacheStorage
+import wal
+
+class TestWriteAheadLog(unittest.TestCase):
+    """Test cases for write-ahead logging, group commit and recovery."""
+
+    def setUp(self):
+        """Use a fresh data directory and cache."""
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.apps = []
+        CacheStorage.reset_cache()
+
+    def tearDown(self):
+        """Stop logging and leave a clean cache for other test modules."""
+        for app in self.apps:
+            if app.wal is not None:
+                app.wal.detach()
+        CacheStorage.reset_cache()
+        self.data_dir.cleanup()
+
+    def restart(self):
+        """Drop the in-memory state and start a new application over the data directory."""
+        for app in self.apps:
+            if app.wal is not None:
+                app.wal.detach()
+        CacheStorage.reset_cache()
+        app = Application(data_dir=self.data_dir.name).start()
+        self.apps.append(app)
+        return app
+
+    def post_client(self, app, client_id):
+        """Create a client through the application."""
+        client = dict(CacheStorage.get_from_cache('2', 'client'), clientId=client_id)
+        response = app.handle('POST', '/api/clients', {}, json.dumps(client).encode())
+        self.assertEqual(response.status, 200)
+
+    def files(self, prefix):
+        """Return the data directory files with the given prefix."""
+        return sorted(name for name in os.listdir(self.data_dir.name) if name.startswith(prefix))
+
+    def test_writes_survive_restart(self):
+        """Test that created, updated and deleted records are recovered after a restart."""
+        app = self.restart()
+        self.post_client(app, 'durable')
+        client = dict(CacheStorage.get_from_cache('3', 'client'), clientName='Renamed')
+        app.handle('PATCH', '/api/clients/3', {}, json.dumps(client).encode())
+        app.handle('DELETE', '/api/clients/1', {})
+        expected = list(CacheStorage.get_items('client'))
+
+        self.restart()
+        self.assertEqual(CacheStorage.get_items('client'), expected)
+        self.assertEqual(CacheStorage.get_from_cache('3', 'client')['clientName'], 'Renamed')
+        self.assertIsNone(CacheStorage.get_from_cache('1', 'client'))
+
+    def test_snapshot_compacts_log(self):
+        """Test that snapshots drop covered segments and recovery replays only the tail."""
+        app = self.restart()
+        for i in range(5):
+            self.post_client(app, f'c{i}')
+        self.assertEqual(app.wal.snapshot(), 5)
+        self.post_client(app, 'tail')
+
+        self.assertEqual(self.files('snapshot-'), [wal._file_name('snapshot-', 5, '.json')])
+        self.assertEqual(self.files('wal-'), [wal._file_name('wal-', 6, '.log')])
+        expected = list(CacheStorage.get_items('client'))
+
+        app = self.restart()
+        self.assertEqual(CacheStorage.get_items('client'), expected)
+        self.assertEqual(app.startup_timings.keys(), {'dao_wiring', 'recovery', 'route_compilation'})
+        self.assertEqual(app.wal._lsn, 6)
+
+    def test_background_snapshot_threshold(self):
+        """Test that commits past the threshold trigger a snapshot."""
+        app = self.restart()
+        app.wal.snapshot_every = 3
+        for i in range(3):
+            self.post_client(app, f'c{i}')
+        deadline = time.monotonic() + 5
+        while app.wal._snapshot_lsn != 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(app.wal._snapshot_lsn, 3)
+
+    def test_torn_tail_is_truncated(self):
+        """Test that a partially written last record is discarded on recovery."""
+        app = self.restart()
+        self.post_client(app, 'kept')
+        segment = os.path.join(self.data_dir.name, self.files('wal-')[-1])
+        size = os.path.getsize(segment)
+        with open(segment, 'ab') as f:
+            f.write(wal.encode_record(2, 'delete', 'client', ('kept',))[:-10])
+
+        app = self.restart()
+        self.assertIsNotNone(CacheStorage.get_from_cache('kept', 'client'))
+        self.assertEqual(os.path.getsize(segment), size)
+        self.post_client(app, 'after')
+        self.restart()
+        self.assertIsNotNone(CacheStorage.get_from_cache('after', 'client'))
+
+    def test_group_commit_shares_fsyncs(self):
+        """Test that concurrent writers are made durable by fewer fsyncs than writes."""
+        app = self.restart()
+        fsyncs = []
+        real_fsync = os.fsync
+
+        def slow_fsync(fd):
+            fsyncs.append(fd)
+            time.sleep(0.01)
+            real_fsync(fd)
+
+        with patch.object(wal.os, 'fsync', slow_fsync):
+            threads = [threading.Thread(target=self.post_client, args=(app, f'g{i}'))
+                       for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertLess(len(fsyncs), 20)
+        self.restart()
+        self.assertTrue(all(CacheStorage.get_from_cache(f'g{i}', 'client') for i in range(20)))
+
+if __name__ == '__main__':
+    unittest.main()